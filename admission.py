@@ -0,0 +1,170 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+
+from metrics import ADMISSION_IN_USE, ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+# Capacities are in cost units per worker process. Heavy work (audio/video DSP, PDF
+# rasterization) is CPU bound, so its pool should roughly match the cores per worker
+ADMISSION_HEAVY_CAPACITY = int(os.getenv("ADMISSION_HEAVY_CAPACITY", "2"))
+ADMISSION_LIGHT_CAPACITY = int(os.getenv("ADMISSION_LIGHT_CAPACITY", "16"))
+# Requests waiting for a saturated pool, beyond this they are rejected straight away
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "8"))
+# Seconds a request may wait in the queue before it is rejected
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "15"))
+
+AUDIO_EXTENSIONS = ['mp3', 'wav', 'ogg', 'm4a', 'flac', 'aac', 'wma', 'aiff', 'alac']
+VIDEO_EXTENSIONS = ['mp4', 'avi', 'mov', 'mkv', 'webm', 'wmv', 'flv', 'mpeg']
+# Used when the duration can't be read from the header: ~128 kbps audio, ~2 Mbps video
+AUDIO_BYTES_PER_SECOND = 16000
+VIDEO_BYTES_PER_SECOND = 250000
+
+RequestCost = namedtuple('RequestCost', ['pool', 'units'])
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionPool:
+    """Weighted concurrency limit with a bounded, deadline based wait queue."""
+
+    def __init__(self, name, capacity, max_queue):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.max_queue = max_queue
+        self.in_use = 0
+        self.waiting = 0
+        # Smoothed seconds a unit of work holds the pool, used for Retry-After
+        self.unit_seconds = 1.0
+        self.condition = threading.Condition()
+
+    def retry_after(self):
+        backlog = (self.in_use + self.waiting) / self.capacity
+        return min(120, max(1, math.ceil(self.unit_seconds * backlog)))
+
+    def _reject(self, reason):
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        logger.warning("Rejected request, %s pool is saturated", self.name, extra={"reason": reason})
+        raise HTTPException(
+            status_code=503,
+            detail="The server is busy, retry later",
+            headers={"Retry-After": str(self.retry_after())}
+        )
+
+    def acquire(self, units, timeout):
+        units = min(units, self.capacity)
+        start = time.perf_counter()
+        with self.condition:
+            if self.in_use + units > self.capacity:
+                if self.waiting >= self.max_queue:
+                    self._reject("queue_full")
+                self.waiting += 1
+                ADMISSION_QUEUED.labels(self.name).inc()
+                try:
+                    admitted = self.condition.wait_for(lambda: self.in_use + units <= self.capacity, timeout)
+                finally:
+                    self.waiting -= 1
+                    ADMISSION_QUEUED.labels(self.name).dec()
+                if not admitted:
+                    self._reject("timeout")
+            self.in_use += units
+        ADMISSION_WAIT.labels(self.name).observe(time.perf_counter() - start)
+        ADMISSION_IN_USE.labels(self.name).inc(units)
+        return units
+
+    def release(self, units, held_seconds):
+        with self.condition:
+            self.in_use -= units
+            self.unit_seconds = 0.8 * self.unit_seconds + 0.2 * (held_seconds / units)
+            self.condition.notify_all()
+        ADMISSION_IN_USE.labels(self.name).dec(units)
+
+
+_pools = {
+    "heavy": AdmissionPool("heavy", ADMISSION_HEAVY_CAPACITY, ADMISSION_MAX_QUEUE),
+    "light": AdmissionPool("light", ADMISSION_LIGHT_CAPACITY, ADMISSION_MAX_QUEUE),
+}
+
+
+def _file_size(file):
+    position = file.tell()
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
+
+
+def _media_seconds(file, fileExt, size):
+    if fileExt in ['wav', 'flac', 'ogg', 'aiff']:
+        try:
+            import soundfile as sf
+
+            position = file.tell()
+            try:
+                info = sf.info(file)
+                return info.frames / info.samplerate
+            finally:
+                file.seek(position)
+        except Exception:
+            pass
+    return size / (VIDEO_BYTES_PER_SECOND if fileExt in VIDEO_EXTENSIONS else AUDIO_BYTES_PER_SECOND)
+
+
+def _pdf_pages(file):
+    try:
+        import pypdfium2 as pdfium
+
+        position = file.tell()
+        try:
+            document = pdfium.PdfDocument(file)
+            pages = len(document)
+            document.close()
+            return pages
+        finally:
+            file.seek(position)
+    except Exception:
+        return 1
+
+
+def estimate_cost(file, rasterize=False):
+    """Estimate how much work an upload needs from its type, size and page or duration count.
+
+    Audio, video and rasterized PDFs go to the heavy pool at one unit per ten minutes
+    or ten pages, everything else to the light pool at one unit per 10 MB.
+    """
+    if file is None:
+        return RequestCost("light", 1)
+    fileExt = file.filename.split('.')[-1].lower()
+    size = _file_size(file.file)
+    if fileExt in AUDIO_EXTENSIONS or fileExt in VIDEO_EXTENSIONS:
+        return RequestCost("heavy", 1 + int(_media_seconds(file.file, fileExt, size) // 600))
+    if fileExt == 'pdf' and rasterize:
+        return RequestCost("heavy", 1 + _pdf_pages(file.file) // 10)
+    return RequestCost("light", 1 + size // (10 * 1024 * 1024))
+
+
+@contextmanager
+def admit(cost, timeout=ADMISSION_QUEUE_TIMEOUT):
+    """Hold capacity in the cost's pool for a block of work.
+
+    Waits up to ``timeout`` seconds for capacity and raises a 503 with Retry-After
+    when the pool stays saturated or too many requests are already waiting. The
+    block should only cover local CPU work, not OpenAI calls. A ``None`` cost
+    admits nothing, for work without a CPU bound stage.
+    """
+    if not ADMISSION_CONTROL or cost is None:
+        yield
+        return
+    pool = _pools[cost.pool]
+    units = pool.acquire(cost.units, timeout)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        pool.release(units, time.perf_counter() - start)
@@ -0,0 +1,98 @@
+"""Audio DSP kernels run in the DSP pool processes.
+
+Functions take paths or shared memory names rather than arrays, so nothing but
+small arguments and results is pickled between processes.
+"""
+from dsp_pool import SharedSamples
+from resampling import TARGET_RATE, iter_mono_blocks, load_mono
+
+# Hop of librosa's default STFT (n_fft 2048)
+STFT_HOP = 512
+# Samples of context on both sides of a span (~1 s), so the filters and STFT frames
+# settle before the part of the span that is kept. A multiple of the hop, and the
+# padded span starts on a hop boundary, so its frames line up with the frames of
+# the whole signal
+SPAN_PADDING = 32 * STFT_HOP
+
+
+def _highpass(samples, sample_rate=TARGET_RATE):
+    from scipy import signal
+
+    # filtfilt needs more samples than its edge padding
+    if len(samples) <= 18:
+        return samples
+    b, a = signal.butter(5, 100/(sample_rate/2), 'highpass')
+    return signal.filtfilt(b, a, samples)
+
+
+def decode_to_wav(audio_path, decoded_path):
+    """Decode audio to a 16 kHz mono WAV, mixing down and resampling block by block."""
+    import soundfile as sf
+
+    try:
+        with sf.SoundFile(decoded_path, 'w', TARGET_RATE, channels=1, format='WAV') as outfile:
+            for block in iter_mono_blocks(audio_path):
+                outfile.write(block)
+    except Exception:
+        sf.write(decoded_path, load_mono(audio_path), TARGET_RATE)
+    return decoded_path
+
+
+def highpass_file(audio_path, output_path):
+    """Stream a long recording through the high-pass filter without loading it whole."""
+    import numpy as np
+    import soundfile as sf
+    from scipy import signal
+
+    sos = signal.butter(5, 100, 'highpass', fs=TARGET_RATE, output='sos')
+    zi = np.zeros((sos.shape[0], 2))
+    with sf.SoundFile(output_path, 'w', TARGET_RATE, channels=1, format='WAV') as outfile:
+        for y in iter_mono_blocks(audio_path):
+            y, zi = signal.sosfilt(sos, y, zi=zi)
+            outfile.write(y.astype(np.float32))
+    return output_path
+
+
+def load_shared(audio_path, name, length):
+    """Read 16 kHz mono audio into shared samples.
+
+    Returns:
+        Noise profile for spectral gating: mean STFT magnitude of the filtered first second
+    """
+    import librosa
+    import numpy as np
+    import soundfile as sf
+
+    with SharedSamples(length, name) as shared, sf.SoundFile(audio_path) as pcm:
+        pcm.read(length, dtype='float32', out=shared.array())
+        head = np.array(shared.array()[:min(TARGET_RATE, length)])
+    return float(np.mean(np.abs(librosa.stft(_highpass(head)))))
+
+
+def denoise_span(source_name, output_name, length, start, end, noise_profile):
+    """High-pass and spectrally gate samples[start:end] from one shared buffer into another."""
+    with SharedSamples(length, source_name) as source, SharedSamples(length, output_name) as output:
+        _denoise_into(source.array(), output.array(), start, end, noise_profile)
+
+
+def _denoise_into(source, output, start, end, noise_profile):
+    import librosa
+    import numpy as np
+
+    first = max(0, (start - SPAN_PADDING) // STFT_HOP * STFT_HOP)
+    last = min(len(source), end + SPAN_PADDING)
+    y = _highpass(source[first:last])
+    if len(y) > 2048:
+        # Spectral gating: drop STFT bins that aren't clearly above the noise profile
+        S = librosa.stft(y, hop_length=STFT_HOP)
+        y = librosa.istft(S * (np.abs(S) > 2 * noise_profile), hop_length=STFT_HOP, length=len(y))
+    output[start:end] = y[start - first:end - first]
+
+
+def write_shared(name, length, output_path):
+    """Encode shared samples as a 16 kHz WAV."""
+    import soundfile as sf
+
+    with SharedSamples(length, name) as shared:
+        sf.write(output_path, shared.array(), TARGET_RATE)
+    return output_path
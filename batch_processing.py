@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+import threading
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+
+from fastapi import HTTPException
+
+from admission import admit, estimate_cost
+from metrics import record_usage, stage
+from model_router import choose_model
+from system_prompts import SYSTEM_PROMPT_V2
+from uploads import MappedFile
+from util import buildUserContent, parseDocuments
+
+# Number of files parsed and sent to the model at the same time within one batch
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# Maximum number of files accepted in one batch (uploads plus zip members)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+# Guard against zip bombs: total uncompressed size allowed for zip uploads, in MB
+BATCH_MAX_UNCOMPRESSED_MB = int(os.getenv("BATCH_MAX_UNCOMPRESSED_MB", "200"))
+# Process wide cap on concurrent OpenAI calls made by batches
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+
+logger = logging.getLogger(__name__)
+
+openai_slots = threading.BoundedSemaphore(OPENAI_MAX_CONCURRENCY)
+
+BatchFile = namedtuple('BatchFile', ['filename', 'file'])
+
+
+def collect_batch_files(uploads):
+    """Copy uploads (expanding zip archives) into memory mapped files owned by the batch.
+
+    The copies outlive the request's own UploadFile objects, which are closed
+    before a streaming response finishes.
+
+    Args:
+        uploads: List of FastAPI UploadFile objects
+
+    Returns:
+        List of BatchFile tuples
+
+    Raises:
+        HTTPException: Too many files, archives too large or not valid zips. Zip
+            limits are checked on the central directory, before anything is extracted
+    """
+    batch_files = []
+    uncompressed = 0
+    try:
+        for upload in uploads:
+            if upload.filename.split('.')[-1].lower() != 'zip':
+                if len(batch_files) >= BATCH_MAX_FILES:
+                    raise HTTPException(400, f"A batch can contain at most {BATCH_MAX_FILES} files")
+                batch_files.append(BatchFile(upload.filename, MappedFile(upload.file, upload.filename)))
+                continue
+            try:
+                with zipfile.ZipFile(upload.file) as archive:
+                    members = [m for m in archive.infolist() if not m.is_dir() and not m.filename.startswith('__MACOSX/')]
+                    if len(batch_files) + len(members) > BATCH_MAX_FILES:
+                        raise HTTPException(400, f"A batch can contain at most {BATCH_MAX_FILES} files")
+                    uncompressed += sum(m.file_size for m in members)
+                    if uncompressed > BATCH_MAX_UNCOMPRESSED_MB * 1024 * 1024:
+                        raise HTTPException(400, f"Zip archive {upload.filename} is too large to be processed")
+                    for member in members:
+                        with archive.open(member) as source:
+                            name = os.path.basename(member.filename)
+                            batch_files.append(BatchFile(name, MappedFile(source, name)))
+            except zipfile.BadZipFile:
+                raise HTTPException(400, f"{upload.filename} is not a valid zip archive")
+    except BaseException:
+        # Nothing owns the copies made so far yet
+        for batch_file in batch_files:
+            batch_file.file.close()
+        raise
+    return batch_files
+
+
+def build_messages(prompt, documentText, image):
+    """Build chat messages for one document.
+
+    Unlike single requests, batches ignore PROMPT_LAYOUT and keep the prompt ahead
+    of the document: every file of a batch has a different document but the same
+    prompt, so the system prompt and the prompt are the prefix worth caching.
+    """
+    userContent = buildUserContent(prompt, documentText, image, layout="prompt_first")
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT_V2
+        },
+        {
+            "role": "user",
+            "content": userContent
+        }
+    ]
+
+
+def _process_file(client, batch_file, prompt, model, temperature, sheet_names):
+    try:
+        with admit(estimate_cost(batch_file)):
+            documentText, image, _ = parseDocuments(batch_file, sheet_names)
+        messages = build_messages(prompt, documentText, image)
+        if model == "auto":
+            model = choose_model(prompt, documentText, image is not None).model
+        with openai_slots, stage("openai_chat", model):
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=temperature
+            )
+        record_usage(model, response.usage)
+        content = json.loads(response.choices[0].message.content)
+        return {
+            "filename": batch_file.filename,
+            "status": "success",
+            "response": content.get('response'),
+            "file_response": content.get('file_response')
+        }
+    except HTTPException as e:
+        return {"filename": batch_file.filename, "status": "error", "detail": e.detail}
+    except Exception as e:
+        logger.exception("Batch item %s failed", batch_file.filename)
+        return {"filename": batch_file.filename, "status": "error", "detail": str(e)}
+    finally:
+        batch_file.file.close()
+
+
+def stream_batch(client, batch_files, prompt, model, temperature, sheet_names=None):
+    """Parse and complete every file concurrently, returning an iterator of NDJSON lines as they finish.
+
+    The files are submitted before this returns, from the request's thread. If the
+    iterator is closed or dropped early (the client disconnected, or the response
+    was never sent), files that haven't started are cancelled and closed, and
+    nothing waits for the ones already running, which close their own files.
+    """
+    lines = _stream_batch(client, batch_files, prompt, model, temperature, sheet_names)
+    # Run up to the first yield, so the generator's cleanup runs even if it's never iterated
+    next(lines)
+    return lines
+
+
+def _stream_batch(client, batch_files, prompt, model, temperature, sheet_names):
+    executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+    futures = []
+    try:
+        for batch_file in batch_files:
+            # Each task runs in a copy of the request context so logs and spans keep the request id
+            futures.append(executor.submit(
+                copy_context().run, _process_file, client, batch_file, prompt, model, temperature, sheet_names))
+        yield
+        for future in as_completed(futures):
+            yield json.dumps(future.result()) + "\n"
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for index, batch_file in enumerate(batch_files):
+            if index >= len(futures) or futures[index].cancelled():
+                batch_file.file.close()
+
+
+def submit_openai_batch(client, batch_files, prompt, model, temperature, sheet_names=None):
+    """Parse every file and submit the completions through the OpenAI Batch API.
+
+    Returns:
+        Dict with the batch id and the files that could not be parsed
+    """
+    lines = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        # The context is copied here, in the request's thread, so parse logs keep the request id
+        futures = [executor.submit(copy_context().run, _parse_for_batch, f, sheet_names) for f in batch_files]
+        parsed = (future.result() for future in futures)
+        for index, (batch_file, result) in enumerate(zip(batch_files, parsed)):
+            if isinstance(result, str):
+                errors.append({"filename": batch_file.filename, "status": "error", "detail": result})
+                continue
+            documentText, image = result
+            lines.append(json.dumps({
+                "custom_id": f"{index}:{batch_file.filename}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": choose_model(prompt, documentText, image is not None).model if model == "auto" else model,
+                    "messages": build_messages(prompt, documentText, image),
+                    "response_format": {"type": "json_object"},
+                    "temperature": temperature
+                }
+            }))
+    if not lines:
+        raise HTTPException(400, detail={"message": "None of the files could be parsed", "errors": errors})
+
+    batch_input = client.files.create(
+        file=("batch_input.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=batch_input.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    return {
+        "batch_id": batch.id,
+        "batch_status": batch.status,
+        "submitted": len(lines),
+        "errors": errors
+    }
+
+
+def _parse_for_batch(batch_file, sheet_names):
+    try:
+        with admit(estimate_cost(batch_file)):
+            documentText, image, _ = parseDocuments(batch_file, sheet_names)
+        return documentText, image
+    except HTTPException as e:
+        return str(e.detail)
+    except Exception as e:
+        return str(e)
+    finally:
+        batch_file.file.close()
+
+
+def get_openai_batch(client, batch_id):
+    """Return the status of a submitted batch and, once completed, its per file results."""
+    batch = client.batches.retrieve(batch_id)
+    result = {
+        "batch_id": batch.id,
+        "batch_status": batch.status,
+        "request_counts": batch.request_counts.model_dump() if batch.request_counts else None,
+        "results": None
+    }
+    if batch.status != "completed" or not batch.output_file_id:
+        return result
+
+    results = []
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        filename = item["custom_id"].split(":", 1)[-1]
+        body = (item.get("response") or {}).get("body") or {}
+        if item.get("error") or not body.get("choices"):
+            results.append({"filename": filename, "status": "error", "detail": item.get("error") or body})
+            continue
+        content = json.loads(body["choices"][0]["message"]["content"])
+        results.append({
+            "filename": filename,
+            "status": "success",
+            "response": content.get('response'),
+            "file_response": content.get('file_response')
+        })
+    result["results"] = results
+    return result
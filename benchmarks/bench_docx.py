@@ -0,0 +1,138 @@
+"""Benchmark the streaming DOCX extractor against python-docx.
+
+Generates large synthetic DOCX files (headings, paragraphs and tables) and
+reports wall time and peak traced memory for both extraction paths.
+
+Usage:
+    python benchmarks/bench_docx.py --paragraphs 20000 --tables 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx_parser import extract_docx_text
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+</Types>"""
+
+RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+DOC_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>
+<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/></w:style>
+<w:style w:type="paragraph" w:styleId="Heading2"><w:name w:val="heading 2"/></w:style>
+</w:styles>"""
+
+SENTENCE = "The quick brown fox jumps over the lazy dog while the auditor reviews clause {i}."
+
+
+def _paragraph(text, style=None):
+    ppr = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+    return f'<w:p>{ppr}<w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+
+
+def _table(rows, cols, seed):
+    out = ['<w:tbl>']
+    for r in range(rows):
+        out.append('<w:tr>')
+        for c in range(cols):
+            out.append(f'<w:tc>{_paragraph(f"r{r}c{c} value {seed}")}</w:tc>')
+        out.append('</w:tr>')
+    out.append('</w:tbl>')
+    return ''.join(out)
+
+
+def make_docx(path, paragraphs, tables, rows=20, cols=6):
+    """Write a synthetic DOCX with the given number of paragraphs and tables."""
+    table_every = max(1, paragraphs // max(1, tables)) if tables else 0
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', RELS)
+        archive.writestr('word/_rels/document.xml.rels', DOC_RELS)
+        archive.writestr('word/styles.xml', STYLES)
+        with archive.open('word/document.xml', 'w') as out:
+            out.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                      b'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>')
+            written_tables = 0
+            for i in range(paragraphs):
+                if i % 500 == 0:
+                    out.write(_paragraph(f"Section {i // 500}", 'Heading1').encode())
+                out.write(_paragraph(SENTENCE.format(i=i)).encode())
+                if table_every and i % table_every == 0 and written_tables < tables:
+                    out.write(_table(rows, cols, i).encode())
+                    written_tables += 1
+            out.write(b'</w:body></w:document>')
+
+
+def python_docx_extract(path):
+    """Reference extraction through the python-docx object model."""
+    from docx import Document
+
+    document = Document(path)
+    parts = [p.text for p in document.paragraphs]
+    for table in document.tables:
+        for row in table.rows:
+            parts.append(' | '.join(cell.text for cell in row.cells))
+    return '\n\n'.join(parts)
+
+
+def measure(fn, path, repeat):
+    best = float('inf')
+    peak = 0
+    output = None
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        output = fn(path)
+        best = min(best, time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return best, peak, len(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[2000, 20000, 100000])
+    parser.add_argument('--tables', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for count in args.paragraphs:
+            path = os.path.join(temp_dir, f'synthetic_{count}.docx')
+            make_docx(path, count, args.tables)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            print(f"\n{count} paragraphs, {args.tables} tables ({size_mb:.2f} MB)")
+            candidates = [('streaming', extract_docx_text), ('python-docx', python_docx_extract)]
+            for name, fn in candidates:
+                try:
+                    seconds, peak, chars = measure(fn, path, args.repeat)
+                except ImportError as e:
+                    print(f"  {name:<12} skipped: {e}")
+                    continue
+                print(f"  {name:<12} {seconds * 1000:9.1f} ms  peak {peak / (1024 * 1024):8.2f} MB  {chars} chars")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark audio fingerprint matching and index lookups as the index grows.
+
+Fingerprints a synthetic meeting, re-encodes it (MP3 and M4A through ffmpeg,
+when available) and checks each copy is matched to the original while an
+unrelated recording is not. Then fills a SQLite index with filler recordings
+and reports the lookup latency at each size, which should grow far slower
+than the index.
+
+Usage:
+    python benchmarks/bench_fingerprint.py --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=120)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--filler-hashes', type=int, default=64,
+                        help="Hashes per filler recording, fewer than a real sketch to keep the database small")
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.environ["CACHE_URL"] = f"sqlite://{os.path.join(temp_dir, 'index.db')}"
+        from bench_diarization import make_meeting
+        from corpus import encode_with_ffmpeg
+        from fingerprint import Fingerprint, compute_fingerprint, find_duplicate, index_fingerprint
+
+        original = os.path.join(temp_dir, 'meeting.wav')
+        make_meeting(original, args.seconds, 3, seed=1)
+        start = time.perf_counter()
+        reference = compute_fingerprint(original)
+        elapsed = time.perf_counter() - start
+        print(f"fingerprint of {args.seconds:.0f} s: {elapsed * 1000:.1f} ms "
+              f"({args.seconds / elapsed:.0f}x real time), {len(reference.hashes)} hashes")
+        index_fingerprint("original", reference)
+
+        unrelated = os.path.join(temp_dir, 'other.wav')
+        make_meeting(unrelated, args.seconds, 3, seed=2)
+        copies = [('unrelated', unrelated)]
+        for extension in ['mp3', 'm4a']:
+            target = os.path.join(temp_dir, f'meeting.{extension}')
+            if encode_with_ffmpeg(original, target):
+                copies.append((extension, target))
+        for name, path in copies:
+            match = find_duplicate(compute_fingerprint(path))
+            print(f"  {name:<10} -> {match.digest + f' ({match.matches} matches)' if match else 'no match'}")
+
+        rng = random.Random(0)
+        indexed = 1
+        for size in sorted(args.sizes):
+            while indexed < size:
+                hashes = [rng.getrandbits(63) for _ in range(args.filler_hashes)]
+                times = [rng.randrange(100000) for _ in hashes]
+                index_fingerprint(f"filler-{indexed}", Fingerprint(hashes, times, rng.uniform(60, 7200)))
+                indexed += 1
+            start = time.perf_counter()
+            for _ in range(args.lookups):
+                find_duplicate(reference)
+            elapsed = (time.perf_counter() - start) / args.lookups
+            print(f"{size:>9} recordings: lookup {elapsed * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Measure the cold import time of the API module and check heavy libraries stay lazy.
+
+Runs `import main` in fresh interpreters with `-X importtime`, reports the
+wall time, the slowest top-level imports and any module from
+warmup.HEAVY_MODULES that was imported eagerly.
+
+Usage:
+    python benchmarks/bench_import.py --repeat 5 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+from warmup import HEAVY_MODULES
+print(json.dumps({
+    "wall_ms": elapsed * 1000,
+    "modules": len(sys.modules),
+    "eager": [name for name in HEAVY_MODULES if name in sys.modules],
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """Return {top level module: cumulative microseconds} from -X importtime output."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name_field = line.split("|")
+        # Nested imports are indented by two more spaces per level
+        if name_field.startswith("  "):
+            continue
+        name = name_field.strip()
+        cumulative[name] = cumulative.get(name, 0) + int(cumulative_us)
+    return cumulative
+
+
+def measure():
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "fake-key"), WARM_IMPORTS="off", LOG_LEVEL="WARNING")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["imports"] = parse_importtime(completed.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, help="Fail if the fastest import of main exceeds this")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.repeat)]
+    best = min(runs, key=lambda run: run["wall_ms"])
+    print(f"import main: best {best['wall_ms']:.0f} ms, worst {max(r['wall_ms'] for r in runs):.0f} ms, "
+          f"{best['modules']} modules loaded")
+    print(f"\n{'top-level import':<40} {'cumulative ms':>14}")
+    for name, micros in sorted(best["imports"].items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40} {micros / 1000:>14.1f}")
+
+    failed = False
+    if best["eager"]:
+        print(f"\nImported eagerly, should load on first use: {', '.join(best['eager'])}")
+        failed = True
+    if args.budget_ms and best["wall_ms"] > args.budget_ms:
+        print(f"\nImport time {best['wall_ms']:.0f} ms exceeds the budget of {args.budget_ms:.0f} ms")
+        failed = True
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(best, out, indent=2)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark PDF text extraction backends on the synthetic PDFs of the corpus.
+
+Extracts every page with each backend in TEXT_BACKENDS and with the previous
+pypdf path (layout mode, then plain mode again for blank pages), bypassing the
+page cache. Reports wall time, pages per second and extracted characters.
+
+Usage:
+    python benchmarks/bench_pdf_text.py --scale 1 --repeat 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import make_pdf
+from pdf_pages import TEXT_BACKENDS
+
+
+def legacy_pypdf_text(document, reader, index):
+    page = reader.pages[index]
+    text = page.extract_text(extraction_mode='layout')
+    if len(text.strip()) == 0:
+        text = page.extract_text()
+    return text
+
+
+def extract_all(path, backend):
+    import pypdfium2 as pdfium
+    from pypdf import PdfReader
+
+    with open(path, 'rb') as file:
+        reader = PdfReader(file)
+        document = pdfium.PdfDocument(path)
+        try:
+            return [backend(document, reader, index) for index in range(len(reader.pages))]
+        finally:
+            document.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiplier for the page counts")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        documents = []
+        for pages in (1, 10, 100):
+            pages = max(1, int(pages * args.scale))
+            documents.append((f"text {pages}p", os.path.join(temp_dir, f'text_{pages}p.pdf'), pages, ()))
+        mixed = max(4, int(12 * args.scale))
+        documents.append((f"mixed {mixed}p", os.path.join(temp_dir, 'mixed.pdf'), mixed, set(range(3, mixed, 4))))
+
+        candidates = [*TEXT_BACKENDS.items(), ('pypdf-legacy', legacy_pypdf_text)]
+        for name, path, pages, scanned in documents:
+            make_pdf(path, pages, scanned_pages=scanned)
+            print(f"\n{name} ({os.path.getsize(path) / (1024 * 1024):.2f} MB)")
+            for backend_name, backend in candidates:
+                best = float('inf')
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    texts = extract_all(path, backend)
+                    best = min(best, time.perf_counter() - start)
+                chars = sum(len(text) for text in texts)
+                print(f"  {backend_name:<13} {best * 1000:9.1f} ms  {pages / best:9.1f} pages/s  {chars} chars")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark noise removal at the native sample rate against the 16 kHz mono path.
+
+Generates stereo 44.1 kHz recordings, runs the previous native rate noise
+removal and WhisperService._remove_noise on them, then runs voice activity
+detection on each output to show the effect on later stages. Reports wall time,
+throughput as a multiple of real time, peak traced memory and output size.
+
+Usage:
+    python benchmarks/bench_resample.py --seconds 60 300 --sample-rate 48000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+from corpus import make_wav
+
+
+def native_rate_remove_noise(audio_path, output_dir):
+    """Reference: the noise removal that ran at the file's own sample rate."""
+    import librosa
+    import numpy as np
+    import soundfile as sf
+    from scipy import signal
+
+    processed_path = os.path.join(output_dir, 'native_audio.wav')
+    info = sf.info(audio_path)
+    sr = info.samplerate
+    if info.frames > 10000000:
+        chunk_size = 2500000
+        with sf.SoundFile(processed_path, 'w', sr, channels=1, format='WAV') as outfile:
+            for block_idx in range(0, info.frames, chunk_size):
+                with sf.SoundFile(audio_path) as infile:
+                    infile.seek(block_idx)
+                    y = infile.read(min(chunk_size, info.frames - block_idx))
+                    if len(y.shape) > 1 and y.shape[1] > 1:
+                        y = np.mean(y, axis=1)
+                    b, a = signal.butter(5, 100/(sr/2), 'highpass')
+                    y = signal.lfilter(b, a, y)
+                    b, a = signal.butter(5, 8000/(sr/2), 'lowpass')
+                    outfile.write(signal.lfilter(b, a, y).astype(np.float32))
+        return processed_path
+
+    y, sr = librosa.load(audio_path, sr=None, mono=True, res_type='kaiser_fast')
+    b, a = signal.butter(5, 100/(sr/2), 'highpass')
+    y = signal.filtfilt(b, a, y)
+    b, a = signal.butter(5, 8000/(sr/2), 'lowpass')
+    y = signal.filtfilt(b, a, y)
+    if len(y) > 5000000:
+        sf.write(processed_path, y, sr)
+        return processed_path
+    noise_profile = np.mean(np.abs(librosa.stft(y[:min(int(sr), len(y))])))
+    S = librosa.stft(y)
+    S_mag = np.abs(S)
+    S_denoised = S_mag * (S_mag > 2 * noise_profile) * np.exp(1j * np.angle(S))
+    sf.write(processed_path, librosa.istft(S_denoised), sr)
+    return processed_path
+
+
+def resampled_remove_noise(audio_path, output_dir):
+    from whisper_service import WhisperService
+
+    processed_path = WhisperService(client=object())._remove_noise(audio_path)
+    target = os.path.join(output_dir, 'resampled_audio.wav')
+    shutil.move(processed_path, target)
+    os.rmdir(os.path.dirname(processed_path))
+    return target
+
+
+def measure(fn, audio_path, repeat):
+    from vad import remove_silence
+
+    best = float('inf')
+    best_vad = float('inf')
+    peak = 0
+    size = 0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_dir:
+            tracemalloc.start()
+            start = time.perf_counter()
+            output = fn(audio_path, output_dir)
+            best = min(best, time.perf_counter() - start)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            size = os.path.getsize(output)
+
+            start = time.perf_counter()
+            remove_silence(output, output_dir)
+            best_vad = min(best_vad, time.perf_counter() - start)
+    return best, best_vad, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, nargs='+', default=[60, 300, 900])
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    candidates = [('native rate', native_rate_remove_noise), ('16k mono', resampled_remove_noise)]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for seconds in args.seconds:
+            path = os.path.join(temp_dir, f'speech_{int(seconds)}s.wav')
+            make_wav(path, seconds, sample_rate=args.sample_rate, channels=args.channels)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            print(f"\n{seconds:.0f} s at {args.sample_rate} Hz, {args.channels} channels ({size_mb:.1f} MB)")
+            results = {}
+            for name, fn in candidates:
+                denoise, vad, peak, output_size = measure(fn, path, args.repeat)
+                results[name] = denoise + vad
+                print(f"  {name:<12} denoise {denoise * 1000:9.1f} ms ({seconds / denoise:6.1f}x real time)  "
+                      f"vad {vad * 1000:8.1f} ms  peak {peak / (1024 * 1024):8.1f} MB  "
+                      f"output {output_size / (1024 * 1024):7.1f} MB")
+            print(f"  speedup      {results['native rate'] / results['16k mono']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Synthetic benchmark corpora: PDFs, DOCX with tables, large XLSX, images and audio/video.
+
+Documents are written with the standard library only. Audio needs numpy,
+and encoded audio/video codecs need ffmpeg on PATH (they are skipped
+otherwise).
+
+Usage:
+    python benchmarks/corpus.py --out /tmp/corpus
+"""
+import argparse
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_docx import make_docx
+
+LINE = "Clause {n}: the parties agree that the quarterly figures in section {s} are final."
+
+
+def make_pdf(path, pages, lines_per_page=45, scanned_pages=()):
+    """Write a text PDF with the given number of pages using the base Helvetica font.
+
+    Pages listed in ``scanned_pages`` (0-based) have no text layer, only a full page
+    grayscale image standing in for a scan.
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    scans = {}
+    width, height = 850, 1100
+    for p in scanned_pages:
+        noise = os.urandom(width)
+        pixels = b"".join(noise[(y * 13) % width:] + noise[:(y * 13) % width] for y in range(height))
+        data = zlib.compress(pixels, 6)
+        scans[p] = add(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                       b"/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>\nstream\n" % (width, height, len(data))
+                       + data + b"\nendstream")
+    pages_id = len(objects) + 2 * pages + 1
+    page_ids = []
+    for p in range(pages):
+        if p in scanned_pages:
+            stream = b"q 612 0 0 792 0 0 cm /Im1 Do Q"
+            resources = b"<< /XObject << /Im1 %d 0 R >> >>" % scans[p]
+        else:
+            text = [b"BT /F1 10 Tf 50 780 Td 14 TL"]
+            for n in range(lines_per_page):
+                line = LINE.format(n=p * lines_per_page + n, s=p).replace("(", "").replace(")", "")
+                text.append(f"({line}) Tj T*".encode("latin-1"))
+            text.append(b"ET")
+            stream = b"\n".join(text)
+            resources = b"<< /Font << /F1 %d 0 R >> >>" % font
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources %s >>" % (pages_id, content, resources)))
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    assert add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)) == pages_id
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    with open(path, "wb") as out:
+        out.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(out.tell())
+            out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = out.tell()
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            out.write(b"%010d 00000 n \n" % offset)
+        out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+
+
+def make_xlsx(path, rows, cols=12):
+    """Write a single sheet XLSX with inline strings and numbers."""
+    def column(index):
+        name = ""
+        index += 1
+        while index:
+            index, rem = divmod(index - 1, 26)
+            name = chr(65 + rem) + name
+        return name
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>')
+        archive.writestr("_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>')
+        archive.writestr("xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8"?><workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        archive.writestr("xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>')
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8"?><worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            for r in range(rows + 1):
+                cells = []
+                for c in range(cols):
+                    ref = f"{column(c)}{r + 1}"
+                    if r == 0:
+                        cells.append(f'<c r="{ref}" t="inlineStr"><is><t>column_{c}</t></is></c>')
+                    elif c % 3 == 0:
+                        cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{escape(f"item {r}-{c}")}</t></is></c>')
+                    else:
+                        cells.append(f'<c r="{ref}"><v>{r * c * 1.5}</v></c>')
+                sheet.write(f'<row r="{r + 1}">{"".join(cells)}</row>'.encode())
+            sheet.write(b"</sheetData></worksheet>")
+
+
+def make_png(path, width, height):
+    """Write a noisy RGB PNG, which compresses about as badly as a photo."""
+    raw = bytearray()
+    row_noise = os.urandom(width * 3)
+    for y in range(height):
+        raw.append(0)
+        shift = (y * 7) % len(row_noise)
+        raw.extend(row_noise[shift:] + row_noise[:shift])
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    with open(path, "wb") as out:
+        out.write(b"\x89PNG\r\n\x1a\n")
+        out.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        out.write(chunk(b"IDAT", zlib.compress(bytes(raw), 6)))
+        out.write(chunk(b"IEND", b""))
+
+
+def make_jpeg(path, width, height):
+    """Write a JPEG photo stand-in (requires Pillow)."""
+    from PIL import Image
+
+    png_path = path + ".png"
+    make_png(png_path, width, height)
+    with Image.open(png_path) as image:
+        image.save(path, format="JPEG", quality=92)
+    os.remove(png_path)
+
+
+def make_wav(path, seconds, sample_rate=44100, channels=2, speech_ratio=0.5, speakers=2):
+    """Write a WAV of alternating tone bursts (stand-in speakers) and background noise."""
+    import numpy as np
+    import soundfile as sf
+
+    rng = np.random.default_rng(7)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    noise = rng.normal(0, 0.02, t.shape)
+    segment = 2.0
+    index = (t // segment).astype(int)
+    speaking = (index % int(round(1 / max(speech_ratio, 1e-3)))) == 0 if speech_ratio < 1 else np.ones_like(t, bool)
+    pitch = 140 + 90 * (index % speakers)
+    voice = 0.3 * np.sin(2 * np.pi * pitch * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+    voice += 0.1 * np.sin(2 * np.pi * pitch * 2.5 * t)
+    signal = noise + voice * speaking
+    data = np.stack([signal] * channels, axis=1) if channels > 1 else signal
+    sf.write(path, data.astype(np.float32), sample_rate)
+
+
+def encode_with_ffmpeg(source, target, video=False):
+    """Encode a WAV into another codec (or an MP4 with a black video track). Returns False without ffmpeg."""
+    if shutil.which("ffmpeg") is None:
+        return False
+    command = ["ffmpeg", "-y", "-loglevel", "error"]
+    if video:
+        command += ["-f", "lavfi", "-i", "color=c=black:s=320x240:r=10", "-i", source, "-shortest",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac"]
+    else:
+        command += ["-i", source]
+    subprocess.run(command + [target], check=True, capture_output=True)
+    return True
+
+
+def build_corpus(out_dir, scale=1.0):
+    """Generate the standard benchmark corpus and return {name: path}."""
+    os.makedirs(out_dir, exist_ok=True)
+    corpus = {}
+
+    def path(name):
+        return os.path.join(out_dir, name)
+
+    for pages in (1, 10, 100):
+        pages = max(1, int(pages * scale))
+        corpus[f"pdf_{pages}p"] = path(f"text_{pages}p.pdf")
+        make_pdf(corpus[f"pdf_{pages}p"], pages)
+    # Mostly text with every fourth page scanned
+    mixed_pages = max(4, int(12 * scale))
+    corpus["pdf_mixed"] = path(f"mixed_{mixed_pages}p.pdf")
+    make_pdf(corpus["pdf_mixed"], mixed_pages, scanned_pages=set(range(3, mixed_pages, 4)))
+    corpus["docx_tables"] = path("tables.docx")
+    make_docx(corpus["docx_tables"], max(100, int(5000 * scale)), max(5, int(50 * scale)))
+    corpus["xlsx_large"] = path("large.xlsx")
+    make_xlsx(corpus["xlsx_large"], max(100, int(20000 * scale)))
+    corpus["txt"] = path("notes.txt")
+    with open(corpus["txt"], "w") as out:
+        out.write("\n".join(LINE.format(n=n, s=n // 40) for n in range(max(10, int(2000 * scale)))))
+    corpus["png_12mp"] = path("photo_12mp.png")
+    make_png(corpus["png_12mp"], 4000, 3000)
+    corpus["png_small"] = path("icon.png")
+    make_png(corpus["png_small"], 400, 300)
+    try:
+        corpus["jpg_12mp"] = path("photo_12mp.jpg")
+        make_jpeg(corpus["jpg_12mp"], 4000, 3000)
+    except ImportError:
+        corpus.pop("jpg_12mp")
+
+    try:
+        for seconds in (30, 300):
+            seconds = max(5, int(seconds * scale))
+            wav = path(f"meeting_{seconds}s.wav")
+            make_wav(wav, seconds)
+            corpus[f"wav_{seconds}s"] = wav
+            for ext in ("mp3", "m4a", "flac"):
+                target = path(f"meeting_{seconds}s.{ext}")
+                if encode_with_ffmpeg(wav, target):
+                    corpus[f"{ext}_{seconds}s"] = target
+            video = path(f"meeting_{seconds}s.mp4")
+            if encode_with_ffmpeg(wav, video, video=True):
+                corpus[f"mp4_{seconds}s"] = video
+    except ImportError as e:
+        print(f"Skipping audio corpus: {e}")
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for document sizes and audio lengths")
+    args = parser.parse_args()
+    for name, file_path in build_corpus(args.out, args.scale).items():
+        print(f"{name:<16} {os.path.getsize(file_path) / (1024 * 1024):9.2f} MB  {file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Local stand-in for the OpenAI API used by the offline benchmarks.
+
+Implements the endpoints the service calls (chat completions, responses,
+audio transcriptions, files, vector stores and batches) with configurable
+latency, so every route can be exercised without network access.
+
+Usage:
+    python benchmarks/fake_openai.py --port 8765 --latency-ms 300
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake uvicorn main:app
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILE_RESPONSE_MARKER = "[file_response]"
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency_ms=200.0, jitter_ms=50.0, whisper_ms_per_mb=150.0, tokens_per_second=400.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.whisper_ms_per_mb = whisper_ms_per_mb
+        self.tokens_per_second = tokens_per_second
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _json_answer(request_text):
+    answer = {"response": "# Summary\n\nThis is a synthetic answer from the fake OpenAI server.\n\n" + "- point\n" * 10}
+    if FILE_RESPONSE_MARKER in request_text:
+        answer["file_response"] = "# Modified document\n\n" + ("Lorem ipsum dolor sit amet. " * 40 + "\n\n") * 20
+    return answer
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = FakeOpenAIConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sleep(self, extra_ms=0.0, completion_tokens=0):
+        delay = self.config.latency_ms + random.uniform(-self.config.jitter_ms, self.config.jitter_ms) + extra_ms
+        delay += completion_tokens / self.config.tokens_per_second * 1000
+        time.sleep(max(0.0, delay) / 1000)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, text):
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        match = re.match(r"^/v1/batches/([^/]+)$", self.path)
+        if match:
+            return self._send_json(_batch(match.group(1), "completed"))
+        match = re.match(r"^/v1/files/([^/]+)/content$", self.path)
+        if match:
+            return self._send_text("")
+        self._send_json({"error": {"message": f"Unknown path {self.path}"}}, 404)
+
+    def do_POST(self):
+        body = self._read_body()
+        path = self.path.split("?")[0]
+        if path == "/v1/chat/completions":
+            return self._chat(json.loads(body))
+        if path == "/v1/responses":
+            return self._responses(json.loads(body))
+        if path in ("/v1/audio/transcriptions", "/v1/audio/translations"):
+            return self._transcription(body)
+        if path == "/v1/files":
+            self._sleep()
+            return self._send_json({
+                "id": f"file-{uuid.uuid4().hex[:24]}", "object": "file", "bytes": len(body),
+                "created_at": int(time.time()), "filename": "upload", "purpose": "user_data", "status": "processed",
+            })
+        if path == "/v1/vector_stores":
+            return self._send_json({
+                "id": f"vs_{uuid.uuid4().hex[:24]}", "object": "vector_store", "created_at": int(time.time()),
+                "name": "API Vector Store", "usage_bytes": 0, "status": "completed",
+                "file_counts": {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0},
+            })
+        match = re.match(r"^/v1/vector_stores/([^/]+)/files$", path)
+        if match:
+            self._sleep()
+            payload = json.loads(body)
+            return self._send_json({
+                "id": payload.get("file_id"), "object": "vector_store.file", "created_at": int(time.time()),
+                "vector_store_id": match.group(1), "status": "completed", "usage_bytes": 0, "last_error": None,
+            })
+        if path == "/v1/batches":
+            return self._send_json(_batch(f"batch_{uuid.uuid4().hex[:24]}", "validating"))
+        self._send_json({"error": {"message": f"Unknown path {self.path}"}}, 404)
+
+    def _chat(self, payload):
+        request_text = json.dumps(payload.get("messages", []))
+        json_mode = (payload.get("response_format") or {}).get("type") == "json_object"
+        content = json.dumps(_json_answer(request_text)) if json_mode else _json_answer(request_text)["response"]
+        prompt_tokens = _estimate_tokens(request_text)
+        completion_tokens = _estimate_tokens(content)
+        self._sleep(completion_tokens=completion_tokens)
+        self._send_json({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        })
+
+    def _responses(self, payload):
+        request_text = json.dumps(payload.get("input", []))
+        content = json.dumps({"file_response": "", **_json_answer(request_text)})
+        input_tokens = _estimate_tokens(request_text)
+        output_tokens = _estimate_tokens(content)
+        self._sleep(completion_tokens=output_tokens)
+        self._send_json({
+            "id": f"resp_{uuid.uuid4().hex[:24]}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": "completed",
+            "model": payload.get("model"),
+            "output": [{
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex[:24]}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": content, "annotations": []}],
+            }],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": payload.get("tools", []),
+            "usage": {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens_details": {"reasoning_tokens": 0},
+            },
+        })
+
+    def _transcription(self, body):
+        megabytes = len(body) / (1024 * 1024)
+        self._sleep(extra_ms=megabytes * self.config.whisper_ms_per_mb)
+        self._send_text("This is a synthetic transcription of the uploaded audio. " * max(1, int(megabytes * 20)))
+
+
+def _batch(batch_id, status):
+    return {
+        "id": batch_id, "object": "batch", "endpoint": "/v1/chat/completions", "input_file_id": "file-fake",
+        "completion_window": "24h", "status": status, "created_at": int(time.time()), "output_file_id": None,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+    }
+
+
+def start_server(port=0, config=None):
+    """Start the fake server on a background thread and return it with its base URL."""
+    handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,), {"config": config or FakeOpenAIConfig()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--whisper-ms-per-mb", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(args.latency_ms, args.jitter_ms, args.whisper_ms_per_mb, args.tokens_per_second)
+    server, base_url = start_server(args.port, config)
+    print(f"Fake OpenAI server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
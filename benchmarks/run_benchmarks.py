@@ -0,0 +1,289 @@
+"""End to end benchmarks for every endpoint, run offline against the fake OpenAI server.
+
+Each scenario runs in its own worker process so peak RSS is attributable to
+it. Workers import the app in-process and drive it through FastAPI's
+TestClient, so no uvicorn instance or network access is needed.
+
+Usage:
+    python benchmarks/run_benchmarks.py --corpus /tmp/corpus --json results.json
+    python benchmarks/run_benchmarks.py --only v4 --baseline results.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+AUTH_TOKEN = "benchmark-token"
+PROMPT = "Summarise the key points of the attached document."
+
+# name, path, corpus files, extra form fields, requests, concurrency
+SCENARIOS = [
+    ("v1_text", "/v1/chat-completion", ["txt"], {}, 20, 4),
+    ("v1_pdf_response", "/v1/chat-completion", ["pdf_10p"], {"response_type": "pdf"}, 10, 2),
+    ("v1_xlsx", "/v1/chat-completion", ["xlsx_large"], {}, 5, 1),
+    ("v2_pdf", "/v2/chat-completion", ["pdf_100p"], {}, 10, 2),
+    ("v3_docx", "/v3/chat-completion", ["docx_tables"], {}, 10, 2),
+    ("v4_image", "/v4/chat-completion", ["jpg_12mp", "png_12mp"], {}, 10, 2),
+    ("v4_small_image", "/v4/chat-completion", ["png_small"], {}, 20, 4),
+    ("v5_pdf", "/v5/chat-completion", ["pdf_10p"], {}, 10, 2),
+    ("v5_pdf_mixed", "/v5/chat-completion", ["pdf_mixed"], {}, 10, 2),
+    ("v5_pdf_mixed_hybrid", "/v5/chat-completion", ["pdf_mixed"], {"pdf_mode": "hybrid"}, 10, 2),
+    ("v6_wav", "/v6/audio-processing", ["wav_30s"], {}, 5, 1),
+    ("v6_mp3_long", "/v6/audio-processing", ["mp3_300s", "wav_300s"], {}, 3, 1),
+    ("v6_video", "/v6/audio-processing", ["mp4_30s"], {}, 3, 1),
+    ("v7_batch", "/v7/batch-completion", ["txt", "pdf_10p", "docx_tables", "png_small"], {}, 5, 1),
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _StageRssSampler:
+    """Tracks the peak RSS observed while each processing stage was in flight."""
+
+    def __init__(self, gauge, interval=0.01):
+        self.gauge = gauge
+        self.interval = interval
+        self.peaks = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            rss = _rss_mb()
+            for metric in self.gauge.collect():
+                for sample in metric.samples:
+                    if sample.value > 0:
+                        name = sample.labels["stage"]
+                        self.peaks[name] = max(self.peaks.get(name, 0.0), rss)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def _stage_timings(histogram):
+    totals = {}
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            key = sample.labels["stage"]
+            if sample.name.endswith("_sum"):
+                totals.setdefault(key, [0.0, 0])[0] += sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(key, [0.0, 0])[1] += int(sample.value)
+    return {name: {"count": count, "total_s": round(total, 4), "mean_ms": round(total / count * 1000, 2)}
+            for name, (total, count) in totals.items() if count}
+
+
+def run_worker(spec):
+    """Run one scenario inside this process and return its results."""
+    os.chdir(REPO_DIR)
+    sys.path.insert(0, REPO_DIR)
+    from fastapi.testclient import TestClient
+    import main
+    import metrics
+
+    client = TestClient(main.app)
+    headers = {"authorization": AUTH_TOKEN}
+    files = spec["files"]
+    field = "files" if spec["path"].startswith("/v7/") else "file"
+
+    def send(index):
+        path = files[index % len(files)]
+        with open(path, "rb") as upload:
+            start = time.perf_counter()
+            response = client.post(
+                spec["path"], headers=headers, data={"prompt": PROMPT, **spec["form"]},
+                files=[(field, (os.path.basename(path), upload))])
+            body = response.content
+            return time.perf_counter() - start, response.status_code, len(body), body[:300].decode("utf-8", "replace")
+
+    # One warm-up request so imports and first-call setup aren't measured. The result
+    # caches are bypassed (CACHE_BYPASS), so measured requests still do the full work
+    warmup = send(0)
+    metrics.STAGE_LATENCY.clear()
+    rss_before = _rss_mb()
+
+    with _StageRssSampler(metrics.STAGES_IN_FLIGHT) as sampler, ThreadPoolExecutor(spec["concurrency"]) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(send, range(spec["requests"])))
+        elapsed = time.perf_counter() - start
+
+    latencies = [r[0] for r in results]
+    errors = [r for r in results if r[1] >= 400]
+    if len(errors) == len(results):
+        return {
+            "scenario": spec["name"], "endpoint": spec["path"],
+            "failed": f"all {len(results)} requests failed, last with {errors[-1][1]}: {errors[-1][3]}",
+        }
+    return {
+        "scenario": spec["name"],
+        "endpoint": spec["path"],
+        "requests": spec["requests"],
+        "concurrency": spec["concurrency"],
+        "errors": len(errors),
+        "warmup_status": warmup[1],
+        "throughput_rps": round(len(results) / elapsed, 3),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "rss_start_mb": round(rss_before, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "stages": {
+            name: {**timing, "peak_rss_mb": round(sampler.peaks.get(name, 0.0), 1)}
+            for name, timing in _stage_timings(metrics.STAGE_LATENCY).items()
+        },
+    }
+
+
+def run_scenario(spec, env):
+    """Run a scenario in a fresh worker process and parse its JSON result."""
+    # The app logs JSON to stdout, so results come back through a file instead
+    with tempfile.TemporaryDirectory() as work_dir:
+        spec_path = os.path.join(work_dir, "spec.json")
+        result_path = os.path.join(work_dir, "result.json")
+        with open(spec_path, "w") as spec_file:
+            json.dump({**spec, "output": result_path}, spec_file)
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", spec_path],
+            env=env, capture_output=True, text=True)
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            output = (completed.stderr or completed.stdout).strip()
+            return {"scenario": spec["name"], "endpoint": spec["path"], "failed": output[-2000:]}
+        with open(result_path) as result_file:
+            return json.load(result_file)
+
+
+def compare(results, baseline, tolerance):
+    """Return human readable regressions against a previous --json output."""
+    previous = {r["scenario"]: r for r in baseline if "failed" not in r}
+    regressions = []
+    for result in results:
+        old = previous.get(result["scenario"])
+        if old is None or "failed" in result:
+            continue
+        for key in ("p50_ms", "p99_ms", "peak_rss_mb"):
+            if old[key] and result[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{result['scenario']}: {key} {old[key]} -> {result[key]}")
+        if result["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{result['scenario']}: throughput_rps {old['throughput_rps']} -> {result['throughput_rps']}")
+    return regressions
+
+
+def print_report(results):
+    print(f"{'scenario':<18} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>8} {'errors':>6}")
+    for result in results:
+        if "failed" in result:
+            print(f"{result['scenario']:<18} FAILED: {result['failed'].splitlines()[-1] if result['failed'] else ''}")
+            continue
+        print(f"{result['scenario']:<18} {result['throughput_rps']:>8} {result['p50_ms']:>9} {result['p99_ms']:>9} "
+              f"{result['peak_rss_mb']:>8} {result['errors']:>6}")
+        for name, timing in sorted(result["stages"].items(), key=lambda item: -item[1]["total_s"]):
+            print(f"    {name:<22} n={timing['count']:<5} mean={timing['mean_ms']:>9} ms  peak={timing['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help="Directory for the synthetic corpus (generated if missing)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Corpus size multiplier")
+    parser.add_argument("--only", nargs="*", help="Scenario name prefixes to run")
+    parser.add_argument("--requests", type=int, help="Override the request count of every scenario")
+    parser.add_argument("--concurrency", type=int, help="Override the concurrency of every scenario")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Fake OpenAI latency per call")
+    parser.add_argument("--whisper-ms-per-mb", type=float, default=150.0)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Previous --json output to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before failing")
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker) as spec_file:
+            spec = json.load(spec_file)
+        result = run_worker(spec)
+        with open(spec["output"], "w") as out:
+            json.dump(result, out)
+        return
+
+    from corpus import build_corpus
+    from fake_openai import FakeOpenAIConfig, start_server
+
+    corpus_dir = args.corpus or os.path.join(tempfile.gettempdir(), "api-benchmark-corpus")
+    print(f"Building corpus in {corpus_dir}")
+    corpus = build_corpus(corpus_dir, args.scale)
+
+    server, base_url = start_server(config=FakeOpenAIConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4, whisper_ms_per_mb=args.whisper_ms_per_mb))
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "fake-key",
+        "AUTH_SECRET_KEY": AUTH_TOKEN,
+        "LOG_LEVEL": "WARNING",
+        "TRACE_EXPORT": "none",
+        "PROFILE_SAMPLE_RATE": "0",
+        # Every request repeats the warm-up's inputs, cached results would skip the work being measured
+        "CACHE_BYPASS": "transcription,image,pdf_page,openai_file",
+    })
+
+    results = []
+    for name, path, keys, form, requests, concurrency in SCENARIOS:
+        if args.only and not any(name.startswith(prefix) for prefix in args.only):
+            continue
+        files = [corpus[key] for key in keys if key in corpus]
+        if not files:
+            print(f"Skipping {name}: corpus files {keys} unavailable")
+            continue
+        spec = {
+            "name": name, "path": path, "files": files, "form": form,
+            "requests": args.requests or requests, "concurrency": args.concurrency or concurrency,
+        }
+        print(f"Running {name} ({spec['requests']} requests, concurrency {spec['concurrency']})")
+        results.append(run_scenario(spec, env))
+    server.shutdown()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(results, out, indent=2)
+
+    failed = [r for r in results if "failed" in r]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+def compact_segments(segments, offset=0.0):
+    """Reduce Whisper segments or words to plain dicts, shifted by a chunk offset.
+
+    Args:
+        segments: Segment or word objects from a verbose_json transcription
+        offset: Start of the chunk within the uploaded audio, in seconds
+
+    Returns:
+        List of {"start", "end", "text"} (or "word") dicts
+    """
+    compact = []
+    for segment in segments or []:
+        entry = {
+            "start": round(float(_field(segment, "start")) + offset, 3),
+            "end": round(float(_field(segment, "end")) + offset, 3),
+        }
+        word = _field(segment, "word")
+        if word is not None:
+            entry["word"] = word
+        else:
+            entry["text"] = (_field(segment, "text") or "").strip()
+        compact.append(entry)
+    return compact
+
+
+def remap_timestamps(entries, timestamp_map):
+    """Map segment times from silence-stripped audio back to the original recording."""
+    if timestamp_map is None:
+        return entries
+    for entry in entries:
+        entry["start"] = round(timestamp_map.to_original(entry["start"]), 3)
+        entry["end"] = round(timestamp_map.to_original(entry["end"]), 3)
+    return entries
+
+
+def _field(item, name):
+    if isinstance(item, dict):
+        return item.get(name)
+    return getattr(item, name, None)
+
+
+def _timestamp(seconds, separator):
+    milliseconds = max(0, int(round(seconds * 1000)))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def to_srt(segments):
+    """Render segments as SubRip captions."""
+    blocks = []
+    for index, segment in enumerate(segments, start=1):
+        blocks.append(
+            f"{index}\n{_timestamp(segment['start'], ',')} --> {_timestamp(segment['end'], ',')}\n{segment['text']}\n")
+    return "\n".join(blocks)
+
+
+def to_vtt(segments):
+    """Render segments as WebVTT captions."""
+    blocks = ["WEBVTT\n"]
+    for segment in segments:
+        blocks.append(f"{_timestamp(segment['start'], '.')} --> {_timestamp(segment['end'], '.')}\n{segment['text']}\n")
+    return "\n".join(blocks)
+
+
+def render_captions(segments, caption_format):
+    """Render segments as ``srt`` or ``vtt`` captions."""
+    if caption_format == "srt":
+        return to_srt(segments or [])
+    return to_vtt(segments or [])
@@ -0,0 +1,170 @@
+import logging
+import os
+
+from resampling import TARGET_RATE, load_mono
+from vad import VAD_THRESHOLD_DB
+
+# Speaker embeddings are MFCC statistics over windows of this length, taken every hop
+DIARIZATION_WINDOW_SECONDS = float(os.getenv("DIARIZATION_WINDOW_SECONDS", "1.5"))
+DIARIZATION_HOP_SECONDS = float(os.getenv("DIARIZATION_HOP_SECONDS", "0.75"))
+# Clusters closer than this cosine distance are merged into one speaker
+DIARIZATION_THRESHOLD = float(os.getenv("DIARIZATION_THRESHOLD", "0.6"))
+DIARIZATION_MAX_SPEAKERS = int(os.getenv("DIARIZATION_MAX_SPEAKERS", "8"))
+# Longer recordings are first reduced to this many k-means centroids before the
+# hierarchical clustering, which is quadratic in the number of points
+DIARIZATION_MAX_POINTS = 400
+
+N_MFCC = 20
+HOP_LENGTH = TARGET_RATE // 100
+
+logger = logging.getLogger(__name__)
+
+
+def window_embeddings(samples, sample_rate=TARGET_RATE):
+    """Per-window MFCC mean and standard deviation, from one MFCC pass over the recording.
+
+    Returns:
+        (embeddings, window start times in seconds, speech mask) with one row per window
+    """
+    import librosa
+    import numpy as np
+
+    mfcc = librosa.feature.mfcc(y=samples, sr=sample_rate, n_mfcc=N_MFCC, n_fft=400, hop_length=HOP_LENGTH)
+    # c0 is mostly loudness, leave it out so distance from the microphone matters less
+    features = mfcc[1:].T.astype(np.float64)
+    energy_db = 10 * np.log10(librosa.feature.rms(y=samples, frame_length=400, hop_length=HOP_LENGTH)[0] ** 2 + 1e-10)
+    frames = min(len(features), len(energy_db))
+    features, energy_db = features[:frames], energy_db[:frames]
+
+    frames_per_second = sample_rate / HOP_LENGTH
+    window = max(1, int(DIARIZATION_WINDOW_SECONDS * frames_per_second))
+    hop = max(1, int(DIARIZATION_HOP_SECONDS * frames_per_second))
+    if frames < window:
+        return np.zeros((0, 2 * features.shape[1])), np.zeros(0), np.zeros(0, dtype=bool)
+    starts = np.arange(0, frames - window + 1, hop)
+
+    # Window sums from cumulative sums, so every window costs the same regardless of its length
+    zero = np.zeros((1, features.shape[1]))
+    cumulative = np.concatenate([zero, np.cumsum(features, axis=0)])
+    cumulative_sq = np.concatenate([zero, np.cumsum(features ** 2, axis=0)])
+    mean = (cumulative[starts + window] - cumulative[starts]) / window
+    variance = (cumulative_sq[starts + window] - cumulative_sq[starts]) / window - mean ** 2
+    embeddings = np.hstack([mean, np.sqrt(np.maximum(variance, 0))])
+
+    floor = np.percentile(energy_db, 10)
+    speech_frames = np.concatenate([[0], np.cumsum(energy_db > floor + VAD_THRESHOLD_DB)])
+    speech = (speech_frames[starts + window] - speech_frames[starts]) / window >= 0.5
+    return embeddings, starts / frames_per_second, speech
+
+
+def cluster_embeddings(embeddings, num_speakers=None):
+    """Cluster window embeddings into speakers.
+
+    Average linkage on cosine distance after per-dimension standardization. The tree
+    is cut into ``num_speakers`` clusters when given, otherwise at DIARIZATION_THRESHOLD.
+
+    Returns:
+        Cluster label per embedding, starting at 0
+    """
+    import numpy as np
+    from scipy.cluster.hierarchy import fcluster, linkage
+    from scipy.cluster.vq import kmeans2
+
+    if len(embeddings) == 0:
+        return np.zeros(0, dtype=int)
+    if len(embeddings) == 1:
+        return np.zeros(1, dtype=int)
+    points = (embeddings - embeddings.mean(axis=0)) / (embeddings.std(axis=0) + 1e-8)
+
+    assignment = np.arange(len(points))
+    if len(points) > DIARIZATION_MAX_POINTS:
+        centroids, assignment = kmeans2(points, DIARIZATION_MAX_POINTS, minit='++', seed=0)
+        used = np.unique(assignment)
+        centroids = centroids[used]
+        assignment = np.searchsorted(used, assignment)
+        points = centroids
+
+    tree = linkage(points, method='average', metric='cosine')
+    if num_speakers:
+        labels = fcluster(tree, t=min(num_speakers, len(points)), criterion='maxclust')
+    else:
+        labels = fcluster(tree, t=DIARIZATION_THRESHOLD, criterion='distance')
+        if labels.max() > DIARIZATION_MAX_SPEAKERS:
+            labels = fcluster(tree, t=DIARIZATION_MAX_SPEAKERS, criterion='maxclust')
+    return labels[assignment] - 1
+
+
+def _smooth(labels, width=5):
+    """Majority vote over neighbouring windows, so single window flips don't become turns."""
+    import numpy as np
+
+    if len(labels) < width:
+        return labels
+    half = width // 2
+    padded = np.concatenate([labels[:1].repeat(half), labels, labels[-1:].repeat(half)])
+    votes = np.cumsum(np.eye(labels.max() + 1, dtype=np.int32)[padded], axis=0)
+    votes = np.concatenate([np.zeros((1, votes.shape[1]), dtype=np.int32), votes])
+    return (votes[width:] - votes[:-width]).argmax(axis=1)
+
+
+def diarize(audio_path, num_speakers=None):
+    """Find who spoke when in a recording.
+
+    Args:
+        audio_path: Path to the audio, in the timeline transcript segments refer to
+        num_speakers: Expected number of speakers, estimated when None
+
+    Returns:
+        List of {"start", "end", "speaker"} turns, speakers named SPEAKER_1, SPEAKER_2, ...
+        in order of first appearance
+    """
+    samples = load_mono(audio_path)
+    embeddings, starts, speech = window_embeddings(samples)
+    if not speech.any():
+        return []
+    labels = _smooth(cluster_embeddings(embeddings[speech], num_speakers))
+    starts = starts[speech]
+
+    # Renumber by first appearance
+    order = {}
+    for label in labels:
+        order.setdefault(label, len(order) + 1)
+
+    turns = []
+    half_hop = DIARIZATION_HOP_SECONDS / 2
+    for start, label in zip(starts, labels):
+        # A window stands for the hop around its centre
+        centre = start + DIARIZATION_WINDOW_SECONDS / 2
+        begin, end = centre - half_hop, centre + half_hop
+        speaker = f"SPEAKER_{order[label]}"
+        if turns and turns[-1]["speaker"] == speaker and begin - turns[-1]["end"] < DIARIZATION_HOP_SECONDS:
+            turns[-1]["end"] = round(end, 3)
+        else:
+            turns.append({"start": round(max(0.0, begin), 3), "end": round(end, 3), "speaker": speaker})
+    logger.info("Diarized recording", extra={
+        "speakers": len(order), "turns": len(turns), "seconds": round(len(samples) / TARGET_RATE, 1)})
+    return turns
+
+
+def assign_speakers(segments, turns):
+    """Label each transcript segment with the speaker whose turns overlap it most."""
+    for segment in segments or []:
+        overlap = {}
+        for turn in turns:
+            shared = min(segment["end"], turn["end"]) - max(segment["start"], turn["start"])
+            if shared > 0:
+                overlap[turn["speaker"]] = overlap.get(turn["speaker"], 0) + shared
+        segment["speaker"] = max(overlap, key=overlap.get) if overlap else None
+    return segments
+
+
+def speaker_transcript(segments):
+    """Join segments into speaker labelled paragraphs, one per change of speaker."""
+    paragraphs = []
+    for segment in segments or []:
+        speaker = segment.get("speaker") or "UNKNOWN"
+        if paragraphs and paragraphs[-1][0] == speaker:
+            paragraphs[-1][1].append(segment["text"])
+        else:
+            paragraphs.append((speaker, [segment["text"]]))
+    return "\n\n".join(f"{speaker}: {' '.join(texts)}" for speaker, texts in paragraphs)
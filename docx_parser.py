@@ -0,0 +1,192 @@
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+def _w(tag):
+    return f'{{{W_NS}}}{tag}'
+
+P = _w('p')
+T = _w('t')
+TAB = _w('tab')
+BR = _w('br')
+CR = _w('cr')
+TBL = _w('tbl')
+TR = _w('tr')
+TC = _w('tc')
+BODY = _w('body')
+PSTYLE = _w('pStyle')
+OUTLINE_LVL = _w('outlineLvl')
+GRID_SPAN = _w('gridSpan')
+VAL = _w('val')
+
+HEADING_STYLE_RE = re.compile(r'^heading\s*(\d)$', re.IGNORECASE)
+
+
+def _load_heading_styles(archive):
+    """Map paragraph style ids to heading levels using word/styles.xml.
+
+    Style ids are localized (e.g. ``berschrift1``) so we resolve them through
+    the style names, which Word always writes as ``heading N`` / ``Title``.
+    """
+    levels = {}
+    try:
+        with archive.open('word/styles.xml') as styles_file:
+            for _, elem in ET.iterparse(styles_file, events=('end',)):
+                if elem.tag != _w('style'):
+                    continue
+                style_id = elem.get(_w('styleId'))
+                name_elem = elem.find(_w('name'))
+                name = name_elem.get(VAL, '') if name_elem is not None else ''
+                for candidate in (name, style_id or ''):
+                    match = HEADING_STYLE_RE.match(candidate.replace(' ', ''))
+                    if candidate.lower() == 'title':
+                        levels[style_id] = 1
+                        break
+                    if match:
+                        levels[style_id] = int(match.group(1))
+                        break
+                elem.clear()
+    except KeyError:
+        pass
+    return levels
+
+
+def _escape_cell(text):
+    return text.replace('|', '\\|').replace('\n', '<br>').strip()
+
+
+def iter_docx_blocks(file):
+    """Stream the blocks of a DOCX file in document order.
+
+    Parses ``word/document.xml`` with ``iterparse`` and releases every
+    top-level element once it has been emitted, so memory stays bounded by
+    the largest single paragraph or table rather than the whole document.
+
+    Args:
+        file: Path or binary file object of the DOCX archive
+
+    Yields:
+        ``('heading', level, text)``, ``('paragraph', text)`` or
+        ``('table', rows)`` tuples where ``rows`` is a list of cell lists
+    """
+    with zipfile.ZipFile(file) as archive:
+        heading_styles = _load_heading_styles(archive)
+        with archive.open('word/document.xml') as document_xml:
+            body = None
+            paragraphs = []  # stack of (text parts, heading level) for nested paragraphs
+            tables = []      # stack of tables, each a list of rows
+            rows = []        # stack of rows in progress, one per open table
+            cells = []       # stack of cells in progress, each a list of paragraph texts
+            spans = []       # stack of gridSpan values for open cells
+
+            for event, elem in ET.iterparse(document_xml, events=('start', 'end')):
+                tag = elem.tag
+                if event == 'start':
+                    if tag == BODY:
+                        body = elem
+                    elif tag == P:
+                        paragraphs.append([[], None])
+                    elif tag == TBL:
+                        tables.append([])
+                    elif tag == TR:
+                        rows.append([])
+                    elif tag == TC:
+                        cells.append([])
+                        spans.append(1)
+                    continue
+
+                if tag == T:
+                    if paragraphs and elem.text:
+                        paragraphs[-1][0].append(elem.text)
+                elif tag == TAB:
+                    if paragraphs:
+                        paragraphs[-1][0].append('\t')
+                elif tag in (BR, CR):
+                    if paragraphs:
+                        paragraphs[-1][0].append('\n')
+                elif tag == PSTYLE:
+                    if paragraphs:
+                        level = heading_styles.get(elem.get(VAL))
+                        if level is not None:
+                            paragraphs[-1][1] = level
+                elif tag == OUTLINE_LVL:
+                    if paragraphs and paragraphs[-1][1] is None:
+                        try:
+                            paragraphs[-1][1] = int(elem.get(VAL, '9')) + 1
+                        except ValueError:
+                            pass
+                elif tag == GRID_SPAN:
+                    if spans:
+                        try:
+                            spans[-1] = max(1, int(elem.get(VAL, '1')))
+                        except ValueError:
+                            pass
+                elif tag == P:
+                    parts, level = paragraphs.pop()
+                    text = ''.join(parts)
+                    if paragraphs:
+                        # Text boxes nest paragraphs inside paragraphs
+                        if text.strip():
+                            paragraphs[-1][0].append(' ' + text)
+                    elif cells:
+                        cells[-1].append(text)
+                    elif text.strip():
+                        if level is not None and level <= 9:
+                            yield ('heading', min(level, 6), text.strip())
+                        else:
+                            yield ('paragraph', text)
+                elif tag == TC:
+                    cell_text = '\n'.join(t for t in cells.pop() if t.strip())
+                    span = spans.pop()
+                    if rows:
+                        rows[-1].append(cell_text)
+                        rows[-1].extend([''] * (span - 1))
+                elif tag == TR:
+                    row = rows.pop()
+                    if tables:
+                        tables[-1].append(row)
+                elif tag == TBL:
+                    table = tables.pop()
+                    if cells:
+                        # Nested tables are flattened into their parent cell
+                        cells[-1].append('\n'.join(' / '.join(c for c in row if c) for row in table))
+                    elif table:
+                        yield ('table', table)
+
+                if body is not None and not paragraphs and not tables and tag in (P, TBL):
+                    # Drop processed top-level blocks so the tree never grows
+                    body.clear()
+
+
+def table_to_markdown(rows):
+    """Render a list of cell rows as a Markdown table."""
+    width = max(len(row) for row in rows)
+    lines = []
+    for index, row in enumerate(rows):
+        cells = [_escape_cell(cell) for cell in row] + [''] * (width - len(row))
+        lines.append('| ' + ' | '.join(cells) + ' |')
+        if index == 0:
+            lines.append('|' + '---|' * width)
+    return '\n'.join(lines)
+
+
+def extract_docx_text(file):
+    """Extract paragraphs, headings and tables from a DOCX file as Markdown.
+
+    Args:
+        file: Path or binary file object of the DOCX archive
+
+    Returns:
+        Document text with headings as ``#`` lines and tables as Markdown tables
+    """
+    parts = []
+    for block in iter_docx_blocks(file):
+        if block[0] == 'heading':
+            parts.append('#' * block[1] + ' ' + block[2])
+        elif block[0] == 'paragraph':
+            parts.append(block[1])
+        else:
+            parts.append(table_to_markdown(block[1]))
+    return '\n\n'.join(parts)
@@ -0,0 +1,142 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+# Processes per API worker for audio decoding, filtering and encoding, 0 runs the work inline.
+# The default splits the cores between the gunicorn workers
+DSP_WORKERS = int(os.getenv(
+    "DSP_WORKERS", str(max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY", "1"))))))
+# Audio is denoised in spans of this many seconds, spread over the pool
+DSP_SPAN_SECONDS = int(os.getenv("DSP_SPAN_SECONDS", "30"))
+
+# Imported once by the fork server, so pool processes start with them loaded
+PRELOAD_MODULES = ["audio_dsp", "numpy", "scipy.signal", "soundfile", "librosa"]
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class SharedSamples:
+    """A float32 sample buffer in shared memory, attached to by name in pool processes.
+
+    The creator owns the segment and unlinks it on close. Views from ``array()``
+    must be dropped before closing.
+    """
+
+    def __init__(self, length, name=None):
+        self.length = length
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, length * 4))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+    def array(self):
+        import numpy as np
+
+        return np.ndarray((self.length,), dtype=np.float32, buffer=self.shm.buf)
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # A view is still alive (e.g. held by a traceback), the mapping goes away with it
+            pass
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Forking the threaded API process is unsafe, workers come from a fork server instead
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(PRELOAD_MODULES)
+            else:
+                context = multiprocessing.get_context("spawn")
+            _executor = ProcessPoolExecutor(max_workers=DSP_WORKERS, mp_context=context)
+            logger.info("Started DSP pool", extra={"workers": DSP_WORKERS})
+        return _executor
+
+
+def _reset_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_all(calls):
+    """Run (fn, *args) tuples on the DSP pool and return their results in order.
+
+    Runs inline when DSP_WORKERS is 0. A pool whose process died (e.g. killed for
+    memory) is replaced on the next call.
+    """
+    if DSP_WORKERS <= 0:
+        return [call[0](*call[1:]) for call in calls]
+    executor = _get_executor()
+    try:
+        futures = [executor.submit(*call) for call in calls]
+        wait(futures)
+        return [future.result() for future in futures]
+    except BrokenProcessPool:
+        logger.warning("DSP pool broke, it is restarted for the next request")
+        _reset_executor(executor)
+        raise
+
+
+def run(fn, *args):
+    """Run fn(*args) on the DSP pool and wait for the result."""
+    return run_all([(fn, *args)])[0]
+
+
+def submit(fn, *args):
+    """Start fn(*args) on the DSP pool and return its future, so other work can overlap it."""
+    if DSP_WORKERS <= 0:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    executor = _get_executor()
+    try:
+        return executor.submit(fn, *args)
+    except BrokenProcessPool:
+        logger.warning("DSP pool broke, it is restarted for the next request")
+        _reset_executor(executor)
+        raise
+
+
+def spans(length, sample_rate):
+    """Split ``length`` samples into (start, end) spans of DSP_SPAN_SECONDS."""
+    step = max(1, DSP_SPAN_SECONDS * sample_rate)
+    return [(start, min(length, start + step)) for start in range(0, length, step)]
+
+
+def _start():
+    executor = _get_executor()
+    for _ in range(DSP_WORKERS):
+        executor.submit(os.getpid)
+
+
+def start():
+    """Start the pool processes on a thread, so they are up before the first audio request."""
+    if DSP_WORKERS > 0:
+        threading.Thread(target=_start, name="dsp-pool-start", daemon=True).start()
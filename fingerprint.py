@@ -0,0 +1,318 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from metrics import record_cache
+from resampling import TARGET_RATE, load_mono, resample
+from shared_cache import CACHE_URL, sqlite_connection
+
+AUDIO_FINGERPRINTS = os.getenv("AUDIO_FINGERPRINTS", "true").lower() == "true"
+# Landmark hashes kept per recording: the smallest values after mixing (a bottom-k sketch)
+FINGERPRINT_SIZE = int(os.getenv("FINGERPRINT_SIZE", "512"))
+# Sketch entries two recordings must share, at a consistent time offset, to count as duplicates
+FINGERPRINT_MIN_MATCHES = int(os.getenv("FINGERPRINT_MIN_MATCHES", "24"))
+# Re-encoded copies have the same length; candidates differing by more than this fraction are ignored
+FINGERPRINT_DURATION_TOLERANCE = 0.02
+# Recordings kept in the in-process index, least recently indexed or matched are evicted first
+FINGERPRINT_INDEX_MAX_RECORDINGS = int(os.getenv("FINGERPRINT_INDEX_MAX_RECORDINGS", "512"))
+
+# Spectral peaks are picked on an 8 kHz spectrogram with 32 ms hops
+FINGERPRINT_RATE = 8000
+N_FFT = 512
+HOP_LENGTH = 256
+PEAKS_PER_SECOND = 15
+FAN_OUT = 4
+MAX_DELTA_FRAMES = 63
+CHUNK_SECONDS = 60
+
+Fingerprint = namedtuple('Fingerprint', ['hashes', 'times', 'duration'])
+FingerprintMatch = namedtuple('FingerprintMatch', ['digest', 'matches', 'offset'])
+
+logger = logging.getLogger(__name__)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _peaks(magnitude_db, frames_per_second):
+    """Local spectrogram maxima, keeping the strongest PEAKS_PER_SECOND in each second."""
+    import numpy as np
+    from scipy.ndimage import maximum_filter
+
+    local_max = maximum_filter(magnitude_db, size=(15, 9), mode='constant', cval=-np.inf) == magnitude_db
+    local_max &= magnitude_db > np.median(magnitude_db) + 10
+    freqs, frames = np.nonzero(local_max)
+    strength = magnitude_db[freqs, frames]
+    second = (frames // max(1, int(frames_per_second))).astype(np.int64)
+    # Strongest first within each second, then keep the first PEAKS_PER_SECOND of each group
+    order = np.lexsort((-strength, second))
+    second = second[order]
+    group_start = np.flatnonzero(np.concatenate([[True], second[1:] != second[:-1]]))
+    rank = np.arange(len(order)) - np.repeat(group_start, np.diff(np.append(group_start, len(order))))
+    keep = order[rank < PEAKS_PER_SECOND]
+    by_time = np.lexsort((freqs[keep], frames[keep]))
+    return freqs[keep][by_time], frames[keep][by_time]
+
+
+def compute_fingerprint(audio_path):
+    """Landmark fingerprint of a recording from pairs of spectral peaks.
+
+    Each peak is paired with the next FAN_OUT peaks; a pair hashes the two peak
+    frequencies and their distance in time, which survives re-encoding. Only
+    the FINGERPRINT_SIZE smallest mixed hashes are kept, so two copies of the
+    same audio keep largely the same entries whatever their length.
+    """
+    import numpy as np
+    from scipy import signal
+
+    samples = resample(load_mono(audio_path), TARGET_RATE, FINGERPRINT_RATE)
+    duration = len(samples) / FINGERPRINT_RATE
+
+    # Peaks are picked a minute at a time to bound memory; the chunks overlap so their
+    # STFT frames tile the recording without gaps
+    chunk = CHUNK_SECONDS * FINGERPRINT_RATE // HOP_LENGTH * HOP_LENGTH
+    peak_freqs = []
+    peak_frames = []
+    for start in range(0, len(samples), chunk):
+        piece = samples[start:start + chunk + N_FFT - HOP_LENGTH]
+        if len(piece) < N_FFT:
+            break
+        _, _, spectrum = signal.stft(piece, nperseg=N_FFT, noverlap=N_FFT - HOP_LENGTH, boundary=None, padded=False)
+        magnitude_db = 20 * np.log10(np.abs(spectrum) + 1e-6)
+        freqs, frames = _peaks(magnitude_db, FINGERPRINT_RATE / HOP_LENGTH)
+        peak_freqs.append(freqs)
+        peak_frames.append(frames + start // HOP_LENGTH)
+    if not peak_freqs:
+        return Fingerprint([], [], duration)
+    freqs = np.concatenate(peak_freqs)
+    frames = np.concatenate(peak_frames)
+
+    hashes = []
+    times = []
+    for step in range(1, FAN_OUT + 1):
+        delta = frames[step:] - frames[:-step]
+        valid = (delta > 0) & (delta <= MAX_DELTA_FRAMES)
+        landmark = (freqs[:-step][valid].astype(np.uint64) << np.uint64(15)) | (
+            freqs[step:][valid].astype(np.uint64) << np.uint64(6)) | delta[valid].astype(np.uint64)
+        hashes.append(landmark)
+        times.append(frames[:-step][valid])
+    if not hashes or not sum(len(h) for h in hashes):
+        return Fingerprint([], [], duration)
+    landmarks = np.concatenate(hashes)
+    anchors = np.concatenate(times)
+    # Mix the 24 bit landmarks over 63 bits, so the smallest values are a random sample of them
+    with np.errstate(over='ignore'):
+        mixed = (landmarks * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(1)
+    values, first = np.unique(mixed, return_index=True)
+    return Fingerprint(
+        values[:FINGERPRINT_SIZE].astype(np.int64).tolist(), anchors[first[:FINGERPRINT_SIZE]].tolist(), duration)
+
+
+class _MemoryIndex:
+    """Inverted index from hash to (recording, time) postings, per process.
+
+    Recordings expire with their transcription's TTL, and beyond ``max_recordings``
+    the least recently used are evicted along with their postings.
+    """
+
+    def __init__(self, max_recordings=FINGERPRINT_INDEX_MAX_RECORDINGS):
+        self.max_recordings = max_recordings
+        self.postings = {}
+        # digest -> (duration, expires_at, hashes), oldest first
+        self.recordings = OrderedDict()
+        self.lock = threading.Lock()
+
+    def candidates(self, hashes):
+        now = time.time()
+        with self.lock:
+            rows = []
+            for hash_value in hashes:
+                for digest, anchor in self.postings.get(hash_value, ()):
+                    duration, expires_at, _ = self.recordings[digest]
+                    if expires_at is None or expires_at > now:
+                        rows.append((hash_value, digest, anchor, duration))
+                        self.recordings.move_to_end(digest)
+            return rows
+
+    def add(self, digest, fingerprint, ttl):
+        now = time.time()
+        with self.lock:
+            if digest in self.recordings:
+                # Already indexed, keep it as long as its transcription
+                duration, _, hashes = self.recordings.pop(digest)
+                self.recordings[digest] = (duration, now + ttl if ttl else None, hashes)
+                return
+            self.recordings[digest] = (fingerprint.duration, now + ttl if ttl else None, fingerprint.hashes)
+            for hash_value, anchor in zip(fingerprint.hashes, fingerprint.times):
+                self.postings.setdefault(hash_value, []).append((digest, anchor))
+            expired = [key for key, (_, expires_at, _) in self.recordings.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            while len(self.recordings) > self.max_recordings:
+                self._remove(next(iter(self.recordings)))
+
+    def _remove(self, digest):
+        _, _, hashes = self.recordings.pop(digest)
+        for hash_value in hashes:
+            postings = [posting for posting in self.postings.get(hash_value, ()) if posting[0] != digest]
+            if postings:
+                self.postings[hash_value] = postings
+            else:
+                self.postings.pop(hash_value, None)
+
+
+class _SqliteIndex:
+    """Inverted index in the cache's SQLite file, looked up through a B-tree on the hash."""
+
+    def __init__(self, path):
+        self.path = path
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprint_recordings "
+            "(id INTEGER PRIMARY KEY, digest TEXT UNIQUE, duration REAL, expires_at REAL)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprint_hashes (hash INTEGER, recording INTEGER, time INTEGER)")
+        connection.execute("CREATE INDEX IF NOT EXISTS fingerprint_hashes_hash ON fingerprint_hashes (hash)")
+
+    def _connection(self):
+        return sqlite_connection(self.path)
+
+    def candidates(self, hashes):
+        connection = self._connection()
+        rows = []
+        # Stay under SQLite's bound parameter limit
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            rows.extend(connection.execute(
+                "SELECT h.hash, r.digest, h.time, r.duration FROM fingerprint_hashes h "
+                "JOIN fingerprint_recordings r ON r.id = h.recording "
+                f"WHERE h.hash IN ({','.join('?' * len(batch))}) AND (r.expires_at IS NULL OR r.expires_at > ?)",
+                (*batch, time.time())).fetchall())
+        return rows
+
+    def add(self, digest, fingerprint, ttl):
+        connection = self._connection()
+        now = time.time()
+        with connection:
+            connection.execute("BEGIN")
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO fingerprint_recordings (digest, duration, expires_at) VALUES (?, ?, ?)",
+                (digest, fingerprint.duration, now + ttl if ttl else None))
+            if cursor.rowcount == 0:
+                # Already indexed, keep it as long as its transcription
+                connection.execute(
+                    "UPDATE fingerprint_recordings SET expires_at = ? WHERE digest = ?",
+                    (now + ttl if ttl else None, digest))
+                return
+            connection.executemany(
+                "INSERT INTO fingerprint_hashes VALUES (?, ?, ?)",
+                [(hash_value, cursor.lastrowid, anchor) for hash_value, anchor in zip(fingerprint.hashes, fingerprint.times)])
+        # Expired recordings are removed on a fraction of writes
+        if random.random() < 0.01:
+            with connection:
+                connection.execute("BEGIN")
+                connection.execute(
+                    "DELETE FROM fingerprint_hashes WHERE recording IN "
+                    "(SELECT id FROM fingerprint_recordings WHERE expires_at < ?)", (now,))
+                connection.execute("DELETE FROM fingerprint_recordings WHERE expires_at < ?", (now,))
+
+
+class _RedisIndex:
+    """One Redis sorted set of postings per hash, shared between hosts.
+
+    Postings are scored by their expiry time. A key's own TTL is renewed by every
+    recording added to it, so expired postings are also trimmed by score on each write.
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=2)
+
+    def candidates(self, hashes):
+        now = time.time()
+        pipeline = self.client.pipeline(transaction=False)
+        for hash_value in hashes:
+            pipeline.zrangebyscore(f"fingerprint:postings:{hash_value}", now, "+inf")
+        rows = []
+        for hash_value, members in zip(hashes, pipeline.execute()):
+            for member in members:
+                digest, anchor, duration = member.decode().split("|")
+                rows.append((hash_value, digest, int(anchor), float(duration)))
+        return rows
+
+    def add(self, digest, fingerprint, ttl):
+        now = time.time()
+        expires_at = now + ttl if ttl else float("inf")
+        pipeline = self.client.pipeline(transaction=False)
+        for hash_value, anchor in zip(fingerprint.hashes, fingerprint.times):
+            key = f"fingerprint:postings:{hash_value}"
+            pipeline.zremrangebyscore(key, "-inf", now)
+            pipeline.zadd(key, {f"{digest}|{anchor}|{fingerprint.duration}": expires_at})
+            if ttl:
+                pipeline.expire(key, ttl)
+        pipeline.execute()
+
+
+def _get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            if CACHE_URL.startswith("sqlite://"):
+                _index = _SqliteIndex(CACHE_URL[len("sqlite://"):])
+            elif CACHE_URL.startswith(("redis://", "rediss://", "unix://")):
+                _index = _RedisIndex(CACHE_URL)
+            else:
+                _index = _MemoryIndex()
+        return _index
+
+
+def find_duplicate(fingerprint, exclude=None):
+    """Find an indexed recording with the same audio as ``fingerprint``.
+
+    Only postings of the fingerprint's own hashes are read, so the cost depends on
+    the sketch size rather than on the number of indexed recordings. Candidates
+    need FINGERPRINT_MIN_MATCHES shared hashes at one time offset and a similar
+    duration. Errors are logged and treated as no match.
+
+    Returns:
+        FingerprintMatch or None
+    """
+    if len(fingerprint.hashes) < FINGERPRINT_MIN_MATCHES:
+        return None
+    times = dict(zip(fingerprint.hashes, fingerprint.times))
+    try:
+        rows = _get_index().candidates(list(times))
+    except Exception as e:
+        logger.warning("Fingerprint lookup failed: %s", e)
+        rows = []
+
+    # Votes per (recording, offset in 64 ms bins): copies of one recording line up at one offset
+    votes = Counter()
+    for hash_value, digest, anchor, duration in rows:
+        if digest == exclude:
+            continue
+        if abs(duration - fingerprint.duration) > FINGERPRINT_DURATION_TOLERANCE * max(duration, 1.0):
+            continue
+        votes[(digest, (times[hash_value] - anchor) // 2)] += 1
+    best = votes.most_common(1)
+    match = None
+    if best and best[0][1] >= FINGERPRINT_MIN_MATCHES:
+        (digest, offset_bin), count = best[0]
+        match = FingerprintMatch(digest, count, round(offset_bin * 2 * HOP_LENGTH / FINGERPRINT_RATE, 2))
+    record_cache("fingerprint", match is not None)
+    return match
+
+
+def index_fingerprint(digest, fingerprint, ttl=None):
+    """Add a transcribed recording to the fingerprint index."""
+    if not fingerprint.hashes:
+        return
+    try:
+        _get_index().add(digest, fingerprint, ttl)
+    except Exception as e:
+        logger.warning("Fingerprint indexing failed: %s", e)
@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from dotenv import load_dotenv
+
+# WEB_CONCURRENCY, MAX_REQUESTS and the other settings below may come from .env
+load_dotenv(override=True)
+
+# Production server: gunicorn managing uvicorn workers.
+#   gunicorn -c gunicorn.conf.py main:app
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count(), 4))))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app (pandas, librosa, scipy, pypdf, ...) once in the master and fork the
+# workers from it, so the loaded modules are shared copy-on-write
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+# Recycle workers after a number of requests to bound memory growth from fragmentation
+# and native library caches; the jitter keeps them from restarting all at once
+max_requests = int(os.getenv("MAX_REQUESTS", "500"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "50"))
+
+# Long video transcriptions run for minutes; recycled workers get time to finish them
+timeout = int(os.getenv("WORKER_TIMEOUT", "900"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "300"))
+keepalive = 5
+
+# Access logs are written by the app as JSON
+accesslog = None
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+# Both must be set before the app and prometheus_client are imported, which happens
+# right after this file is loaded when preloading
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus-multiproc"))
+os.environ.setdefault("CACHE_URL", f"sqlite://{os.path.join(tempfile.gettempdir(), 'api-cache.db')}")
+# Lets the app split the cores between workers, e.g. for the DSP process pools
+os.environ.setdefault("WEB_CONCURRENCY", str(workers))
+# Import the heavy libraries in the master too, a warm-up thread must not be running at fork
+os.environ.setdefault("WARM_IMPORTS", "preload" if preload_app else "background")
+# Samples from a previous run would otherwise be summed into this one
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
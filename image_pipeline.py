@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import os
+from collections import namedtuple
+from io import BytesIO
+
+from shared_cache import SharedCache
+
+# Vision models fit high detail images into 2048x2048 and then scale the short side to 768,
+# low detail images are seen at 512x512. Anything beyond that is upload overhead.
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+LOW_DETAIL_SIDE = 512
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "256"))
+
+IMAGE_MIME_TYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'jpg': 'image/jpeg',
+    'webp': 'image/webp',
+    'gif': 'image/gif',
+}
+
+PreparedImage = namedtuple('PreparedImage', ['url', 'mime_type', 'detail', 'width', 'height', 'size'])
+
+_cache = SharedCache("image", max_entries=IMAGE_CACHE_SIZE)
+
+
+def _fit_size(width, height, detail):
+    """Return the size the model will actually look at for the given detail level."""
+    if detail == 'low':
+        scale = min(1.0, LOW_DETAIL_SIDE / max(width, height))
+    else:
+        scale = min(1.0, HIGH_DETAIL_MAX_SIDE / max(width, height), HIGH_DETAIL_SHORT_SIDE / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _choose_detail(width, height):
+    # Images that already fit the low detail tile lose nothing at low detail
+    return 'low' if max(width, height) <= LOW_DETAIL_SIDE else 'high'
+
+
+def _encode(image, fmt):
+    buffered = BytesIO()
+    if fmt == 'PNG':
+        image.save(buffered, format='PNG', optimize=True)
+    else:
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(buffered, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buffered.getvalue()
+
+
+def prepare_pil_image(image, detail=None, fmt='JPEG'):
+    """Downscale a decoded image to the model's effective resolution and encode it.
+
+    Args:
+        image: PIL image
+        detail: ``low`` or ``high``, chosen from the image size when omitted
+        fmt: Output format, ``JPEG`` or ``PNG``
+
+    Returns:
+        PreparedImage with a base64 data URL
+    """
+    if detail is None:
+        detail = _choose_detail(*image.size)
+    target = _fit_size(image.width, image.height, detail)
+    if target != image.size:
+        from PIL import Image
+
+        image = image.resize(target, Image.LANCZOS)
+    data = _encode(image, fmt)
+    mime_type = 'image/png' if fmt == 'PNG' else 'image/jpeg'
+    url = f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+    return PreparedImage(url, mime_type, detail, image.width, image.height, len(data))
+
+
+def prepare_image_bytes(data, fileExt=None, detail=None, stream=None):
+    """Decode, downscale and re-encode uploaded image bytes, caching by content hash.
+
+    Images already within the effective resolution and without an EXIF rotation
+    are sent as-is with their real MIME type. Larger ones are resized once; PNGs with transparency or a
+    palette stay PNG and everything else is re-encoded as JPEG.
+
+    Args:
+        data: Raw image bytes, or a buffer of them
+        fileExt: Extension of the upload, used as a hint for the source format
+        detail: Force ``low`` or ``high`` detail instead of choosing by size
+        stream: Seekable file object holding the same bytes, decoded instead of a copy of ``data``
+
+    Returns:
+        PreparedImage with a base64 data URL and the detail level to request
+    """
+    key = f"{hashlib.sha256(data).hexdigest()}:{detail}"
+    prepared = _cache.get(key)
+    if prepared is not None:
+        return prepared
+
+    from PIL import Image, ImageOps
+
+    image = Image.open(stream if stream is not None else BytesIO(data))
+    source_format = (image.format or (fileExt or 'jpeg')).upper()
+    # The original bytes are only usable when their pixels are already upright
+    upright = image.getexif().get(0x0112, 1) == 1
+    image = ImageOps.exif_transpose(image)
+    if detail is None:
+        detail = _choose_detail(*image.size)
+    target = _fit_size(image.width, image.height, detail)
+
+    if target == image.size and upright and source_format.lower() in IMAGE_MIME_TYPES:
+        # Already at or below the effective resolution, ship the original bytes
+        mime_type = IMAGE_MIME_TYPES[source_format.lower()]
+        url = f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+        prepared = PreparedImage(url, mime_type, detail, image.width, image.height, len(data))
+    else:
+        keep_png = source_format == 'PNG' and image.mode in ('RGBA', 'LA', 'P', '1')
+        prepared = prepare_pil_image(image, detail, 'PNG' if keep_png else 'JPEG')
+
+    _cache.set(key, prepared)
+    return prepared
+
+
+def prepare_image(file, fileExt):
+    """Read an uploaded image file object and prepare it for a vision request.
+
+    A MappedFile is hashed and decoded through its mapping, without copying it.
+    """
+    try:
+        if hasattr(file, 'getbuffer'):
+            file.seek(0)
+            return prepare_image_bytes(file.getbuffer(), fileExt, stream=file)
+        return prepare_image_bytes(file.read(), fileExt)
+    except Exception as e:
+        raise ValueError(f"Unable to decode image: {e}")
@@ -0,0 +1,149 @@
+import os
+import signal
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from docx_parser import extract_docx_text
+
+# Maximum number of converter processes running at once
+LEGACY_CONVERTER_WORKERS = int(os.getenv("LEGACY_CONVERTER_WORKERS", "2"))
+# Seconds a single conversion may take before it is killed
+LEGACY_CONVERTER_TIMEOUT = float(os.getenv("LEGACY_CONVERTER_TIMEOUT", "30"))
+# Address space limit for converter processes, in MB
+LEGACY_CONVERTER_MEMORY_MB = int(os.getenv("LEGACY_CONVERTER_MEMORY_MB", "1024"))
+
+LEGACY_EXTENSIONS = ['doc', 'dot']
+
+_converter_slots = threading.BoundedSemaphore(LEGACY_CONVERTER_WORKERS)
+
+
+def _with_limits(command):
+    """Prefix the command with prlimit to cap its memory and CPU time.
+
+    The limits are set by prlimit, which then execs the converter, rather than by a
+    preexec_fn: that runs Python in the forked child, which isn't safe while other
+    threads of the worker hold locks, and runs the fork hooks registered there.
+    """
+    prlimit = shutil.which("prlimit")
+    if prlimit is None:
+        return command
+    memory = LEGACY_CONVERTER_MEMORY_MB * 1024 * 1024
+    cpu = int(LEGACY_CONVERTER_TIMEOUT) + 1
+    return [prlimit, f"--as={memory}", f"--cpu={cpu}", "--", *command]
+
+
+def _run_sandboxed(command, work_dir):
+    """Run a converter with a clean environment, private working directory and timeout."""
+    env = {
+        "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+        "HOME": work_dir,
+        "TMPDIR": work_dir,
+        "LANG": "C.UTF-8",
+    }
+    acquired = _converter_slots.acquire(timeout=LEGACY_CONVERTER_TIMEOUT)
+    if not acquired:
+        raise ValueError("Document converter is busy, try again later")
+    try:
+        process = subprocess.Popen(
+            _with_limits(command),
+            cwd=work_dir,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+    except OSError as e:
+        _converter_slots.release()
+        raise ValueError(f"Document converter could not be started: {e}")
+    try:
+        stdout, stderr = process.communicate(timeout=LEGACY_CONVERTER_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        # The converter leads its own session; kill the whole group, soffice forks helpers
+        _kill_group(process)
+        raise ValueError(f"Document conversion timed out after {LEGACY_CONVERTER_TIMEOUT:.0f} seconds")
+    except BaseException:
+        _kill_group(process)
+        raise
+    finally:
+        _converter_slots.release()
+    if process.returncode != 0:
+        raise ValueError(f"Document converter failed: {stderr.decode('utf-8', errors='replace').strip()[:200]}")
+    return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
+
+
+def _kill_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.communicate()
+
+
+def _convert_with_antiword(path, work_dir):
+    result = _run_sandboxed(["antiword", "-w", "0", "-m", "UTF-8.txt", path], work_dir)
+    return result.stdout.decode("utf-8", errors="replace")
+
+
+def _convert_with_soffice(path, work_dir):
+    binary = shutil.which("soffice") or shutil.which("libreoffice")
+    _run_sandboxed([
+        binary,
+        f"-env:UserInstallation=file://{work_dir}/profile",  # Private profile, no shared lock files
+        "--headless", "--norestore", "--nologo",
+        "--convert-to", "docx",
+        "--outdir", work_dir,
+        path,
+    ], work_dir)
+    converted = os.path.join(work_dir, os.path.splitext(os.path.basename(path))[0] + ".docx")
+    if not os.path.exists(converted):
+        raise ValueError("Document converter produced no output")
+    return extract_docx_text(converted)
+
+
+def available_converter():
+    """Return the name of the legacy document converter installed locally, if any."""
+    if shutil.which("antiword"):
+        return "antiword"
+    if shutil.which("soffice") or shutil.which("libreoffice"):
+        return "soffice"
+    return None
+
+
+def extract_legacy_document_text(file, fileExt):
+    """Extract text from a legacy Word binary (.doc/.dot) document.
+
+    An upload already on disk (a MappedFile) is read from its path, anything else
+    is copied to a private temp directory first. It is converted by a
+    locally installed converter (antiword, or LibreOffice as a fallback)
+    running in a resource limited subprocess. At most
+    ``LEGACY_CONVERTER_WORKERS`` conversions run at the same time.
+
+    Args:
+        file: Binary file object of the uploaded document
+        fileExt: File extension of the upload
+
+    Returns:
+        Document text
+
+    Raises:
+        ValueError: No converter is installed, or the conversion failed, timed out or was killed
+    """
+    converter = available_converter()
+    if converter is None:
+        raise ValueError("No converter for legacy Word documents is installed")
+
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            path = getattr(file, "name", None)
+            if not isinstance(path, str) or not os.path.isfile(path):
+                path = os.path.join(work_dir, f"document.{fileExt}")
+                with open(path, "wb") as out:
+                    shutil.copyfileobj(file, out)
+            if converter == "antiword":
+                return _convert_with_antiword(path, work_dir)
+            return _convert_with_soffice(path, work_dir)
+    except (OSError, subprocess.SubprocessError) as e:
+        raise ValueError(f"Document conversion failed: {e}")
@@ -1,30 +1,42 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header
+from dotenv import load_dotenv
+
+# Local modules read their configuration from the environment when imported, so .env
+# has to be loaded before any of them
+load_dotenv(override=True)
+
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
 import openai
-from dotenv import load_dotenv
-from pypdf import PdfReader
 from typing import Annotated
-from docx import Document
-import base64
-import tempfile
 from enum import Enum
-from markdown_pdf import MarkdownPdf, Section
-from striprtf.striprtf import rtf_to_text
-import pandas as pd
 import os
-from util import parseDocuments, upload_file, parseDocumentsV2, parseDocumentsWithVector
+from util import parseDocuments, parseDocumentsV2, parseDocumentsWithVector, createResponsePdf, uploadResponsePdf, uploadPdfToOpenAI, buildUserContent, toResponsesContent
 from system_prompts import SYSTEM_PROMPT, SYSTEM_PROMPT_V2, AUDIO_TRANSCRIPTION_PROMPT
 from whisper_service import WhisperService
+from captions import render_captions
+from diarization import DIARIZATION_MAX_SPEAKERS, speaker_transcript
+from streaming import StreamingSegmenter, StreamingTranscription
 import json
+import logging
 from pydantic import BaseModel
-from uuid import uuid4
+from telemetry import RequestContextMiddleware, configure_logging
+from metrics import MetricsMiddleware, endpoint_name, record_usage, render_metrics, stage
+from profiling import ADMIN_SECRET_KEY, ProfilingMiddleware, get_profile, recent_profiles
+from batch_processing import collect_batch_files, stream_batch, submit_openai_batch, get_openai_batch
+from admission import admit, estimate_cost
+import dsp_pool
+from warmup import WARM_IMPORTS, start_background_warmup, warm_imports
+from uploads import mapped_upload
+from model_router import choose_model
+from sessions import SESSION_TTL, create_session, delete_session, get_session, save_turn, session_context, session_turn
 
 class ResponseSchema(BaseModel):
     response: str
     file_response: str
 
-load_dotenv(override=True)
+configure_logging()
+logger = logging.getLogger(__name__)
 AUTH_SECRET_KEY = os.getenv("AUTH_SECRET_KEY")
 
 app = FastAPI()
@@ -37,16 +49,79 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware, endpoint_name=endpoint_name)
+app.add_middleware(RequestContextMiddleware)
+
+# Format and DSP libraries are imported on first use. Preloading imports them before the
+# workers fork, otherwise they are warmed on a thread once the server is up
+if WARM_IMPORTS == "preload":
+    warm_imports()
+
+@app.on_event("startup")
+def warmImports():
+    if WARM_IMPORTS == "background":
+        start_background_warmup()
+    if WARM_IMPORTS != "off":
+        dsp_pool.start()
 
 class ResponseType(str, Enum):
     pdf = "pdf"
     string = "string"
 
+class TimestampGranularity(str, Enum):
+    none = "none"
+    segment = "segment"
+    word = "word"
+
+# How PDF pages are given to the model: extracted text, rendered images, or text with
+# only the pages that have no text layer rendered
+class PdfMode(str, Enum):
+    text = "text"
+    image = "image"
+    hybrid = "hybrid"
+
+class CaptionFormat(str, Enum):
+    srt = "srt"
+    vtt = "vtt"
+
 class ModelType(str, Enum):
     gpt4o = "gpt-4o"
     gpt4omini = "gpt-4o-mini"
+    auto = "auto"
+
+def resolveModel(model_name, prompt, documentText='', images=0):
+    """The requested model, or the router's choice for model_name=auto."""
+    if model_name is not ModelType.auto:
+        return model_name
+    return choose_model(prompt, documentText, images).model
+
+def isPdf(upload):
+    return upload is not None and upload.filename.split('.')[-1].lower() == 'pdf'
 
 MODEL = 'gpt-4o'
+
+# Structured output of the Responses API endpoints
+FILE_TEXT_RESPONSE_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "file_text_response",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "response": {
+                    "type": "string"
+                },
+                "file_response": {
+                    "type": "string"
+                }
+            },
+            "required": ["response", "file_response"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
 # Document formats
 DOC_EXTENSIONS = ['doc', 'dot', 'docx', 'dotx', 'docm', 'dotm', 'pdf', 'rtf', 'xlsx', 'xls', 'txt']
 # Image formats
@@ -66,89 +141,51 @@ def health():
         "message": "Backend Healthy"
     }
 
+# Prometheus metrics end point
+@app.get("/metrics")
+def metrics():
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+def checkAdmin(admin_key):
+    if not ADMIN_SECRET_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if admin_key != ADMIN_SECRET_KEY:
+        raise HTTPException(status_code=401, detail="Provide the correct admin key in headers")
+
+# Most recent request profiles
+@app.get("/admin/profiles")
+def listProfiles(x_admin_key: Annotated[str | None, Header()] = None):
+    checkAdmin(x_admin_key)
+    return {
+        "status": "success",
+        "profiles": recent_profiles()
+    }
+
+# Profile output: folded stacks for flamegraphs, or cProfile stats
+@app.get("/admin/profiles/{profile_id}")
+def getProfile(profile_id: int, format: str = "folded", x_admin_key: Annotated[str | None, Header()] = None):
+    checkAdmin(x_admin_key)
+    session = get_profile(profile_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "json":
+        return {"status": "success", **session.summary()}
+    content = session.stats() if session.mode == "cprofile" else session.folded()
+    return Response(content=content, media_type="text/plain")
+
 # Chat completion end point
 @app.post("/v1/chat-completion")
-def chatCompletion(prompt: Annotated[str, Form()], response_type: Annotated[ResponseType, Form()] = ResponseType.string, model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None):
-    MODEL = model_name
-    documentText = ''
-    b64 = None
-
+def chatCompletion(prompt: Annotated[str, Form()], response_type: Annotated[ResponseType, Form()] = ResponseType.string, model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None, pdf_mode: Annotated[PdfMode, Form()] = PdfMode.text):
     if not authorization or (authorization != AUTH_SECRET_KEY):
-        print(f"Authorization header: {authorization}")
+        logger.warning("Rejected request with a missing or invalid authorization header")
         raise HTTPException(
             status_code=401, detail="Provide the correct authorization token in headers")
 
-    if file is not None:
-        fileExt = file.filename.split('.')[-1].lower()
-        if fileExt not in SUPPORTED_EXTENSIONS:
-            raise HTTPException(400, f"{fileExt} file type not supported")
-        if fileExt == 'pdf':
-            reader = PdfReader(file.file)
-            for page in reader.pages:
-                extracted_text = page.extract_text(extraction_mode='layout')
-                if len(extracted_text.strip()) == 0:
-                    extracted_text = page.extract_text()
-                documentText += extracted_text
-                documentText += '\n\n'
-            if len(documentText.strip()) == 0:
-                raise HTTPException(
-                    status_code=400, detail="Unable to parse text from the given document or the document does not contain any text.")
-        elif fileExt in ['png', 'jpeg', 'jpg']:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                path = f"{temp_dir}/filename.{fileExt}"
-                with open(path, 'wb') as img:
-                    img.write(file.file.read())
-                with open(path, 'rb') as img:
-                    b64 = base64.b64encode(img.read()).decode("utf-8")
-        elif fileExt in ['rtf']:
-            documentText = rtf_to_text(file.file.read().decode('utf-8'))
-        elif fileExt in ['xls', 'xlsx']:
-            try:
-                excelDF = None
-                if sheet_names is None or len(sheet_names) == 0:
-                    excelDF = pd.read_excel(file.file)
-                    documentText = excelDF.to_string()
-                else:
-                    sheet_name_arr = list(map(lambda x: x.strip(), sheet_names.split(',')))
-                    excelDF = pd.read_excel(file.file, sheet_name=sheet_name_arr)
-                    if not isinstance(excelDF, dict):
-                        raise HTTPException(400, "Something went wrong while parsing the excel sheet")
-                    for key in excelDF:
-                        documentText += f'Sheet Name: {key}\n\n'
-                        documentText += excelDF[key].to_string()
-                        documentText += '\n\n'
-            except Exception as exp:
-                print(exp)
-                raise HTTPException(400, "Worksheet name not found")
-        elif fileExt == 'txt':
-            documentText += file.file.read().decode('utf-8')
-        else:
-            try:
-                document = Document(file.file)
-            except Exception as e:
-                print("Something went wrong while parsing the file:", e)
-                raise HTTPException(400, detail="The file could not be parsed")
-            for paragraph in document.paragraphs:
-                documentText += paragraph.text if paragraph and paragraph.text else ""
-            # Note: Table processing is currently disabled
-    # for elem in document.tables:
-    #     textRow = set()
-    #     for i, row in enumerate(elem.columns):
-    #         for cell in row.cells:
-    #             textRow.add(f"{cell.text}\n")
-    #     text += f"{' '.join(list(textRow))}\n\n"
-    # print(text)
-    userContent = [
-        {
-            "type": "text",
-            "text": ""
-        }
-    ]
-
-    if len(documentText) > 0:
-        userContent[0]['text'] = f"User prompt:\n{prompt}\n\nThis is document content: \n{documentText}"
-    elif b64 is not None:
-        userContent[0]['text'] = prompt
+    with mapped_upload(file) as upload, admit(estimate_cost(upload, rasterize=pdf_mode is not PdfMode.text)):
+        documentText, image, base64_urls = parseDocuments(upload, sheet_names, pdf_mode is PdfMode.image, pdf_mode is PdfMode.hybrid)
+    MODEL = resolveModel(model_name, prompt, documentText, (image is not None) + len(base64_urls))
+    userContent = buildUserContent(prompt, documentText if file is not None else '', image, base64_urls)
 
     messages = [
         {
@@ -163,46 +200,42 @@ def chatCompletion(prompt: Annotated[str, Form()], response_type: Annotated[Resp
 
     if file is None:
         messages = messages[1:]
-        userContent[0]['text'] = prompt
 
-    if b64 is not None:
-        userContent.append({
-            "type": "image_url",
-            "image_url": {"url": f"data:image/jpeg;base64,{b64}"}
-        })
-
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=messages
-    )
+    with stage("openai_chat", MODEL):
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=messages
+        )
+    usage = record_usage(MODEL, response.usage)
 
     if response_type is ResponseType.pdf:
-        pdf = MarkdownPdf(toc_level=2)
         content = response.choices[0].message.content
-        pdf.add_section(Section(content))
-        pdf.save(f"response.pdf")
+        createResponsePdf(content, "response.pdf")
         return FileResponse(f"response.pdf",
                             media_type="application/pdf")
     
     return {
         "status": "success",
         "prompt": prompt,
-        "response": response.choices[0].message.content
+        "response": response.choices[0].message.content,
+        "usage": usage
     }
 
 # With Responses API and no Vector Store
 @app.post("/v2/chat-completion")
-def chatCompletionV2(prompt: Annotated[str, Form()], model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None, temperature: Annotated[float, Form()] = 0.6):
+def chatCompletionV2(prompt: Annotated[str, Form()], model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None, temperature: Annotated[float, Form()] = 0.6, previous_response_id: Annotated[str | None, Form()] = None):
     if temperature < 0 or temperature > 2:
         raise HTTPException(
             status_code=400, detail="Temperature value is invalid. 0 <= temperature <= 2"
         )
     if not authorization or (authorization != AUTH_SECRET_KEY):
-        print(f"Authorization header: {authorization}")
+        logger.warning("Rejected request with a missing or invalid authorization header")
         raise HTTPException(
             status_code=401, detail="Provide the correct authorization token in headers")
-    MODEL = model_name
-    documentText, b64, pdf_file_id = parseDocumentsV2(file, sheet_names, client=client)
+    # PDFs are only uploaded to OpenAI, which doesn't need admission capacity
+    with mapped_upload(file) as upload, admit(None if isPdf(upload) else estimate_cost(upload)):
+        documentText, image, pdf_file_id = parseDocumentsV2(upload, sheet_names, client=client)
+    MODEL = resolveModel(model_name, prompt, documentText, (image is not None) + (pdf_file_id is not None))
     userContent = []
 
     if pdf_file_id:
@@ -210,113 +243,64 @@ def chatCompletionV2(prompt: Annotated[str, Form()], model_name: Annotated[Model
             "type": "input_file",
             "file_id": pdf_file_id,
         })
-    newPrompt = ""
-    if len(documentText) > 0 and pdf_file_id is None:
-        newPrompt = f"User prompt:\n{prompt}\n\nThis is document content parsed from a file: \n{documentText}"
-    else:
-        newPrompt = prompt
+    userContent += toResponsesContent(buildUserContent(
+        prompt, documentText if pdf_file_id is None else '', image,
+        contentLabel="This is document content parsed from a file"))
 
-        userContent.append({
-
-        "type": "input_text",
-        "text": newPrompt,
-    })
-
-    if b64 is not None:
-        userContent.append({
-            "type": "input_image",
-            "image_url": f"data:image/jpeg;base64,{b64}",
-        })
-    
 
     try:
-        response = client.responses.create(
-            model=MODEL,
-            instructions=SYSTEM_PROMPT_V2,
-            text={
-                "format": {
-                    "type": "json_schema",
-                    "name": "file_text_response",
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "response": {
-                                "type": "string"
-                            },
-                            "file_response": {
-                                "type": "string"
-                            }
-                        },
-                        "required": ["response", "file_response"],
-                        "additionalProperties": False
-                    },
-                    "strict": True
-                }
-            },
-            input=[
-                {
-                    "role": "user",
-                    "content": userContent
-                }
-            ]
-        )
+        with stage("openai_responses", MODEL):
+            response = client.responses.create(
+                model=MODEL,
+                instructions=SYSTEM_PROMPT_V2,
+                text=FILE_TEXT_RESPONSE_FORMAT,
+                # Follow-up questions continue from an earlier answer without resending its document
+                previous_response_id=previous_response_id,
+                input=[
+                    {
+                        "role": "user",
+                        "content": userContent
+                    }
+                ]
+            )
+        usage = record_usage(MODEL, response.usage)
         content = json.loads(response.output_text)
     except Exception as e:
-        print(e)
-        raise HTTPException(500, detail=e)
+        logger.exception("Responses API call failed")
+        raise HTTPException(500, detail=str(e))
     
     download_link = None    
     if ("file_response" in content) and content['file_response'] is not None and content['file_response'] != '':
-        pdf = MarkdownPdf(toc_level=2)
-        pdf.add_section(Section(content['file_response']))
-        pdf.save(f"response.pdf")
-        file_name_s3 = str(uuid4()) + ".pdf"
-        download_link = upload_file('response.pdf', file_name_s3)
-        if not download_link:
-            # Generate dummy link if real upload fails or is disabled
-            dummy_uuid = str(uuid4())
-            download_link = f"https://dummy-s3-bucket.example.com/{dummy_uuid}/{file_name_s3}"
-            print(f"Using dummy download link: {download_link}")
+        download_link = uploadResponsePdf(content['file_response'])
 
     return {
         "status": "success",
         "prompt": prompt,
         "response": content['response'],
-        "pdf": download_link
+        "pdf": download_link,
+        "response_id": response.id,
+        "usage": usage
     }
 
 # With Responses API and Vector Store
 @app.post("/v3/chat-completion")
-def chatCompletionV3(prompt: Annotated[str, Form()], model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None, temperature: Annotated[float, Form()] = 0.6):
+def chatCompletionV3(prompt: Annotated[str, Form()], model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None, temperature: Annotated[float, Form()] = 0.6, previous_response_id: Annotated[str | None, Form()] = None):
     if temperature < 0 or temperature > 2:
         raise HTTPException(
             status_code=400, detail="Temperature value is invalid. 0 <= temperature <= 2"
         )
     if not authorization or (authorization != AUTH_SECRET_KEY):
-        print(f"Authorization header: {authorization}")
+        logger.warning("Rejected request with a missing or invalid authorization header")
         raise HTTPException(
             status_code=401, detail="Provide the correct authorization token in headers")
     
-    MODEL = model_name
-    documentText, b64, vector_store_id = parseDocumentsWithVector(file, sheet_names, client=client)
-    userContent = []
-
-    newPrompt = ""
-    if len(documentText) > 0 and vector_store_id is None:
-        newPrompt = f"User prompt:\n{prompt}\n\nThis is document content parsed from a file: \n{documentText}"
-    else:
-        newPrompt = prompt
-
-    userContent.append({
-        "type": "input_text",
-        "text": newPrompt,
-    })
-
-    if b64 is not None:
-        userContent.append({
-            "type": "input_image",
-            "image_url": f"data:image/jpeg;base64,{b64}",
-        })
+    # PDFs are only uploaded to a vector store, which doesn't need admission capacity
+    with mapped_upload(file) as upload, admit(None if isPdf(upload) else estimate_cost(upload)):
+        documentText, image, vector_store_id = parseDocumentsWithVector(upload, sheet_names, client=client)
+    MODEL = resolveModel(model_name, prompt, documentText if vector_store_id is None else '', image is not None)
+    userContent = toResponsesContent(buildUserContent(
+        prompt, documentText if vector_store_id is None else '', image,
+        contentLabel="This is document content parsed from a file"))
     tools = []
     if vector_store_id:
         tools.append({
@@ -326,87 +310,54 @@ def chatCompletionV3(prompt: Annotated[str, Form()], model_name: Annotated[Model
         })
 
     try:
-        response = client.responses.create(
-            model=MODEL,
-            instructions=SYSTEM_PROMPT_V2,
-            text={
-                "format": {
-                    "type": "json_schema",
-                    "name": "file_text_response",
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "response": {
-                                "type": "string"
-                            },
-                            "file_response": {
-                                "type": "string"
-                            }
-                        },
-                        "required": ["response", "file_response"],
-                        "additionalProperties": False
-                    },
-                    "strict": True
-                }
-            },
-            tools=tools,
-            input=[
-                {
-                    "role": "user",
-                    "content": userContent
-                }
-            ]
-        )
-        print(response.output[-1].content[-1].text)
+        with stage("openai_responses", MODEL):
+            response = client.responses.create(
+                model=MODEL,
+                instructions=SYSTEM_PROMPT_V2,
+                text=FILE_TEXT_RESPONSE_FORMAT,
+                tools=tools,
+                previous_response_id=previous_response_id,
+                input=[
+                    {
+                        "role": "user",
+                        "content": userContent
+                    }
+                ]
+            )
+        usage = record_usage(MODEL, response.usage)
         content = json.loads(response.output[-1].content[-1].text)
     except Exception as e:
-        print(e)
-        raise HTTPException(500, detail=e)
+        logger.exception("Responses API call failed")
+        raise HTTPException(500, detail=str(e))
     
     download_link = None    
     if ("file_response" in content) and content['file_response'] is not None and content['file_response'] != '':
-        pdf = MarkdownPdf(toc_level=2)
-        pdf.add_section(Section(content['file_response']))
-        pdf.save(f"response.pdf")
-        file_name_s3 = str(uuid4()) + ".pdf"
-        download_link = upload_file('response.pdf', file_name_s3)
-        if not download_link:
-            # Generate dummy link if real upload fails or is disabled
-            dummy_uuid = str(uuid4())
-            download_link = f"https://dummy-s3-bucket.example.com/{dummy_uuid}/{file_name_s3}"
-            print(f"Using dummy download link: {download_link}")
+        download_link = uploadResponsePdf(content['file_response'])
 
     return {
         "status": "success",
         "prompt": prompt,
         "response": content['response'],
-        "pdf": download_link
+        "pdf": download_link,
+        "response_id": response.id,
+        "usage": usage
     }
 
 @app.post("/v4/chat-completion")
-def chatCompletionV4(prompt: Annotated[str, Form()], model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None, temperature: Annotated[float, Form()] = 0.6):
+def chatCompletionV4(prompt: Annotated[str, Form()], model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None, temperature: Annotated[float, Form()] = 0.6, pdf_mode: Annotated[PdfMode, Form()] = PdfMode.text):
     if temperature < 0 or temperature > 2:
         raise HTTPException(
             status_code=400, detail="Temperature value is invalid. 0 <= temperature <= 2"
         )
     if not authorization or (authorization != AUTH_SECRET_KEY):
-        print(f"Authorization header: {authorization}")
+        logger.warning("Rejected request with a missing or invalid authorization header")
         raise HTTPException(
             status_code=401, detail="Provide the correct authorization token in headers")
     
-    MODEL = model_name
-    documentText, b64, _ = parseDocuments(file, sheet_names)
-    userContent = [
-        {
-            "type": "text",
-            "text": ""
-        }
-    ]
-
-    if len(documentText) > 0:
-        userContent[0]['text'] = f"User prompt:\n{prompt}\n\nThis is document content: \n{documentText}"
-    elif b64 is not None:
-        userContent[0]['text'] = prompt
+    with mapped_upload(file) as upload, admit(estimate_cost(upload, rasterize=pdf_mode is not PdfMode.text)):
+        documentText, image, base64_urls = parseDocuments(upload, sheet_names, pdf_mode is PdfMode.image, pdf_mode is PdfMode.hybrid)
+    MODEL = resolveModel(model_name, prompt, documentText, (image is not None) + len(base64_urls))
+    userContent = buildUserContent(prompt, documentText if file is not None else '', image, base64_urls)
 
     messages = [
         {
@@ -419,25 +370,18 @@ def chatCompletionV4(prompt: Annotated[str, Form()], model_name: Annotated[Model
         }
     ]
 
-    if file is None:
-        userContent[0]['text'] = prompt
-
-    if b64 is not None:
-        userContent.append({
-            "type": "image_url",
-            "image_url": {"url": f"data:image/jpeg;base64,{b64}"}
-        })
-
     response = {}
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            response_format={"type": "json_object"},
-            temperature=temperature
-        )
+        with stage("openai_chat", MODEL):
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=temperature
+            )
+        usage = record_usage(MODEL, response.usage)
     except openai.RateLimitError as e:
-        print(f"Rate limit error occurred: {e}")
+        logger.warning("Rate limit error occurred: %s", e)
         raise HTTPException(
             status_code=429, detail="OpenAI token limit exceeded")
 
@@ -445,48 +389,31 @@ def chatCompletionV4(prompt: Annotated[str, Form()], model_name: Annotated[Model
     content = json.loads(res_content)
     download_link = None    
     if ("file_response" in content) and content['file_response'] is not None:
-        pdf = MarkdownPdf(toc_level=2)
-        pdf.add_section(Section(content['file_response']))
-        pdf.save(f"response.pdf")
-        file_name_s3 = str(uuid4()) + ".pdf"
-        download_link = upload_file('response.pdf', file_name_s3)
-        if not download_link:
-            # Generate dummy link if real upload fails or is disabled
-            dummy_uuid = str(uuid4())
-            download_link = f"https://dummy-s3-bucket.example.com/{dummy_uuid}/{file_name_s3}"
-            print(f"Using dummy download link: {download_link}")
+        download_link = uploadResponsePdf(content['file_response'])
 
     return {
         "status": "success",
         "prompt": prompt,
         "response": content['response'],
-        "pdf": download_link
+        "pdf": download_link,
+        "usage": usage
     }
 
 @app.post("/v5/chat-completion")
-def chatCompletionV5(prompt: Annotated[str, Form()], model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None, temperature: Annotated[float, Form()] = 0.6):
+def chatCompletionV5(prompt: Annotated[str, Form()], model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, file: Annotated[UploadFile | None, File()] = None, sheet_names: Annotated[str | None, Form()] = None, authorization: Annotated[str | None, Header()] = None, temperature: Annotated[float, Form()] = 0.6, pdf_mode: Annotated[PdfMode, Form()] = PdfMode.image):
     if temperature < 0 or temperature > 2:
         raise HTTPException(
             status_code=400, detail="Temperature value is invalid. 0 <= temperature <= 2"
         )
     if not authorization or (authorization != AUTH_SECRET_KEY):
-        print(f"Authorization header: {authorization}")
+        logger.warning("Rejected request with a missing or invalid authorization header")
         raise HTTPException(
             status_code=401, detail="Provide the correct authorization token in headers")
     
-    MODEL = model_name
-    documentText, b64, base64_urls = parseDocuments(file, sheet_names, True)
-    userContent = [
-        {
-            "type": "text",
-            "text": ""
-        }
-    ]
-
-    if len(documentText) > 0:
-        userContent[0]['text'] = f"User prompt:\n{prompt}\n\nThis is document content: \n{documentText}"
-    elif b64 is not None:
-        userContent[0]['text'] = prompt
+    with mapped_upload(file) as upload, admit(estimate_cost(upload, rasterize=pdf_mode is not PdfMode.text)):
+        documentText, image, base64_urls = parseDocuments(upload, sheet_names, pdf_mode is PdfMode.image, pdf_mode is PdfMode.hybrid)
+    MODEL = resolveModel(model_name, prompt, documentText, (image is not None) + len(base64_urls))
+    userContent = buildUserContent(prompt, documentText if file is not None else '', image, base64_urls)
 
     messages = [
         {
@@ -499,57 +426,35 @@ def chatCompletionV5(prompt: Annotated[str, Form()], model_name: Annotated[Model
         }
     ]
 
-    if file is None:
-        userContent[0]['text'] = prompt
-
-    if b64 is not None:
-        userContent.append({
-            "type": "image_url",
-            "image_url": {"url": f"data:image/jpeg;base64,{b64}"}
-        })
-
-    if len(base64_urls) > 0:
-        for url in base64_urls:
-            userContent.append({
-                "type": "image_url",
-                "image_url": {"url": url, "detail": "low"},
-            })
-
     response = {}
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            response_format={"type": "json_object"},
-            temperature=temperature
-        )
+        with stage("openai_chat", MODEL):
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=temperature
+            )
+        usage = record_usage(MODEL, response.usage)
     except openai.RateLimitError as e:
-        print(f"Rate limit error occurred: {e}")
+        logger.warning("Rate limit error occurred: %s", e)
         raise HTTPException(
             status_code=429, detail="OpenAI token limit exceeded")
 
     res_content = response.choices[0].message.content
     content = json.loads(res_content)    
-    print(content)
+    logger.debug("Model response: %s", content)
     download_link = None
 
     if ("file_response" in content) and content['file_response'] is not None:
-        pdf = MarkdownPdf(toc_level=2)
-        pdf.add_section(Section(content['file_response']))
-        pdf.save(f"response.pdf")
-        file_name_s3 = str(uuid4()) + ".pdf"
-        download_link = upload_file('response.pdf', file_name_s3)
-        if not download_link:
-            # Generate dummy link if real upload fails or is disabled
-            dummy_uuid = str(uuid4())
-            download_link = f"https://dummy-s3-bucket.example.com/{dummy_uuid}/{file_name_s3}"
-            print(f"Using dummy download link: {download_link}")
+        download_link = uploadResponsePdf(content['file_response'])
 
     return {
         "status": "success",
         "prompt": prompt,
         "response": content['response'],
-        "pdf": download_link
+        "pdf": download_link,
+        "usage": usage
     }
 
 # Audio Transcription + Chat Completion - Following v5 Pattern
@@ -561,7 +466,12 @@ def audio_processing(
     authorization: Annotated[str | None, Header()] = None, 
     temperature: Annotated[float, Form()] = 0.6,
     remove_noise: Annotated[bool, Form()] = True,
-    force_english: Annotated[bool, Form()] = True
+    force_english: Annotated[bool, Form()] = True,
+    vad: Annotated[bool, Form()] = True,
+    timestamps: Annotated[TimestampGranularity, Form()] = TimestampGranularity.none,
+    caption_format: Annotated[CaptionFormat | None, Form()] = None,
+    diarize: Annotated[bool, Form()] = False,
+    num_speakers: Annotated[int | None, Form()] = None
 ):
     """
     Audio processing endpoint that follows the v5 pattern, but specialized for audio files.
@@ -572,8 +482,13 @@ def audio_processing(
     - model_name: GPT model to use for analysis (default: gpt-4o-mini)
     - authorization: Auth token
     - temperature: Controls randomness in GPT responses (0.0 to 2.0)
-    - remove_noise: Whether to apply noise removal to audio (default: True)
+    - remove_noise: Whether to apply noise removal to audio when it is noisy (default: True)
     - force_english: Whether to force English transcription (default: True)
+    - vad: Whether to strip long silences before transcription (default: True)
+    - timestamps: Return segment or word level timestamps: none, segment or word (default: none)
+    - caption_format: Also render the segments as srt or vtt captions (default: none)
+    - diarize: Label transcript segments with speakers (default: False)
+    - num_speakers: Expected number of speakers when diarizing, estimated when omitted
     Returns:
     - JSON with transcription, analysis response, and PDF download link if applicable
     """
@@ -583,70 +498,58 @@ def audio_processing(
         )
     
     if not authorization or (authorization != AUTH_SECRET_KEY):
-        print(f"Authorization header: {authorization}")
+        logger.warning("Rejected request with a missing or invalid authorization header")
         raise HTTPException(
             status_code=401,
             detail="Provide the correct authorization token in headers"
         )
 
+    if num_speakers is not None and not 1 <= num_speakers <= DIARIZATION_MAX_SPEAKERS:
+        raise HTTPException(
+            status_code=400, detail=f"num_speakers must be between 1 and {DIARIZATION_MAX_SPEAKERS}"
+        )
+
     # Check file extension for audio files
     fileExt = file.filename.split('.')[-1].lower()
     if fileExt not in AUDIO_EXTENSIONS and fileExt not in VIDEO_EXTENSIONS:
         supported_formats = ", ".join(AUDIO_EXTENSIONS + VIDEO_EXTENSIONS)
         raise HTTPException(400, f"{fileExt} file type not supported for audio processing. Supported formats: {supported_formats}")
     
-    MODEL = model_name
 
     try:
         # Initialize Whisper service for transcription
         whisper_service = WhisperService(client=client)
         transcription = None
-        temp_dir = None
-        temp_path = None
-        
-        try:
-            # Use temp directory for audio processing
-            temp_dir = tempfile.mkdtemp()
-            temp_path = os.path.join(temp_dir, file.filename)
-            
-            with open(temp_path, "wb") as buffer:
-                buffer.write(file.file.read())
-
-            # Try audio transcription with original settings
-            try:
-                transcription = whisper_service.transcribe_audio(
-                    temp_path,
-                    remove_noise=remove_noise,
-                    force_english=force_english
-                )
-            except Exception as transcription_error:
-                print(f"First transcription attempt failed: {transcription_error}")
-                # If that fails, try with noise removal disabled
-                transcription = whisper_service.transcribe_audio(
-                    temp_path,
-                    remove_noise=False,
-                    force_english=force_english
-                )
-        finally:
-            # Clean up temporary files
-            if temp_path and os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
-            if temp_dir and os.path.exists(temp_dir):
-                try:
-                    os.rmdir(temp_dir)
-                except:
-                    pass
+
+        # Captions and speaker labels need segments even when timestamps weren't asked for
+        granularity = None if timestamps == TimestampGranularity.none else timestamps.value
+        if (caption_format is not None or diarize) and granularity is None:
+            granularity = "segment"
+        # The decoders read the mapped copy of the upload by its path, it is removed afterwards
+        with mapped_upload(file) as upload:
+            # Retries with the decoded audio by itself if the denoised audio fails. Admission
+            # covers decoding and preparing the audio, not the Whisper requests
+            transcription = whisper_service.transcribe_audio(
+                upload.file.name,
+                remove_noise=remove_noise,
+                force_english=force_english,
+                vad=vad,
+                timestamps=granularity,
+                diarize=diarize,
+                num_speakers=num_speakers,
+                cost=estimate_cost(upload)
+            )
+
+        # Speaker labelled paragraphs let the model attribute what was said
+        speakerTranscript = speaker_transcript(whisper_service.segments) if whisper_service.speaker_turns else None
+        MODEL = resolveModel(model_name, prompt, speakerTranscript or transcription)
 
         # Setup the content for GPT processing - Following v5 pattern
-        userContent = [
-            {
-                "type": "text",
-                "text": f"User prompt:\n{prompt}\n\nThis is audio transcription content: \n{transcription}\n\nAudio processing details:\nNoise Removal: {remove_noise}\nForced English: {force_english}"
-            }
-        ]
+        userContent = buildUserContent(
+            prompt,
+            f"{speakerTranscript or transcription}\n\nAudio processing details:\nNoise Removal: {remove_noise}\nForced English: {force_english}",
+            contentLabel="This is audio transcription content"
+        )
 
         messages = [
             {
@@ -659,27 +562,20 @@ def audio_processing(
             }
         ]
 
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            response_format={"type": "json_object"},
-            temperature=temperature
-        )
+        with stage("openai_chat", MODEL):
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                response_format={"type": "json_object"},
+                temperature=temperature
+            )
+        usage = record_usage(MODEL, response.usage)
         res_content = response.choices[0].message.content
         content = json.loads(res_content)
-        print(content)
+        logger.debug("Model response: %s", content)
         download_link = None
         if ("file_response" in content) and content['file_response'] is not None:
-            pdf = MarkdownPdf(toc_level=2)
-            pdf.add_section(Section(content['file_response']))
-            pdf.save(f"response.pdf")
-            file_name_s3 = str(uuid4()) + ".pdf"
-            download_link = upload_file('response.pdf', file_name_s3)
-            if not download_link:
-                # Generate dummy link if real upload fails or is disabled
-                dummy_uuid = str(uuid4())
-                download_link = f"https://dummy-s3-bucket.example.com/{dummy_uuid}/{file_name_s3}"
-                print(f"Using dummy download link: {download_link}")
+            download_link = uploadResponsePdf(content['file_response'])
         
         # Return the response with transcription data and audio optimization details
         result = {
@@ -687,17 +583,247 @@ def audio_processing(
             "prompt": prompt,
             "response": content['response'],
             "pdf": download_link,
+            "usage": usage,
             "transcription": transcription,
+            "segments": whisper_service.segments,
+            "words": whisper_service.words,
+            "captions": render_captions(whisper_service.segments, caption_format.value) if caption_format else None,
+            "speakers": whisper_service.speaker_turns,
+            "speaker_transcript": speakerTranscript,
             "optimizations": {
                 "noise_removal": remove_noise,
-                "forced_english": force_english
+                "noise_removal_stats": whisper_service.noise_stats,
+                "forced_english": force_english,
+                "vad": vad,
+                "vad_stats": whisper_service.vad_stats,
+                "fingerprint_match": whisper_service.fingerprint_match
             }
         }
         return result
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in audio processing: {e}")
+        logger.exception("Error in audio processing")
         raise HTTPException(
             status_code=500,
             detail=f"Error processing audio request: {str(e)}"
         )
+
+
+# Live transcription over WebSocket
+@app.websocket("/v6/audio-stream")
+async def audioStream(
+    websocket: WebSocket,
+    sample_rate: int = 16000,
+    channels: int = 1,
+    encoding: str = "pcm_s16le",
+    force_english: bool = True,
+    authorization: Annotated[str | None, Header()] = None
+):
+    """
+    Stream raw PCM audio while it is recorded and receive transcripts as speech segments close.
+
+    Parameters (query string):
+    - sample_rate: Sample rate of the PCM frames (default: 16000)
+    - channels: Interleaved channel count (default: 1)
+    - encoding: pcm_s16le or pcm_f32le (default: pcm_s16le)
+    - force_english: Whether to force English transcription (default: True)
+    Authorization:
+    - The authorization header, or for clients that can't set headers (browsers) the
+      subprotocols ["bearer", "<token>"]. The token is never taken from the URL,
+      which ends up in access logs
+    Protocol:
+    - Send audio as binary messages and the text message "stop" when the recording ends
+    - Receive "partial" messages per transcribed segment, then one "final" message
+    """
+    subprotocols = websocket.scope.get("subprotocols") or []
+    token = subprotocols[1] if len(subprotocols) == 2 and subprotocols[0] == "bearer" else None
+    if (authorization or token) != AUTH_SECRET_KEY or not AUTH_SECRET_KEY:
+        logger.warning("Rejected stream with a missing or invalid authorization token")
+        await websocket.close(code=1008)
+        return
+    try:
+        segmenter = StreamingSegmenter(sample_rate, channels, encoding)
+    except ValueError as e:
+        await websocket.close(code=1003, reason=str(e))
+        return
+
+    # The handshake has to echo a subprotocol the client offered, never the token
+    await websocket.accept(subprotocol="bearer" if token else None)
+    await StreamingTranscription(websocket, client, segmenter, force_english).run()
+
+
+# Batch chat completion over many files - Following v4 pattern
+@app.post("/v7/batch-completion")
+def batchCompletion(
+    prompt: Annotated[str, Form()],
+    files: Annotated[list[UploadFile], File()],
+    model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini,
+    sheet_names: Annotated[str | None, Form()] = None,
+    authorization: Annotated[str | None, Header()] = None,
+    temperature: Annotated[float, Form()] = 0.6,
+    use_batch_api: Annotated[bool, Form()] = False
+):
+    """
+    Run the same prompt over many documents in one call.
+
+    Parameters:
+    - prompt: User prompt applied to every file
+    - files: Documents to process, zip archives are expanded
+    - model_name: GPT model to use (default: gpt-4o-mini)
+    - authorization: Auth token
+    - temperature: Controls randomness in GPT responses (0.0 to 2.0)
+    - use_batch_api: Submit through the OpenAI Batch API instead of answering now (default: False)
+    Returns:
+    - NDJSON stream with one result per file in completion order, or the
+      submitted batch id when use_batch_api is set
+    """
+    if temperature < 0 or temperature > 2:
+        raise HTTPException(
+            status_code=400, detail="Temperature value is invalid. 0 <= temperature <= 2"
+        )
+    if not authorization or (authorization != AUTH_SECRET_KEY):
+        raise HTTPException(
+            status_code=401, detail="Provide the correct authorization token in headers")
+
+    batch_files = collect_batch_files(files)
+    if len(batch_files) == 0:
+        raise HTTPException(400, "No files provided")
+
+    if use_batch_api:
+        return {
+            "status": "success",
+            "prompt": prompt,
+            **submit_openai_batch(client, batch_files, prompt, model_name.value, temperature, sheet_names)
+        }
+
+    return StreamingResponse(
+        stream_batch(client, batch_files, prompt, model_name.value, temperature, sheet_names),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/v7/batch-completion/{batch_id}")
+def batchCompletionStatus(batch_id: str, authorization: Annotated[str | None, Header()] = None):
+    if not authorization or (authorization != AUTH_SECRET_KEY):
+        raise HTTPException(
+            status_code=401, detail="Provide the correct authorization token in headers")
+    try:
+        return {
+            "status": "success",
+            **get_openai_batch(client, batch_id)
+        }
+    except openai.NotFoundError:
+        raise HTTPException(404, detail="Batch not found")
+
+# Sessions: parse a document once, then ask several questions about it
+@app.post("/v8/sessions")
+def createSession(file: Annotated[UploadFile, File()], sheet_names: Annotated[str | None, Form()] = None, pdf_mode: Annotated[PdfMode, Form()] = PdfMode.text, file_input: Annotated[bool, Form()] = False, authorization: Annotated[str | None, Header()] = None):
+    if not authorization or (authorization != AUTH_SECRET_KEY):
+        logger.warning("Rejected request with a missing or invalid authorization header")
+        raise HTTPException(
+            status_code=401, detail="Provide the correct authorization token in headers")
+
+    fileId = None
+    with mapped_upload(file) as upload:
+        with admit(estimate_cost(upload, rasterize=pdf_mode is not PdfMode.text)):
+            documentText, image, base64_urls = parseDocuments(upload, sheet_names, pdf_mode is PdfMode.image, pdf_mode is PdfMode.hybrid)
+        if file_input and isPdf(upload):
+            # The model reads the PDF itself on the first question
+            upload.file.seek(0)
+            fileId = uploadPdfToOpenAI(upload, client)
+    session = create_session(file.filename, documentText, image, base64_urls, fileId)
+
+    return {
+        "status": "success",
+        "session_id": session.session_id,
+        "filename": session.filename,
+        "characters": len(session.document_text),
+        "chunks": len(session.chunks),
+        "images": len(session.image_urls) + (session.image is not None),
+        "file_id": session.file_id,
+        "expires_in": SESSION_TTL
+    }
+
+@app.post("/v8/sessions/{session_id}/messages")
+def sessionMessage(session_id: str, prompt: Annotated[str, Form()], model_name: Annotated[ModelType, Form()] = ModelType.gpt4omini, temperature: Annotated[float, Form()] = 0.6, authorization: Annotated[str | None, Header()] = None):
+    if temperature < 0 or temperature > 2:
+        raise HTTPException(
+            status_code=400, detail="Temperature value is invalid. 0 <= temperature <= 2"
+        )
+    if not authorization or (authorization != AUTH_SECRET_KEY):
+        logger.warning("Rejected request with a missing or invalid authorization header")
+        raise HTTPException(
+            status_code=401, detail="Provide the correct authorization token in headers")
+    # Messages of one session are answered one at a time, each continues from the previous answer
+    with session_turn(session_id) as claimed:
+        if not claimed:
+            raise HTTPException(status_code=409, detail="Another message of this session is still being answered")
+        session = get_session(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        previousResponseId = session.previous_response_id
+
+        context = ''
+        if not session.file_id:
+            # Documents are sent once per response chain, later questions reach them through the chain
+            context, session = session_context(session, prompt)
+        firstTurn = session.previous_response_id is None
+        # The chain carries the document and its images on every turn, not only the first
+        MODEL = resolveModel(model_name, prompt, session.document_text, (session.image is not None) + len(session.image_urls) + (session.file_id is not None))
+        userContent = []
+        if session.file_id and firstTurn:
+            userContent.append({
+                "type": "input_file",
+                "file_id": session.file_id,
+            })
+
+        # Pages and images are sent with the first question of a chain, like the document
+        userContent += toResponsesContent(buildUserContent(
+            prompt, context, session.image if firstTurn else None, session.image_urls if firstTurn else (),
+            contentLabel="This is document content parsed from a file"))
+
+        try:
+            with stage("openai_responses", MODEL):
+                response = client.responses.create(
+                    model=MODEL,
+                    instructions=SYSTEM_PROMPT_V2,
+                    text=FILE_TEXT_RESPONSE_FORMAT,
+                    temperature=temperature,
+                    previous_response_id=session.previous_response_id,
+                    input=[
+                        {
+                            "role": "user",
+                            "content": userContent
+                        }
+                    ]
+                )
+            usage = record_usage(MODEL, response.usage)
+            content = json.loads(response.output_text)
+        except Exception as e:
+            logger.exception("Responses API call failed")
+            raise HTTPException(500, detail=str(e))
+        if not save_turn(session._replace(previous_response_id=response.id), previousResponseId):
+            raise HTTPException(status_code=409, detail="The session was changed by another message, send the prompt again")
+
+        download_link = None
+        if content.get('file_response'):
+            download_link = uploadResponsePdf(content['file_response'])
+
+        return {
+            "status": "success",
+            "session_id": session_id,
+            "prompt": prompt,
+            "response": content['response'],
+            "pdf": download_link,
+            "response_id": response.id,
+            "usage": usage
+        }
+
+@app.delete("/v8/sessions/{session_id}")
+def deleteSession(session_id: str, authorization: Annotated[str | None, Header()] = None):
+    if not authorization or (authorization != AUTH_SECRET_KEY):
+        raise HTTPException(
+            status_code=401, detail="Provide the correct authorization token in headers")
+    delete_session(session_id)
+    return {"status": "success", "session_id": session_id}
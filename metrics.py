@@ -0,0 +1,172 @@
+import os
+import time
+from contextlib import contextmanager
+
+from starlette.routing import Match
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+from profiling import profile_block
+from telemetry import span
+
+# Requests range from a cached text answer to minutes of video DSP
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+REQUEST_LATENCY = Histogram(
+    "api_request_duration_seconds", "End to end request latency",
+    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge(
+    "api_requests_in_flight", "Requests currently being processed", ["endpoint"],
+    multiprocess_mode="livesum")
+REQUEST_BYTES = Counter(
+    "api_request_bytes_total", "Request body bytes received", ["endpoint"])
+RESPONSE_BYTES = Counter(
+    "api_response_bytes_total", "Response body bytes sent", ["endpoint"])
+STAGE_LATENCY = Histogram(
+    "api_stage_duration_seconds", "Time spent in a processing stage",
+    ["stage", "kind"], buckets=LATENCY_BUCKETS)
+STAGES_IN_FLIGHT = Gauge(
+    "api_stages_in_flight", "Processing stages currently running", ["stage"],
+    multiprocess_mode="livesum")
+STAGE_ERRORS = Counter(
+    "api_stage_errors_total", "Processing stages that raised", ["stage", "kind"])
+MODEL_TOKENS = Counter(
+    "openai_tokens_total", "Tokens reported in OpenAI response usage", ["model", "type"])
+MODEL_ROUTES = Counter(
+    "model_router_decisions_total", "Models chosen for model_name=auto requests", ["model", "reason"])
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by result", ["cache", "result"])
+ADMISSION_IN_USE = Gauge(
+    "admission_units_in_use", "Cost units held in an admission pool", ["pool"],
+    multiprocess_mode="livesum")
+ADMISSION_QUEUED = Gauge(
+    "admission_queued_requests", "Requests waiting for an admission pool", ["pool"],
+    multiprocess_mode="livesum")
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds", "Time spent waiting for an admission pool",
+    ["pool"], buckets=LATENCY_BUCKETS)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests rejected by admission control", ["pool", "reason"])
+
+
+@contextmanager
+def stage(name, kind=""):
+    """Time a block of work as a named processing stage and trace it as a span.
+
+    Usage:
+        with stage("noise_removal"):
+            ...
+        with stage("parse", fileExt):
+            ...
+    """
+    kind = str(getattr(kind, "value", kind) or "")
+    STAGES_IN_FLIGHT.labels(name).inc()
+    start = time.perf_counter()
+    try:
+        with span(name, kind=kind), profile_block(name):
+            yield
+    except BaseException:
+        STAGE_ERRORS.labels(name, kind).inc()
+        raise
+    finally:
+        STAGE_LATENCY.labels(name, kind).observe(time.perf_counter() - start)
+        STAGES_IN_FLIGHT.labels(name).dec()
+
+
+def _usage_value(usage, *names):
+    for name in names:
+        value = getattr(usage, name, None)
+        if value is not None:
+            return value
+    return None
+
+
+def record_usage(model, usage):
+    """Count the tokens reported by a Chat Completions or Responses API usage object.
+
+    Returns:
+        Dict of prompt, cached prompt and completion tokens for the response body, or None
+    """
+    if usage is None:
+        return None
+    model = str(getattr(model, "value", model))
+    prompt = _usage_value(usage, "prompt_tokens", "input_tokens")
+    completion = _usage_value(usage, "completion_tokens", "output_tokens")
+    details = _usage_value(usage, "prompt_tokens_details", "input_tokens_details")
+    cached = _usage_value(details, "cached_tokens") if details is not None else None
+    if prompt:
+        MODEL_TOKENS.labels(model, "prompt").inc(prompt)
+    if completion:
+        MODEL_TOKENS.labels(model, "completion").inc(completion)
+    if cached:
+        MODEL_TOKENS.labels(model, "cached").inc(cached)
+    return {"prompt_tokens": prompt, "cached_tokens": cached or 0, "completion_tokens": completion}
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def endpoint_name(scope):
+    """Resolve the route template for a request so path parameters don't explode label cardinality."""
+    app = scope.get("app")
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and bytes per endpoint."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        received = 0
+        sent = 0
+        status = 500
+        endpoint = endpoint_name(scope)
+        in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+        in_flight.inc()
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal sent, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(endpoint, scope["method"], str(status)).observe(time.perf_counter() - start)
+            REQUEST_BYTES.labels(endpoint).inc(received)
+            RESPONSE_BYTES.labels(endpoint).inc(sent)
+
+
+def render_metrics():
+    """Return the exposition payload and content type for the /metrics endpoint.
+
+    Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR,
+    so any worker can serve the aggregate.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
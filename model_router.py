@@ -0,0 +1,64 @@
+import logging
+import os
+import re
+from collections import namedtuple
+
+from metrics import MODEL_ROUTES
+
+# model_name=auto sends hard requests to the large model and everything else to the small one
+ROUTER_SMALL_MODEL = os.getenv("ROUTER_SMALL_MODEL", "gpt-4o-mini")
+ROUTER_LARGE_MODEL = os.getenv("ROUTER_LARGE_MODEL", "gpt-4o")
+# Prompts with documents estimated above this many tokens go to the large model
+ROUTER_LONG_DOCUMENT_TOKENS = int(os.getenv("ROUTER_LONG_DOCUMENT_TOKENS", "32000"))
+# Requests with images (including page images and PDF file inputs) go to the large model
+ROUTER_IMAGES_TO_LARGE = os.getenv("ROUTER_IMAGES_TO_LARGE", "true").lower() == "true"
+# Prompts with any of these words, in any inflection, likely ask for a rewritten document (file_response)
+ROUTER_REWRITE_KEYWORDS = [
+    keyword.strip().lower() for keyword in os.getenv(
+        "ROUTER_REWRITE_KEYWORDS",
+        "rewrite,redraft,revise,amend,modify,edit,reformat,proofread,paraphrase,translate"
+    ).split(",") if keyword.strip()]
+# Rough size of a token in characters of English text
+CHARS_PER_TOKEN = 4
+
+RouteDecision = namedtuple('RouteDecision', ['model', 'reason', 'tokens'])
+
+logger = logging.getLogger(__name__)
+
+
+def _keyword_stem(keyword):
+    """Drop a final e or y, which inflections replace: rewrite -> rewriting, modify -> modified."""
+    return keyword[:-1] if len(keyword) > 3 and keyword[-1] in "ey" else keyword
+
+
+_rewrite = re.compile(
+    r"\b(" + "|".join(re.escape(_keyword_stem(keyword)) for keyword in ROUTER_REWRITE_KEYWORDS) + r")\w*", re.IGNORECASE
+) if ROUTER_REWRITE_KEYWORDS else None
+
+
+def estimate_tokens(*texts):
+    return sum(len(text or '') for text in texts) // CHARS_PER_TOKEN
+
+
+def choose_model(prompt, document_text='', images=0):
+    """Pick the model for a request sent with model_name=auto.
+
+    Rules, first match wins: images (when ROUTER_IMAGES_TO_LARGE), a likely document
+    rewrite, a document over ROUTER_LONG_DOCUMENT_TOKENS, and otherwise the small
+    model. The decision is counted in ``model_router_decisions_total``.
+
+    Returns:
+        RouteDecision with the model, the rule that matched and the token estimate
+    """
+    tokens = estimate_tokens(prompt, document_text)
+    if images and ROUTER_IMAGES_TO_LARGE:
+        decision = RouteDecision(ROUTER_LARGE_MODEL, "images", tokens)
+    elif _rewrite is not None and _rewrite.search(prompt or ''):
+        decision = RouteDecision(ROUTER_LARGE_MODEL, "rewrite", tokens)
+    elif tokens > ROUTER_LONG_DOCUMENT_TOKENS:
+        decision = RouteDecision(ROUTER_LARGE_MODEL, "long_document", tokens)
+    else:
+        decision = RouteDecision(ROUTER_SMALL_MODEL, "default", tokens)
+    MODEL_ROUTES.labels(decision.model, decision.reason).inc()
+    logger.info("Routed request", extra={"model": decision.model, "reason": decision.reason, "tokens": tokens})
+    return decision
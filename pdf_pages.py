@@ -0,0 +1,202 @@
+import hashlib
+import logging
+import os
+from collections import namedtuple
+
+from image_pipeline import prepare_pil_image
+from metrics import stage
+from shared_cache import SharedCache
+
+# Text extraction backend: pdfium's native text layer, or pypdf's pure Python layout mode.
+# pypdf is also used for pages, or documents, that pdfium fails on
+PDF_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND", "pdfium")
+# Pages with fewer non-whitespace characters than this are treated as having no text
+# layer (scans, photos, slides that are one picture) and are rasterized in hybrid mode
+PDF_MIN_PAGE_TEXT = int(os.getenv("PDF_MIN_PAGE_TEXT", "16"))
+# Rasterized pages sent to the model per document
+PDF_MAX_IMAGE_PAGES = int(os.getenv("PDF_MAX_IMAGE_PAGES", "20"))
+# 0 disables the page cache, pages are then not hashed at all
+PDF_PAGE_CACHE_SIZE = int(os.getenv("PDF_PAGE_CACHE_SIZE", "8192"))
+PDF_PAGE_CACHE_TTL = int(os.getenv("PDF_PAGE_CACHE_TTL", "86400"))
+RENDER_SCALE = 2
+
+PdfPage = namedtuple('PdfPage', ['number', 'text', 'image'])
+
+logger = logging.getLogger(__name__)
+
+_cache = SharedCache("pdf_page", max_entries=PDF_PAGE_CACHE_SIZE, ttl=PDF_PAGE_CACHE_TTL)
+
+# Back references that would walk the rest of the document from a page
+_SKIPPED_KEYS = {"/Parent", "/P", "/Annots", "/B", "/StructParents"}
+
+
+def _hash_object(obj, digest, memo, active):
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+    if isinstance(obj, IndirectObject):
+        # Object numbers change when a document is re-saved, so only the resolved
+        # content is hashed. Within one document the numbers key the digests of
+        # objects already hashed (fonts and images shared by every page are hashed
+        # once) and guard against reference cycles
+        reference = (obj.idnum, obj.generation)
+        if reference in active:
+            digest.update(b"R")
+            return
+        hashed = memo.get(reference)
+        if hashed is None:
+            active.add(reference)
+            subdigest = hashlib.sha256()
+            _hash_object(obj.get_object(), subdigest, memo, active)
+            active.discard(reference)
+            hashed = memo[reference] = subdigest.digest()
+        digest.update(hashed)
+        return
+    if isinstance(obj, DictionaryObject):
+        digest.update(b"<<")
+        for key in sorted(obj):
+            if key in _SKIPPED_KEYS or key == "/Length":
+                continue
+            digest.update(key.encode())
+            _hash_object(obj.raw_get(key), digest, memo, active)
+        digest.update(b">>")
+        if isinstance(obj, StreamObject):
+            digest.update(obj.get_data())
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"[")
+        for item in obj:
+            _hash_object(item, digest, memo, active)
+        digest.update(b"]")
+    else:
+        digest.update(repr(obj).encode())
+
+
+def page_digest(page, memo=None):
+    """Hash of what a page draws: its content streams, the resources they use and its geometry.
+
+    Two uploads that share a page get the same digest for it, wherever the page is
+    in the document and however the rest of the file was written. Pass the same
+    ``memo`` for every page of a document so shared objects are hashed once.
+    """
+    digest = hashlib.sha256()
+    memo = {} if memo is None else memo
+    active = set()
+    for key in ("/Contents", "/Resources", "/MediaBox", "/CropBox", "/Rotate"):
+        digest.update(key.encode())
+        if key in page:
+            _hash_object(page.raw_get(key), digest, memo, active)
+    return digest.hexdigest()
+
+
+def pdfium_text(document, reader, index):
+    """Page text from pdfium's native text layer, in content order."""
+    textpage = document[index].get_textpage()
+    try:
+        return textpage.get_text_range().replace('\r\n', '\n')
+    finally:
+        textpage.close()
+
+
+def pypdf_text(document, reader, index):
+    """Page text laid out by pypdf, slower but pure Python."""
+    return reader.pages[index].extract_text(extraction_mode='layout')
+
+
+# Each backend extracts one page in a single pass, from the pdfium document or the pypdf reader
+TEXT_BACKENDS = {
+    "pdfium": pdfium_text,
+    "pypdf": pypdf_text,
+}
+
+
+def _open_pdfium(file):
+    import pypdfium2 as pdfium
+
+    file.seek(0)
+    return pdfium.PdfDocument(file)
+
+
+def _extract_text(document, reader, index):
+    backend = TEXT_BACKENDS.get(PDF_TEXT_BACKEND, pdfium_text)
+    if document is None and backend is pdfium_text:
+        backend = pypdf_text
+    try:
+        return backend(document, reader, index)
+    except Exception as e:
+        if backend is pypdf_text:
+            raise
+        logger.warning("Text extraction failed, retrying with pypdf: %s", e, extra={"page": index + 1})
+        return pypdf_text(document, reader, index)
+
+
+def _has_text(text):
+    return len(''.join(text.split())) >= PDF_MIN_PAGE_TEXT
+
+
+def parse_pdf(file, rasterize_empty=False, detail='low'):
+    """Extract a PDF page by page, caching each page's result by its content hash.
+
+    With ``rasterize_empty`` pages without a usable text layer are rendered and
+    prepared as images instead, so a mixed document only pays for rendering and
+    vision tokens on its scanned pages. A re-uploaded document that differs by a
+    page only processes that page again.
+
+    Args:
+        file: Binary file object of the PDF
+        rasterize_empty: Render pages without text instead of returning their (empty) text
+        detail: Detail level of the rendered pages
+
+    Returns:
+        List of PdfPage, with ``image`` set on rasterized pages and ``text`` on the others
+
+    Raises:
+        ValueError: More than PDF_MAX_IMAGE_PAGES pages need rendering
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(file)
+    if PDF_PAGE_CACHE_SIZE > 0:
+        memo = {}
+        digests = [page_digest(page, memo) for page in reader.pages]
+        texts = [_cache.get(f"text:{PDF_TEXT_BACKEND}:{digest}") for digest in digests]
+    else:
+        digests = [None] * len(reader.pages)
+        texts = [None] * len(reader.pages)
+    pages = []
+    render = []
+    document = None
+    try:
+        if PDF_TEXT_BACKEND == "pdfium" and None in texts:
+            try:
+                document = _open_pdfium(file)
+            except Exception as e:
+                # Leave the document to pypdf, which tolerates some damage pdfium doesn't
+                logger.warning("pdfium could not open the PDF: %s", e)
+        for number, (digest, text) in enumerate(zip(digests, texts)):
+            if text is None:
+                with stage("pdf_extract_text", PDF_TEXT_BACKEND):
+                    text = _extract_text(document, reader, number)
+                if digest is not None:
+                    _cache.set(f"text:{PDF_TEXT_BACKEND}:{digest}", text)
+            if rasterize_empty and not _has_text(text):
+                render.append((number, digest))
+            pages.append(PdfPage(number + 1, text, None))
+
+        if len(render) > PDF_MAX_IMAGE_PAGES:
+            raise ValueError(f"{len(render)} pages need rendering, at most {PDF_MAX_IMAGE_PAGES} are supported")
+
+        for number, digest in render:
+            key = f"image:{digest}:{detail}"
+            image = _cache.get(key) if digest is not None else None
+            if image is None:
+                if document is None:
+                    document = _open_pdfium(file)
+                with stage("pdf_rasterize"):
+                    image = prepare_pil_image(document[number].render(scale=RENDER_SCALE).to_pil(), detail=detail)
+                if digest is not None:
+                    _cache.set(key, image)
+            pages[number] = PdfPage(number + 1, '', image)
+    finally:
+        if document is not None:
+            document.close()
+    logger.info("Parsed PDF pages", extra={"pages": len(pages), "rasterized": len(render)})
+    return pages
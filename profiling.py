@@ -0,0 +1,187 @@
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from telemetry import request_id_var
+
+# Fraction of requests profiled without being asked to, 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# "sample" collects folded stacks for flamegraphs, "cprofile" collects deterministic stats
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Number of recent profiles kept per endpoint
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+ADMIN_SECRET_KEY = os.getenv("ADMIN_SECRET_KEY")
+
+_session_var = ContextVar("profile_session", default=None)
+_thread_state = threading.local()
+_ids = itertools.count(1)
+_profiles_lock = threading.Lock()
+_recent_profiles = {}
+
+
+class ProfileSession:
+    """Profiles collected for one request, one entry per profiled stage."""
+
+    def __init__(self, endpoint, request_id, mode):
+        self.id = next(_ids)
+        self.endpoint = endpoint
+        self.request_id = request_id
+        self.mode = mode
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.stages = []
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds, folded=None, stats=None):
+        with self.lock:
+            self.stages.append({"stage": stage, "duration_ms": round(seconds * 1000, 1), "folded": folded, "stats": stats})
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "endpoint": self.endpoint,
+            "request_id": self.request_id,
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "stages": [{"stage": s["stage"], "duration_ms": s["duration_ms"]} for s in self.stages],
+        }
+
+    def folded(self):
+        """Merge all stages into folded stack lines (flamegraph.pl / speedscope input)."""
+        counts = Counter()
+        for stage in self.stages:
+            for stack, count in (stage["folded"] or {}).items():
+                counts[f"{stage['stage']};{stack}"] += count
+        return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+    def stats(self):
+        return "\n\n".join(f"== {s['stage']} ==\n{s['stats']}" for s in self.stages if s["stats"])
+
+
+class _StackSampler:
+    """Samples one thread's stack at a fixed interval from a helper thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def should_profile(headers):
+    """Decide whether to profile a request from its admin header or the sampling rate."""
+    requested = headers.get(b"x-profile", b"").decode("latin-1").lower() in ("1", "true", "yes")
+    if requested and ADMIN_SECRET_KEY and headers.get(b"x-admin-key", b"").decode("latin-1") == ADMIN_SECRET_KEY:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def profile_block(name):
+    """Profile a block of work if the current request is being profiled.
+
+    Nested blocks are covered by the outermost one, since only one profiler
+    can be active per thread.
+    """
+    session = _session_var.get()
+    if session is None or getattr(_thread_state, "active", False):
+        yield
+        return
+
+    _thread_state.active = True
+    start = time.perf_counter()
+    try:
+        if session.mode == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one cProfile per interpreter and another request holds it
+                yield
+                return
+            try:
+                yield
+            finally:
+                profiler.disable()
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+                session.add(name, time.perf_counter() - start, stats=out.getvalue())
+        else:
+            sampler = _StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+            try:
+                with sampler:
+                    yield
+            finally:
+                session.add(name, time.perf_counter() - start, folded=dict(sampler.counts))
+    finally:
+        _thread_state.active = False
+
+
+def recent_profiles():
+    with _profiles_lock:
+        return [session.summary() for sessions in _recent_profiles.values() for session in sessions]
+
+
+def get_profile(profile_id):
+    with _profiles_lock:
+        for sessions in _recent_profiles.values():
+            for session in sessions:
+                if session.id == profile_id:
+                    return session
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware opening a profile session for admin-requested or sampled requests."""
+
+    def __init__(self, app, endpoint_name):
+        self.app = app
+        self.endpoint_name = endpoint_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not should_profile(dict(scope.get("headers") or [])):
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(self.endpoint_name(scope), request_id_var.get(), PROFILE_MODE)
+        token = _session_var.set(session)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _session_var.reset(token)
+            session.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            if session.stages:
+                with _profiles_lock:
+                    _recent_profiles.setdefault(session.endpoint, deque(maxlen=PROFILE_KEEP)).append(session)
@@ -0,0 +1,109 @@
+import math
+import os
+
+# Whisper works on 16 kHz mono, audio is brought down to that before any other DSP
+TARGET_RATE = 16000
+# Decoded audio is mixed down and resampled in blocks of this many seconds
+RESAMPLE_BLOCK_SECONDS = int(os.getenv("RESAMPLE_BLOCK_SECONDS", "30"))
+
+
+class PolyphaseResampler:
+    """Block-wise ``scipy.signal.resample_poly`` with the output of a single call.
+
+    Each block is resampled together with enough input on both sides for the
+    anti-aliasing filter to see across block boundaries. Boundaries are kept on
+    multiples of the decimation factor so output samples stay aligned, which
+    means a block's output is delayed until the next block (or ``flush``).
+    """
+
+    def __init__(self, sample_rate, target_rate=TARGET_RATE):
+        divisor = math.gcd(int(sample_rate), int(target_rate))
+        self.up = int(target_rate) // divisor
+        self.down = int(sample_rate) // divisor
+        # resample_poly's filter reaches 10 * max(up, down) samples either side at the upsampled rate
+        reach = math.ceil(10 * max(self.up, self.down) / self.up) + 1
+        self.context = self.down * math.ceil(reach / self.down)
+        self.buffer = None
+        # Input index of buffer[0] and of the first sample not yet resampled, both multiples of down
+        self.buffer_start = 0
+        self.position = 0
+
+    def process(self, samples):
+        """Resample a block of mono samples, returning the output that is final so far."""
+        import numpy as np
+
+        if self.up == self.down:
+            return samples
+        self.buffer = samples if self.buffer is None else np.concatenate([self.buffer, samples])
+        end = (self.buffer_start + len(self.buffer) - self.context) // self.down * self.down
+        if end <= self.position:
+            return np.zeros(0, dtype=np.float32)
+        output = self._resample(end)
+        # Keep the input the next block still needs as left context
+        keep_from = max(self.buffer_start, end - self.context)
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+        return output
+
+    def flush(self):
+        """Resample whatever input is left at the end of the signal."""
+        import numpy as np
+
+        if self.buffer is None or self.up == self.down:
+            return np.zeros(0, dtype=np.float32)
+        output = self._resample(None)
+        self.buffer = None
+        return output
+
+    def _resample(self, end):
+        import numpy as np
+        from scipy import signal
+
+        resampled = signal.resample_poly(self.buffer, self.up, self.down)
+        first = (self.position - self.buffer_start) * self.up // self.down
+        last = len(resampled) if end is None else (end - self.buffer_start) * self.up // self.down
+        if end is not None:
+            self.position = end
+        return resampled[first:last].astype(np.float32)
+
+
+def resample(samples, sample_rate, target_rate=TARGET_RATE):
+    """Resample a whole mono signal with ``resample_poly``."""
+    import numpy as np
+    from scipy import signal
+
+    divisor = math.gcd(int(sample_rate), int(target_rate))
+    up, down = int(target_rate) // divisor, int(sample_rate) // divisor
+    if up == down:
+        return samples
+    return signal.resample_poly(samples, up, down).astype(np.float32)
+
+
+def iter_mono_blocks(audio_path, target_rate=TARGET_RATE):
+    """Stream an audio file as mono float32 blocks resampled to ``target_rate``.
+
+    Channels are averaged before resampling, so the polyphase filter runs once
+    per block rather than once per channel.
+    """
+    import soundfile as sf
+
+    with sf.SoundFile(audio_path) as pcm:
+        resampler = PolyphaseResampler(pcm.samplerate, target_rate)
+        blocksize = pcm.samplerate * RESAMPLE_BLOCK_SECONDS
+        for block in pcm.blocks(blocksize=blocksize, dtype='float32', always_2d=True):
+            yield resampler.process(block.mean(axis=1))
+        yield resampler.flush()
+
+
+def load_mono(audio_path, target_rate=TARGET_RATE):
+    """Load a whole audio file as mono float32 at ``target_rate``."""
+    import numpy as np
+
+    try:
+        return np.concatenate(list(iter_mono_blocks(audio_path, target_rate)))
+    except Exception:
+        # Formats libsndfile can't read are decoded at their native rate and resampled once
+        import librosa
+
+        y, native_sr = librosa.load(audio_path, sr=None, mono=True)
+        return resample(y.astype(np.float32), native_sr, target_rate)
@@ -0,0 +1,247 @@
+import codecs
+import re
+
+CHUNK_SIZE = 64 * 1024
+# A control word is at most 32 letters plus a 10 digit parameter, so holding back
+# anything after the last backslash in this window keeps tokens whole across chunks
+HOLDBACK = 48
+
+TOKEN_RE = re.compile(
+    rb"\\([a-zA-Z]{1,32})(-?\d{1,10})? ?"   # control word with optional parameter
+    rb"|\\'([0-9a-fA-F]{2})"                # hex escaped byte
+    rb"|\\([^a-zA-Z'])"                     # control symbol
+    rb"|([{}])"                             # group start / end
+    rb"|[\r\n]+"                            # raw line breaks are not content
+    rb"|([^\\{}\r\n]+)"                     # plain text run
+)
+
+# Destinations whose contents are never document text
+SKIP_DESTINATIONS = {
+    'fonttbl', 'colortbl', 'stylesheet', 'info', 'pict', 'object', 'themedata',
+    'colorschememapping', 'datastore', 'latentstyles', 'listtable', 'listoverridetable',
+    'rsidtbl', 'generator', 'xmlnstbl', 'mmathPr', 'fldinst', 'filetbl', 'revtbl',
+    'header', 'footer', 'headerl', 'headerr', 'headerf', 'footerl', 'footerr', 'footerf',
+    'private', 'bkmkstart', 'bkmkend', 'nonshppict', 'objdata', 'wgrffmtfilter',
+}
+
+# \fcharset values to Python codecs
+CHARSET_CODECS = {
+    77: 'mac_roman', 128: 'cp932', 129: 'cp949', 134: 'cp936', 136: 'cp950',
+    161: 'cp1253', 162: 'cp1254', 163: 'cp1258', 177: 'cp1255', 178: 'cp1256',
+    186: 'cp1257', 204: 'cp1251', 222: 'cp874', 238: 'cp1250',
+}
+
+SPECIAL_CHARS = {
+    'par': '\n', 'sect': '\n\n', 'page': '\n\n', 'line': '\n', 'tab': '\t',
+    'cell': ' | ', 'nestcell': ' | ', 'row': '\n', 'nestrow': '\n',
+    'emdash': '\u2014', 'endash': '\u2013', 'bullet': '\u2022',
+    'lquote': '\u2018', 'rquote': '\u2019', 'ldblquote': '\u201c', 'rdblquote': '\u201d',
+    'emspace': ' ', 'enspace': ' ', 'qmspace': ' ',
+}
+
+
+def _codec_for_codepage(codepage):
+    name = f'cp{codepage}'
+    try:
+        codecs.lookup(name)
+        return name
+    except LookupError:
+        return 'cp1252'
+
+
+def decode_text(data):
+    """Decode bytes of unknown encoding, preferring UTF-8 and falling back to cp1252."""
+    if data.startswith(codecs.BOM_UTF16_LE) or data.startswith(codecs.BOM_UTF16_BE):
+        return data.decode('utf-16', errors='replace')
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1252', errors='replace')
+
+
+class _RtfState:
+    """Per-group parser state, copied on ``{`` and restored on ``}``."""
+
+    __slots__ = ('skip', 'uc', 'codec', 'in_fonttbl')
+
+    def __init__(self, skip=False, uc=1, codec='cp1252', in_fonttbl=False):
+        self.skip = skip
+        self.uc = uc
+        self.codec = codec
+        self.in_fonttbl = in_fonttbl
+
+    def copy(self):
+        return _RtfState(self.skip, self.uc, self.codec, self.in_fonttbl)
+
+
+class RtfTokenizer:
+    """Incremental RTF to plain text converter.
+
+    Feed raw bytes with :meth:`feed` as they are read and collect the text
+    with :meth:`close`. Work is linear in the input size and the input never
+    needs to be decoded into one Python string.
+    """
+
+    def __init__(self):
+        self.output = []
+        self.stack = []
+        self.state = _RtfState()
+        self.default_codec = 'cp1252'
+        self.font_codecs = {}
+        self.current_font = None
+        self.pending_bytes = bytearray()
+        self.skip_chars = 0
+        self.group_start = False
+        self.buffer = b''
+        # First half of a \uN surrogate pair, waiting for the second
+        self.high_surrogate = None
+
+    def _emit(self, text):
+        if self.high_surrogate is not None:
+            # A high surrogate that isn't followed by a low one can't be encoded
+            self.high_surrogate = None
+            text = '\ufffd' + text
+        if not self.state.skip:
+            self.output.append(text)
+
+    def _flush_bytes(self):
+        if self.pending_bytes:
+            self._emit(bytes(self.pending_bytes).decode(self.state.codec, errors='replace'))
+            self.pending_bytes.clear()
+
+    def _control_word(self, word, param):
+        state = self.state
+        if self.group_start and word in SKIP_DESTINATIONS and word != 'fonttbl':
+            state.skip = True
+        self.group_start = False
+
+        if word == 'fonttbl':
+            state.in_fonttbl = True
+            state.skip = True
+        elif word == 'ansicpg' and param is not None:
+            self.default_codec = _codec_for_codepage(param)
+            state.codec = self.default_codec
+        elif word == 'mac':
+            self.default_codec = state.codec = 'mac_roman'
+        elif word == 'f' and param is not None:
+            if state.in_fonttbl:
+                self.current_font = param
+            else:
+                state.codec = self.font_codecs.get(param, self.default_codec)
+        elif word == 'fcharset' and param is not None and state.in_fonttbl and self.current_font is not None:
+            codec = CHARSET_CODECS.get(param)
+            if codec:
+                self.font_codecs[self.current_font] = codec
+        elif word == 'uc' and param is not None:
+            state.uc = param
+        elif word == 'u' and param is not None:
+            self._flush_bytes()
+            code = param + 65536 if param < 0 else param
+            if 0xD800 <= code < 0xDC00:
+                # Characters outside the BMP (emoji) are written as two \uN escapes
+                self._emit('')
+                self.high_surrogate = code
+            elif 0xDC00 <= code < 0xE000:
+                high = self.high_surrogate
+                self.high_surrogate = None
+                self._emit(chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)) if high is not None else '\ufffd')
+            else:
+                self._emit(chr(code) if code else '')
+            self.skip_chars = state.uc
+        elif word in SPECIAL_CHARS:
+            self._emit(SPECIAL_CHARS[word])
+
+    def _process(self, data):
+        for match in TOKEN_RE.finditer(data):
+            word, param, hex_byte, symbol, brace, text = match.groups()
+            if self.skip_chars and (hex_byte or text):
+                # Skip the ANSI fallback characters that follow a \uN escape
+                if hex_byte:
+                    self.skip_chars -= 1
+                    continue
+                consumed = min(self.skip_chars, len(text))
+                self.skip_chars -= consumed
+                text = text[consumed:]
+                if not text:
+                    continue
+            if hex_byte is not None:
+                self.group_start = False
+                if not self.state.skip:
+                    self.pending_bytes.append(int(hex_byte, 16))
+                continue
+            self._flush_bytes()
+            if word is not None:
+                self._control_word(word.decode('ascii'), int(param) if param else None)
+            elif brace == b'{':
+                self.stack.append(self.state)
+                self.state = self.state.copy()
+                self.group_start = True
+                self.skip_chars = 0
+            elif brace == b'}':
+                if self.stack:
+                    self.state = self.stack.pop()
+                self.group_start = False
+                self.skip_chars = 0
+            elif symbol is not None:
+                if symbol == b'*' and self.group_start:
+                    self.state.skip = True
+                elif symbol in (b'\\', b'{', b'}'):
+                    self._emit(symbol.decode('ascii'))
+                elif symbol == b'~':
+                    self._emit('\u00a0')
+                elif symbol in (b'\n', b'\r'):
+                    self._emit('\n')
+                if symbol != b'*':
+                    self.group_start = False
+            elif text:
+                self.group_start = False
+                if not self.state.skip:
+                    # Raw 8-bit bytes are written in the document code page
+                    self._emit(text.decode(self.state.codec, errors='replace'))
+
+    def feed(self, data):
+        data = self.buffer + data
+        cut = data.rfind(b'\\', max(0, len(data) - HOLDBACK))
+        if cut == -1:
+            self.buffer = b''
+        else:
+            # An escaped backslash must not be split from its escape
+            escapes = len(data[:cut]) - len(data[:cut].rstrip(b'\\'))
+            if escapes % 2:
+                cut -= 1
+            self.buffer = data[cut:]
+            data = data[:cut]
+        self._process(data)
+
+    def close(self):
+        if self.buffer:
+            self._process(self.buffer)
+            self.buffer = b''
+        self._flush_bytes()
+        self._emit('')
+        return ''.join(self.output)
+
+
+def extract_rtf_text(file, chunk_size=CHUNK_SIZE):
+    """Extract plain text from an RTF file object by streaming it in chunks.
+
+    Files that are not actually RTF (no ``{\\rtf`` header) are decoded as
+    plain text with encoding detection instead of failing.
+
+    Args:
+        file: Binary file object positioned at the start of the document
+        chunk_size: Number of bytes read per iteration
+
+    Returns:
+        Document text
+    """
+    head = file.read(max(chunk_size, HOLDBACK))
+    if not head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'{\\rtf'):
+        return decode_text(head + file.read())
+
+    tokenizer = RtfTokenizer()
+    chunk = head
+    while chunk:
+        tokenizer.feed(chunk)
+        chunk = file.read(chunk_size)
+    return tokenizer.close()
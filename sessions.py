@@ -0,0 +1,164 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from uuid import uuid4
+
+from shared_cache import SharedCache
+
+# Seconds a session is kept after its last use
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "1024"))
+# Document text is stored in chunks of about this many characters (~1000 tokens)
+SESSION_CHUNK_CHARS = int(os.getenv("SESSION_CHUNK_CHARS", "4000"))
+# Document text one response chain may carry (~50k tokens). Longer documents aren't sent
+# whole: each prompt gets the chunks that share most terms with it
+SESSION_MAX_CONTEXT_CHARS = int(os.getenv("SESSION_MAX_CONTEXT_CHARS", "200000"))
+# Chunks of a long document selected per prompt
+SESSION_TURN_CONTEXT_CHARS = int(os.getenv("SESSION_TURN_CONTEXT_CHARS", "40000"))
+
+# previous_response_id is the last Responses API answer in the session, the next prompt is
+# chained to it so the document already sent doesn't have to be sent again. sent_chunks
+# are the indices of the chunks of a long document that chain already carries
+Session = namedtuple('Session', [
+    'session_id', 'filename', 'document_text', 'chunks', 'image', 'image_urls', 'file_id',
+    'previous_response_id', 'created_at', 'sent_chunks'], defaults=((),))
+
+logger = logging.getLogger(__name__)
+
+_sessions = SharedCache("session", max_entries=SESSION_MAX_ENTRIES, ttl=SESSION_TTL)
+
+_TERM = re.compile(r"\w{3,}")
+
+# Sessions with a message in progress in this process
+_active = set()
+_active_lock = threading.Lock()
+
+
+def chunk_text(text, size=SESSION_CHUNK_CHARS):
+    """Split text into chunks of at most ``size`` characters, at paragraph breaks where possible."""
+    chunks = []
+    current = ''
+    for paragraph in text.split('\n\n'):
+        while len(paragraph) > size:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(paragraph[:size])
+            paragraph = paragraph[size:]
+        if current and len(current) + len(paragraph) + 2 > size:
+            chunks.append(current)
+            current = ''
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def create_session(filename, document_text, image=None, image_urls=(), file_id=None):
+    """Store a parsed document under a new session id."""
+    session = Session(
+        uuid4().hex, filename, document_text, chunk_text(document_text), image, list(image_urls), file_id,
+        None, time.time())
+    save_session(session)
+    logger.info("Created session", extra={
+        "session_id": session.session_id, "chars": len(document_text), "chunks": len(session.chunks)})
+    return session
+
+
+def get_session(session_id):
+    return _sessions.get(session_id)
+
+
+def save_session(session):
+    """Store the session, which also restarts its TTL."""
+    _sessions.set(session.session_id, session)
+
+
+def delete_session(session_id):
+    _sessions.delete(session_id)
+
+
+@contextmanager
+def session_turn(session_id):
+    """Claim the session for one message in this process.
+
+    Yields False, without claiming it, when another message of the session is
+    still in progress here. Workers in other processes are caught by save_turn.
+    """
+    with _active_lock:
+        claimed = session_id not in _active
+        _active.add(session_id)
+    try:
+        yield claimed
+    finally:
+        if claimed:
+            with _active_lock:
+                _active.discard(session_id)
+
+
+def save_turn(session, previous_response_id):
+    """Save the session after a message, unless another message moved it on first.
+
+    ``previous_response_id`` is the value read when the message started. If the
+    stored session was deleted or chained to another response since, nothing is
+    saved, so two messages can't both continue from the same response.
+
+    Returns:
+        True when the session was saved
+    """
+    stored = get_session(session.session_id)
+    if stored is None or stored.previous_response_id != previous_response_id:
+        logger.warning("Session changed by a concurrent message", extra={"session_id": session.session_id})
+        return False
+    save_session(session)
+    return True
+
+
+def relevant_chunks(session, prompt, max_chars=SESSION_TURN_CONTEXT_CHARS):
+    """Indices of the chunks sharing most terms with the prompt, in document order, up to ``max_chars``."""
+    terms = Counter(term.lower() for term in _TERM.findall(prompt))
+    scores = []
+    for index, chunk in enumerate(session.chunks):
+        counts = Counter(term.lower() for term in _TERM.findall(chunk))
+        scores.append((sum(min(counts[term], 3) for term in terms), index))
+    selected = []
+    used = 0
+    for score, index in sorted(scores, key=lambda item: (-item[0], item[1])):
+        if used + len(session.chunks[index]) > max_chars:
+            continue
+        selected.append(index)
+        used += len(session.chunks[index])
+    return sorted(selected)
+
+
+def session_context(session, prompt):
+    """Document text to send with the prompt, and the session to send it in.
+
+    A document that fits SESSION_MAX_CONTEXT_CHARS is sent whole with the first prompt
+    and then reached through the response chain, so later prompts send nothing. A
+    longer one is sent in the chunks relevant to each prompt, leaving out those the
+    chain already carries. When the chain would carry more than
+    SESSION_MAX_CONTEXT_CHARS, a new chain is started with this prompt's chunks, so
+    the context of a turn stays bounded however many questions are asked.
+
+    Returns:
+        (context, session), the session has previous_response_id cleared when a new
+        chain starts and sent_chunks updated
+    """
+    if len(session.document_text) <= SESSION_MAX_CONTEXT_CHARS:
+        return (session.document_text if session.previous_response_id is None else ''), session
+    selected = relevant_chunks(session, prompt)
+    sent = set(session.sent_chunks) if session.previous_response_id is not None else set()
+    new = [index for index in selected if index not in sent]
+    carried = sum(len(session.chunks[index]) for index in sent)
+    if carried + sum(len(session.chunks[index]) for index in new) > SESSION_MAX_CONTEXT_CHARS:
+        logger.info("Starting a new response chain", extra={"session_id": session.session_id, "chars": carried})
+        session = session._replace(previous_response_id=None)
+        sent = set()
+        new = selected
+    session = session._replace(sent_chunks=tuple(sorted(sent | set(new))))
+    return '\n\n'.join(session.chunks[index] for index in new), session
@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import record_cache
+
+# memory:// keeps entries per process, sqlite:///path/cache.db shares them between the
+# workers on one host and redis://host:6379/0 shares them between hosts
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+# Comma separated cache names that always miss and store nothing, e.g. to benchmark the
+# uncached path. Data that must persist, like sessions, shouldn't be listed
+CACHE_BYPASS = {name.strip() for name in os.getenv("CACHE_BYPASS", "").split(",") if name.strip()}
+
+logger = logging.getLogger(__name__)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def file_digest(file, chunk_size=1024 * 1024):
+    """Hash a binary file object or path without loading it into memory at once."""
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    elif hasattr(file, 'getbuffer'):
+        # In-memory and memory mapped files are hashed in place, without reading copies
+        digest.update(file.getbuffer())
+    else:
+        position = file.tell()
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+        file.seek(position)
+    return digest.hexdigest()
+
+
+class _MemoryBackend:
+    """Per-process LRU, bounded per namespace."""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self.lock:
+            entries = self.entries.get(namespace)
+            if entries is None or key not in entries:
+                return None
+            value, expires_at = entries[key]
+            if expires_at is not None and expires_at < time.time():
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            return value
+
+    def set(self, namespace, key, value, ttl, max_entries):
+        with self.lock:
+            entries = self.entries.setdefault(namespace, OrderedDict())
+            entries[key] = (value, time.time() + ttl if ttl else None)
+            entries.move_to_end(key)
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+
+    def delete(self, namespace, key):
+        with self.lock:
+            self.entries.get(namespace, {}).pop(key, None)
+
+
+_sqlite_local = threading.local()
+
+
+def sqlite_connection(path):
+    """Connection to the SQLite file at ``path`` in WAL mode, in autocommit mode.
+
+    Connections are per thread and must not cross a fork, so one is opened for
+    each thread and process and reused afterwards.
+    """
+    connections = getattr(_sqlite_local, "connections", None)
+    if connections is None or _sqlite_local.pid != os.getpid():
+        connections = _sqlite_local.connections = {}
+        _sqlite_local.pid = os.getpid()
+    connection = connections.get(path)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = connection
+    return connection
+
+
+class _SqliteBackend:
+    """SQLite file shared by every worker process on the host, in WAL mode."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, value BLOB, "
+                "expires_at REAL, accessed_at REAL, PRIMARY KEY (namespace, key))")
+
+    def _connection(self):
+        return sqlite_connection(self.path)
+
+    def get(self, namespace, key):
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] < time.time():
+            connection.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+            return None
+        connection.execute(
+            "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?", (time.time(), namespace, key))
+        return pickle.loads(row[0])
+
+    def set(self, namespace, key, value, ttl, max_entries):
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+            (namespace, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + ttl if ttl else None, now))
+        # Trimming scans the namespace, so only do it on a fraction of writes
+        if random.random() < 0.05:
+            connection.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            connection.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key NOT IN "
+                "(SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT ?)",
+                (namespace, namespace, max_entries))
+
+    def delete(self, namespace, key):
+        self._connection().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+
+class _RedisBackend:
+    """Redis shared by every worker and host; eviction is left to the server's maxmemory policy."""
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=2)
+
+    def get(self, namespace, key):
+        value = self.client.get(f"{namespace}:{key}")
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, namespace, key, value, ttl, max_entries):
+        self.client.set(f"{namespace}:{key}", pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=ttl or None)
+
+    def delete(self, namespace, key):
+        self.client.delete(f"{namespace}:{key}")
+
+
+def _get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if CACHE_URL.startswith("sqlite://"):
+                _backend = _SqliteBackend(CACHE_URL[len("sqlite://"):])
+            elif CACHE_URL.startswith(("redis://", "rediss://", "unix://")):
+                _backend = _RedisBackend(CACHE_URL)
+            else:
+                _backend = _MemoryBackend()
+        return _backend
+
+
+class SharedCache:
+    """A named cache stored in the backend selected by CACHE_URL.
+
+    Backend errors are logged and treated as misses, a cache never fails a request.
+    """
+
+    def __init__(self, name, max_entries=1024, ttl=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bypass = name in CACHE_BYPASS
+
+    def get(self, key):
+        if self.bypass:
+            return None
+        try:
+            value = _get_backend().get(self.name, key)
+        except Exception as e:
+            logger.warning("Cache read failed: %s", e, extra={"cache": self.name})
+            value = None
+        record_cache(self.name, value is not None)
+        return value
+
+    def set(self, key, value):
+        if self.bypass:
+            return
+        try:
+            _get_backend().set(self.name, key, value, self.ttl, self.max_entries)
+        except Exception as e:
+            logger.warning("Cache write failed: %s", e, extra={"cache": self.name})
+
+    def delete(self, key):
+        try:
+            _get_backend().delete(self.name, key)
+        except Exception as e:
+            logger.warning("Cache delete failed: %s", e, extra={"cache": self.name})
@@ -0,0 +1,272 @@
+import asyncio
+import io
+import json
+import logging
+import os
+from collections import deque
+
+from starlette.websockets import WebSocketDisconnect
+
+from metrics import stage
+from resampling import TARGET_RATE, PolyphaseResampler
+from vad import VAD_MIN_SILENCE_MS, VAD_PADDING_MS, VAD_THRESHOLD_DB
+
+FRAME_LENGTH = TARGET_RATE * 30 // 1000
+# Incoming audio is filtered and resampled in blocks of this length
+STREAM_BLOCK_SECONDS = 0.5
+# Segments are closed after this long even without a pause, so transcripts keep flowing
+STREAM_MAX_SEGMENT_SECONDS = float(os.getenv("STREAM_MAX_SEGMENT_SECONDS", "30"))
+# Longest recording accepted on one connection
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", str(4 * 3600)))
+# Whisper requests in flight per connection
+STREAM_WHISPER_CONCURRENCY = int(os.getenv("STREAM_WHISPER_CONCURRENCY", "2"))
+# Closed segments waiting for transcription before the socket stops being read
+STREAM_MAX_QUEUED_SEGMENTS = int(os.getenv("STREAM_MAX_QUEUED_SEGMENTS", "8"))
+
+SAMPLE_FORMATS = {"pcm_s16le": ("<i2", 2), "pcm_f32le": ("<f4", 4)}
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingSegmenter:
+    """Incremental resampling, high-pass filter and VAD over a live PCM stream.
+
+    Raw interleaved PCM is fed as it arrives; completed speech segments are
+    returned as (start, end, samples) with times in seconds from the start of
+    the stream and 16 kHz mono float32 samples.
+    """
+
+    def __init__(self, sample_rate, channels, encoding="pcm_s16le"):
+        import numpy as np
+        from scipy import signal
+
+        if encoding not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+        if not 8000 <= sample_rate <= 192000 or not 1 <= channels <= 8:
+            raise ValueError("Unsupported sample rate or channel count")
+        self.dtype, self.sample_width = SAMPLE_FORMATS[encoding]
+        self.scale = 32768.0 if encoding == "pcm_s16le" else 1.0
+        self.channels = channels
+        self.sample_rate = sample_rate
+        # Live audio is brought down to 16 kHz mono as it arrives
+        self.resampler = PolyphaseResampler(sample_rate)
+        self.block_bytes = int(sample_rate * STREAM_BLOCK_SECONDS) * channels * self.sample_width
+        # Same 100 Hz high-pass as the file pipeline, with state carried between blocks
+        self.sos = signal.butter(5, 100, 'highpass', fs=TARGET_RATE, output='sos')
+        self.zi = np.zeros((self.sos.shape[0], 2))
+
+        self.pending = bytearray()
+        self.leftover = None
+        self.frames_seen = 0
+        self.energies = deque(maxlen=int(10 * TARGET_RATE / FRAME_LENGTH))
+        padding = max(1, int(VAD_PADDING_MS / 30))
+        self.preroll = deque(maxlen=padding)
+        self.hangover = max(1, int(VAD_MIN_SILENCE_MS / 30))
+        self.segment = None
+        self.segment_start = 0
+        self.silent_frames = 0
+
+    @property
+    def seconds(self):
+        return self.frames_seen * FRAME_LENGTH / TARGET_RATE
+
+    def feed(self, data):
+        """Add raw PCM bytes and return the segments that closed."""
+        self.pending.extend(data)
+        closed = []
+        while len(self.pending) >= self.block_bytes:
+            block = bytes(self.pending[:self.block_bytes])
+            del self.pending[:self.block_bytes]
+            closed.extend(self._process(block))
+        return closed
+
+    def finish(self):
+        """Flush buffered audio at the end of the stream and close any open segment."""
+        closed = []
+        usable = len(self.pending) - len(self.pending) % (self.channels * self.sample_width)
+        if usable:
+            closed.extend(self._process(bytes(self.pending[:usable])))
+        self.pending.clear()
+        closed.extend(self._analyse(self.resampler.flush()))
+        if self.segment is not None:
+            closed.append(self._close())
+        return closed
+
+    def _process(self, block):
+        import numpy as np
+
+        samples = np.frombuffer(block, dtype=self.dtype).astype(np.float32) / self.scale
+        samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return self._analyse(self.resampler.process(samples))
+
+    def _analyse(self, samples):
+        import numpy as np
+        from scipy import signal
+
+        samples, self.zi = signal.sosfilt(self.sos, samples, zi=self.zi)
+        samples = samples.astype(np.float32)
+        if self.leftover is not None:
+            samples = np.concatenate([self.leftover, samples])
+        usable = len(samples) - len(samples) % FRAME_LENGTH
+        self.leftover = samples[usable:]
+        frames = samples[:usable].reshape(-1, FRAME_LENGTH)
+        if len(frames) == 0:
+            return []
+
+        energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        zcr = np.mean(np.diff(np.signbit(frames), axis=1), axis=1)
+        self.energies.extend(energy_db.tolist())
+        # Until a few seconds were heard, assume a quiet room rather than trusting a short history
+        floor = np.percentile(self.energies, 10) if len(self.energies) > 100 else -55.0
+        speech = (energy_db > floor + VAD_THRESHOLD_DB) | (
+            (energy_db > floor + VAD_THRESHOLD_DB / 2) & (zcr > 0.25))
+        speech &= energy_db > -60
+
+        closed = []
+        for frame, is_speech in zip(frames, speech):
+            if self.segment is None:
+                if is_speech:
+                    self.segment = list(self.preroll)
+                    self.segment_start = self.frames_seen - len(self.preroll)
+                    self.silent_frames = 0
+                    self.preroll.clear()
+                else:
+                    self.preroll.append(frame)
+            if self.segment is not None:
+                self.segment.append(frame)
+                self.silent_frames = 0 if is_speech else self.silent_frames + 1
+                too_long = len(self.segment) * FRAME_LENGTH >= STREAM_MAX_SEGMENT_SECONDS * TARGET_RATE
+                if self.silent_frames >= self.hangover or too_long:
+                    closed.append(self._close())
+            self.frames_seen += 1
+        return closed
+
+    def _close(self):
+        import numpy as np
+
+        # Keep the padding after the last speech frame, drop the rest of the pause
+        trailing = max(0, self.silent_frames - self.preroll.maxlen)
+        frames = self.segment[:len(self.segment) - trailing] if trailing else self.segment
+        start = self.segment_start * FRAME_LENGTH / TARGET_RATE
+        end = start + len(frames) * FRAME_LENGTH / TARGET_RATE
+        self.segment = None
+        self.silent_frames = 0
+        return start, end, np.concatenate(frames)
+
+
+def _is_stop(text):
+    if text.strip() == "stop":
+        return True
+    try:
+        return json.loads(text).get("type") == "stop"
+    except (ValueError, AttributeError):
+        return False
+
+
+def encode_wav(samples):
+    import soundfile as sf
+
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, TARGET_RATE, format='WAV', subtype='PCM_16')
+    return buffer.getvalue()
+
+
+class StreamingTranscription:
+    """One WebSocket session: segments live audio and transcribes speech as each segment closes.
+
+    Messages sent to the client:
+        {"type": "ready"}
+        {"type": "partial", "index", "start", "end", "text"} per segment, in completion order
+        {"type": "error", "index", "start", "end", "detail"} when a segment fails to transcribe
+        {"type": "final", "transcription", "segments", "failed_segments", "audio_seconds", "speech_seconds"}
+        {"type": "error", "detail"}
+
+    Once STREAM_MAX_QUEUED_SEGMENTS segments are waiting for Whisper the socket
+    is not read again until one finishes, so a fast client is slowed by TCP
+    backpressure instead of growing an unbounded task list.
+    """
+
+    def __init__(self, websocket, client, segmenter, force_english=True):
+        self.websocket = websocket
+        self.client = client
+        self.segmenter = segmenter
+        self.force_english = force_english
+        self.segments = []
+        self.tasks = []
+        self.send_lock = asyncio.Lock()
+        self.whisper_slots = asyncio.Semaphore(STREAM_WHISPER_CONCURRENCY)
+
+    async def _send(self, message):
+        async with self.send_lock:
+            await self.websocket.send_json(message)
+
+    def _transcribe(self, samples):
+        with stage("whisper", "stream"):
+            return self.client.audio.transcriptions.create(
+                model="whisper-1",
+                file=("segment.wav", encode_wav(samples), "audio/wav"),
+                language="en" if self.force_english else None,
+                response_format="text"
+            )
+
+    async def _transcribe_segment(self, index, start, end, samples):
+        segment = {"index": index, "start": round(start, 3), "end": round(end, 3)}
+        async with self.whisper_slots:
+            try:
+                text = (await asyncio.to_thread(self._transcribe, samples)).strip()
+            except Exception as e:
+                logger.warning("Segment transcription failed: %s", e, extra={"segment": index})
+                self.segments.append({**segment, "text": "", "failed": True})
+                await self._send({"type": "error", **segment, "detail": "Segment transcription failed"})
+                return
+        segment["text"] = text
+        self.segments.append(segment)
+        if text:
+            await self._send({"type": "partial", **segment})
+
+    def _submit(self, closed):
+        for start, end, samples in closed:
+            index = len(self.tasks)
+            self.tasks.append(asyncio.create_task(self._transcribe_segment(index, start, end, samples)))
+
+    async def _drain(self):
+        pending = [task for task in self.tasks if not task.done()]
+        while len(pending) > STREAM_MAX_QUEUED_SEGMENTS:
+            _, still_pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending = list(still_pending)
+
+    async def run(self):
+        await self._send({"type": "ready"})
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("bytes"):
+                    self._submit(self.segmenter.feed(message["bytes"]))
+                    await self._drain()
+                    if self.segmenter.seconds > STREAM_MAX_SECONDS:
+                        await self._send({"type": "error", "detail": "Maximum stream duration reached"})
+                        break
+                elif message.get("text") and _is_stop(message["text"]):
+                    break
+            self._submit(self.segmenter.finish())
+            await asyncio.gather(*self.tasks)
+        except WebSocketDisconnect:
+            for task in self.tasks:
+                task.cancel()
+            logger.info("Streaming client disconnected", extra={"segments": len(self.tasks)})
+            return
+
+        ordered = sorted(self.segments, key=lambda segment: segment["index"])
+        await self._send({
+            "type": "final",
+            "transcription": " ".join(segment["text"] for segment in ordered if segment["text"]),
+            "segments": [{k: v for k, v in segment.items() if k != "index"} for segment in ordered if segment["text"]],
+            "failed_segments": [
+                {"start": segment["start"], "end": segment["end"]} for segment in ordered if segment.get("failed")
+            ],
+            "audio_seconds": round(self.segmenter.seconds, 2),
+            "speech_seconds": round(sum(segment["end"] - segment["start"] for segment in ordered), 2),
+        })
+        await self.websocket.close()
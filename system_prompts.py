@@ -17,6 +17,7 @@ Your response MUST be in JSON format with the following structure:
 Note: 
 - If the transcription mentions background noise or songs despite noise removal being enabled, note this in your analysis.
 - If the content appears to be in a non-English language but has been translated to English, mention this in your response.
+- If paragraphs are prefixed with labels such as SPEAKER_1 and SPEAKER_2, they come from automatic speaker diarization. Attribute statements, decisions and action items to the speakers, keeping in mind that a label can occasionally be wrong.
 """
 
 SYSTEM_PROMPT_V2 = """
@@ -0,0 +1,286 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "none", "file:/path/to/spans.jsonl" or "otlp:http://collector:4318/v1/traces"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "none")
+TRACE_EXPORT_BATCH_SIZE = int(os.getenv("TRACE_EXPORT_BATCH_SIZE", "256"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))
+SERVICE_NAME = os.getenv("SERVICE_NAME", "ai-document-audio-api")
+
+request_id_var = ContextVar("request_id", default=None)
+current_span_var = ContextVar("current_span", default=None)
+
+_STANDARD_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+_TOKEN_QUERY = re.compile(r"([?&](?:token|access_token)=)[^&\s\"]*")
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line with request and trace ids."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("request_id", "trace_id", "span_id"):
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_RECORD_FIELDS and key not in entry and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _ContextFilter(logging.Filter):
+    """Stamp records with the request and span of the code that logged them.
+
+    Runs on the calling thread, before the record crosses the queue.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        span = current_span_var.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+class _RedactTokenFilter(logging.Filter):
+    """Mask token query parameters in server logs, uvicorn logs WebSocket paths with their query string."""
+
+    def filter(self, record):
+        if record.name.startswith("uvicorn") and isinstance(record.args, tuple):
+            record.args = tuple(
+                _TOKEN_QUERY.sub(r"\1[redacted]", arg) if isinstance(arg, str) else arg for arg in record.args)
+        return True
+
+
+def configure_logging():
+    """Route all logging through a queue so request threads never block on stdout."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        log_queue = queue.SimpleQueue()
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter())
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(_ContextFilter())
+        queue_handler.addFilter(_RedactTokenFilter())
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(LOG_LEVEL)
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+
+
+def _restart_after_fork():
+    """Restart background threads in a forked worker, they don't survive the fork."""
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    if _exporter is not None:
+        _exporter.queue = queue.Queue(maxsize=10000)
+        _exporter.start()
+
+
+class Span:
+    """A timed unit of work within a trace."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6 if self.end_ns else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _SpanExporter:
+    """Ships finished spans from a background thread, dropping them if the queue is full."""
+
+    def __init__(self, target):
+        self.target = target
+        self.queue = queue.Queue(maxsize=10000)
+        self.start()
+        atexit.register(self.flush)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self.thread.start()
+
+    def submit(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def _drain(self):
+        batch = []
+        while len(batch) < TRACE_EXPORT_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            time.sleep(TRACE_EXPORT_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        batch = self._drain()
+        while batch:
+            try:
+                self._export(batch)
+            except Exception as e:
+                logging.getLogger(__name__).warning("Span export failed: %s", e)
+            batch = self._drain()
+
+    def _export(self, spans):
+        if self.target.startswith("file:"):
+            with open(self.target[len("file:"):], "a", encoding="utf-8") as out:
+                for span in spans:
+                    out.write(json.dumps(span.to_dict(), default=str) + "\n")
+        elif self.target.startswith("otlp:"):
+            payload = {
+                "resourceSpans": [{
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                    "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [s.to_otlp() for s in spans]}],
+                }]
+            }
+            request = urllib.request.Request(
+                self.target[len("otlp:"):],
+                data=json.dumps(payload).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+
+
+_exporter = _SpanExporter(TRACE_EXPORT) if TRACE_EXPORT != "none" else None
+# gunicorn with preload_app forks workers after this module was imported
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Record a tracing span around a block of work, nested under the current span."""
+    parent = current_span_var.get()
+    trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+    current = Span(name, trace_id, parent.span_id if parent is not None else None, attributes)
+    token = current_span_var.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current_span_var.reset(token)
+        current.end_ns = time.time_ns()
+        if _exporter is not None:
+            _exporter.submit(current)
+
+
+class RequestContextMiddleware:
+    """ASGI middleware assigning a request id and root span to every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger("api.access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            with span(f"{scope['method']} {scope['path']}", request_id=request_id) as root:
+                await self.app(scope, receive, send_with_request_id)
+                root.set_attribute("http.status_code", status)
+        finally:
+            self.logger.info(
+                "%s %s %s", scope["method"], scope["path"], status,
+                extra={"status": status, "duration_ms": round((time.perf_counter() - start) * 1000, 1)},
+            )
+            request_id_var.reset(token)
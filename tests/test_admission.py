@@ -0,0 +1,70 @@
+import io
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AUDIO_BYTES_PER_SECOND, VIDEO_BYTES_PER_SECOND, AdmissionPool, RequestCost, admit, estimate_cost
+
+MB = 1024 * 1024
+
+
+def upload(tmp_path, filename, size):
+    # Sparse files, so large uploads cost no disk
+    path = tmp_path / filename
+    with open(path, 'wb') as file:
+        file.truncate(size)
+    return SimpleNamespace(filename=filename, file=open(path, 'rb'))
+
+
+@pytest.mark.parametrize("filename, size, cost", [
+    ("notes.txt", 100, RequestCost("light", 1)),
+    ("sheet.XLSX", 25 * MB, RequestCost("light", 3)),
+    ("report.pdf", 5 * MB, RequestCost("light", 1)),
+    ("call.mp3", 599 * AUDIO_BYTES_PER_SECOND, RequestCost("heavy", 1)),
+    ("call.mp3", 1200 * AUDIO_BYTES_PER_SECOND, RequestCost("heavy", 3)),
+    ("meeting.mp4", 3600 * VIDEO_BYTES_PER_SECOND, RequestCost("heavy", 7)),
+])
+def test_estimate_cost(tmp_path, filename, size, cost):
+    file = upload(tmp_path, filename, size)
+    with file.file:
+        assert estimate_cost(file) == cost
+        # The estimate leaves the file where it was
+        assert file.file.tell() == 0
+
+
+def test_estimate_cost_without_file():
+    assert estimate_cost(None) == RequestCost("light", 1)
+
+
+def test_rasterized_pdf_is_heavy():
+    file = SimpleNamespace(filename="scan.pdf", file=io.BytesIO(b"not a pdf"))
+    assert estimate_cost(file, rasterize=True) == RequestCost("heavy", 1)
+
+
+def test_admit_none_holds_nothing():
+    with admit(None):
+        pass
+
+
+def test_pool_rejects_when_queue_is_full():
+    pool = AdmissionPool("test", capacity=2, max_queue=0)
+    assert pool.acquire(5, timeout=1) == 2
+    with pytest.raises(HTTPException) as error:
+        pool.acquire(1, timeout=1)
+    assert error.value.status_code == 503
+    assert int(error.value.headers["Retry-After"]) >= 1
+    pool.release(2, held_seconds=1.0)
+    assert pool.acquire(1, timeout=1) == 1
+
+
+def test_pool_rejects_after_timeout():
+    pool = AdmissionPool("test", capacity=1, max_queue=1)
+    pool.acquire(1, timeout=1)
+    with pytest.raises(HTTPException):
+        pool.acquire(1, timeout=0.01)
+    assert pool.waiting == 0
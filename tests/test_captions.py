@@ -0,0 +1,51 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from captions import compact_segments, remap_timestamps, to_srt, to_vtt
+from vad import TimestampMap
+
+
+def timestamp_map():
+    # Speech at 0-10 s and 30-40 s of the original, with the 20 s pause shortened to 0.3 s
+    mapping = TimestampMap()
+    mapping.add(0.0, 0.0, 10.0)
+    mapping.add(10.3, 30.0, 10.0)
+    return mapping
+
+
+def test_compact_segments_shifts_by_chunk_offset():
+    segments = [SimpleNamespace(start=1.0, end=2.5, text=" Hello "), {"start": 3, "end": 4, "word": "there"}]
+    assert compact_segments(segments, offset=600.0) == [
+        {"start": 601.0, "end": 602.5, "text": "Hello"},
+        {"start": 603.0, "end": 604.0, "word": "there"},
+    ]
+
+
+def test_remap_timestamps_without_map():
+    entries = [{"start": 1.0, "end": 2.0, "text": "a"}]
+    assert remap_timestamps(entries, None) == [{"start": 1.0, "end": 2.0, "text": "a"}]
+
+
+def test_remap_timestamps_after_a_removed_pause():
+    entries = [{"start": 2.0, "end": 9.5, "text": "a"}, {"start": 10.3, "end": 12.25, "text": "b"}]
+    assert remap_timestamps(entries, timestamp_map()) == [
+        {"start": 2.0, "end": 9.5, "text": "a"},
+        {"start": 30.0, "end": 31.95, "text": "b"},
+    ]
+
+
+def test_remap_timestamps_inside_an_inserted_pause():
+    # A time in the kept 0.3 s of silence stays within the original pause
+    entries = [{"start": 10.1, "end": 10.2, "text": ""}]
+    assert remap_timestamps(entries, timestamp_map()) == [{"start": 10.1, "end": 10.2, "text": ""}]
+    entries = [{"start": 9.0, "end": 10.29, "text": "a"}]
+    assert remap_timestamps(entries, timestamp_map())[0]["end"] <= 30.0
+
+
+def test_srt_and_vtt():
+    segments = [{"start": 3661.5, "end": 3662.0, "text": "Hi"}]
+    assert to_srt(segments) == "1\n01:01:01,500 --> 01:01:02,000\nHi\n"
+    assert to_vtt(segments) == "WEBVTT\n\n01:01:01.500 --> 01:01:02.000\nHi\n"
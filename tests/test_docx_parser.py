@@ -0,0 +1,83 @@
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx_parser import extract_docx_text, iter_docx_blocks, table_to_markdown
+
+W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+STYLES = (
+    f'<w:styles {W}>'
+    '<w:style w:styleId="berschrift1"><w:name w:val="heading 1"/></w:style>'
+    '<w:style w:styleId="Heading2"><w:name w:val="heading 2"/></w:style>'
+    '<w:style w:styleId="Titel"><w:name w:val="Title"/></w:style>'
+    '</w:styles>'
+)
+
+
+def docx(body, styles=STYLES):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', f'<w:document {W}><w:body>{body}</w:body></w:document>')
+        if styles is not None:
+            archive.writestr('word/styles.xml', styles)
+    buffer.seek(0)
+    return buffer
+
+
+def p(text, style=None):
+    properties = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ''
+    return f'<w:p>{properties}<w:r><w:t>{text}</w:t></w:r></w:p>'
+
+
+def tc(text, span=1):
+    properties = f'<w:tcPr><w:gridSpan w:val="{span}"/></w:tcPr>' if span > 1 else ''
+    return f'<w:tc>{properties}{p(text)}</w:tc>'
+
+
+@pytest.mark.parametrize("body, text", [
+    (p('First') + p('Second'), 'First\n\nSecond'),
+    (p('Heading', 'berschrift1') + p('Body'), '# Heading\n\nBody'),
+    (p('Sub', 'Heading2'), '## Sub'),
+    (p('Title', 'Titel'), '# Title'),
+    ('<w:p><w:pPr><w:outlineLvl w:val="2"/></w:pPr><w:r><w:t>Outline</w:t></w:r></w:p>', '### Outline'),
+    ('<w:p><w:r><w:t>a</w:t><w:tab/><w:t>b</w:t><w:br/><w:t>c</w:t></w:r></w:p>', 'a\tb\nc'),
+    (p('') + p('Kept'), 'Kept'),
+])
+def test_extract(body, text):
+    assert extract_docx_text(docx(body)) == text
+
+
+def test_table_as_markdown():
+    table = f'<w:tbl><w:tr>{tc("Name")}{tc("Role")}</w:tr><w:tr>{tc("Ann")}{tc("a|b")}</w:tr></w:tbl>'
+    assert extract_docx_text(docx(p('Before') + table + p('After'))) == (
+        'Before\n\n| Name | Role |\n|---|---|\n| Ann | a\\|b |\n\nAfter')
+
+
+def test_merged_cells_keep_columns():
+    table = f'<w:tbl><w:tr>{tc("Wide", span=2)}{tc("C")}</w:tr><w:tr>{tc("1")}{tc("2")}{tc("3")}</w:tr></w:tbl>'
+    assert list(iter_docx_blocks(docx(table))) == [('table', [['Wide', '', 'C'], ['1', '2', '3']])]
+
+
+def test_nested_table_is_flattened_into_its_cell():
+    inner = f'<w:tbl><w:tr>{tc("x")}{tc("y")}</w:tr><w:tr>{tc("z")}</w:tr></w:tbl>'
+    table = f'<w:tbl><w:tr><w:tc>{p("Outer")}{inner}</w:tc></w:tr></w:tbl>'
+    assert list(iter_docx_blocks(docx(table))) == [('table', [['Outer\nx / y\nz']])]
+
+
+def test_text_box_paragraphs_join_their_parent():
+    body = '<w:p><w:r><w:t>Main</w:t></w:r><w:r><w:txbxContent>' + p('Boxed') + '</w:txbxContent></w:r></w:p>'
+    assert extract_docx_text(docx(body)) == 'Main Boxed'
+
+
+def test_without_styles_part():
+    assert extract_docx_text(docx(p('Plain', 'berschrift1'), styles=None)) == 'Plain'
+
+
+def test_ragged_rows_are_padded():
+    assert table_to_markdown([['a', 'b'], ['c']]) == '| a | b |\n|---|---|\n| c |  |'
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fingerprint
+from fingerprint import FINGERPRINT_MIN_MATCHES, Fingerprint, _MemoryIndex, _SqliteIndex, find_duplicate, index_fingerprint
+
+HASHES = list(range(1000, 1000 + 4 * FINGERPRINT_MIN_MATCHES, 4))
+TIMES = list(range(0, 10 * len(HASHES), 10))
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def index(request, monkeypatch, tmp_path):
+    index = _MemoryIndex(max_recordings=2) if request.param == "memory" else _SqliteIndex(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(fingerprint, "_index", index)
+    return index
+
+
+def test_matches_a_shifted_copy(index):
+    index_fingerprint("original", Fingerprint(HASHES, TIMES, 60.0))
+    # The copy starts 1.024 s (32 frames) later in the recording
+    match = find_duplicate(Fingerprint(HASHES, [t + 32 for t in TIMES], 60.3))
+    assert (match.digest, match.matches, match.offset) == ("original", len(HASHES), 1.02)
+
+
+def test_excludes_the_recording_itself(index):
+    index_fingerprint("original", Fingerprint(HASHES, TIMES, 60.0))
+    assert find_duplicate(Fingerprint(HASHES, TIMES, 60.0), exclude="original") is None
+
+
+def test_needs_enough_consistent_matches(index):
+    index_fingerprint("original", Fingerprint(HASHES, TIMES, 60.0))
+    shared = FINGERPRINT_MIN_MATCHES - 1
+    assert find_duplicate(Fingerprint(HASHES[:shared] + [1, 2, 3], TIMES[:shared] + [0, 0, 0], 60.0)) is None
+    # The same hashes at unrelated offsets are a different recording
+    assert find_duplicate(Fingerprint(HASHES, [t * 3 for t in TIMES], 60.0)) is None
+
+
+def test_durations_must_agree(index):
+    index_fingerprint("original", Fingerprint(HASHES, TIMES, 60.0))
+    assert find_duplicate(Fingerprint(HASHES, TIMES, 90.0)) is None
+
+
+def test_expired_recordings_do_not_match(index, monkeypatch):
+    index_fingerprint("original", Fingerprint(HASHES, TIMES, 60.0), ttl=10)
+    now = fingerprint.time.time()
+    monkeypatch.setattr(fingerprint.time, "time", lambda: now + 60)
+    assert find_duplicate(Fingerprint(HASHES, TIMES, 60.0)) is None
+
+
+def test_memory_index_evicts_least_recently_used():
+    index = _MemoryIndex(max_recordings=2)
+    for digest, offset in (("a", 0), ("b", 1), ("c", 2)):
+        index.add(digest, Fingerprint([h + offset for h in HASHES], TIMES, 60.0), None)
+    assert list(index.recordings) == ["b", "c"]
+    assert all(digest != "a" for postings in index.postings.values() for digest, _ in postings)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_router import CHARS_PER_TOKEN, ROUTER_LARGE_MODEL, ROUTER_LONG_DOCUMENT_TOKENS, ROUTER_SMALL_MODEL, choose_model
+
+LONG_DOCUMENT = "x" * ((ROUTER_LONG_DOCUMENT_TOKENS + 1) * CHARS_PER_TOKEN)
+
+
+@pytest.mark.parametrize("prompt, document_text, images, model, reason", [
+    ("What is the notice period?", "Short contract", 0, ROUTER_SMALL_MODEL, "default"),
+    ("Summarize the document", "Short contract", 0, ROUTER_SMALL_MODEL, "default"),
+    ("Rewrite the introduction", "", 0, ROUTER_LARGE_MODEL, "rewrite"),
+    ("I'm rewriting the intro, tighten it", "", 0, ROUTER_LARGE_MODEL, "rewrite"),
+    ("Help with revising section 2", "", 0, ROUTER_LARGE_MODEL, "rewrite"),
+    ("Return the modified terms", "", 0, ROUTER_LARGE_MODEL, "rewrite"),
+    ("Translating to French please", "", 0, ROUTER_LARGE_MODEL, "rewrite"),
+    ("Paraphrasing each clause", "", 0, ROUTER_LARGE_MODEL, "rewrite"),
+    ("Proofread it", "", 0, ROUTER_LARGE_MODEL, "rewrite"),
+    ("Amendments to section 4?", "", 0, ROUTER_LARGE_MODEL, "rewrite"),
+    ("What does the chart show?", "", 1, ROUTER_LARGE_MODEL, "images"),
+    ("Rewrite the caption", "", 2, ROUTER_LARGE_MODEL, "images"),
+    ("Who are the parties?", LONG_DOCUMENT, 0, ROUTER_LARGE_MODEL, "long_document"),
+])
+def test_choose_model(prompt, document_text, images, model, reason):
+    decision = choose_model(prompt, document_text, images)
+    assert (decision.model, decision.reason) == (model, reason)
@@ -0,0 +1,64 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rtf_parser import RtfTokenizer, decode_text, extract_rtf_text
+
+
+def extract(data, chunk_size=64 * 1024):
+    return extract_rtf_text(io.BytesIO(data), chunk_size=chunk_size)
+
+
+@pytest.mark.parametrize("rtf, text", [
+    (rb"{\rtf1\ansi Hello\par World}", "Hello\nWorld"),
+    (rb"{\rtf1{\fonttbl{\f0 Arial;}}{\colortbl;\red0\green0\blue0;}Body}", "Body"),
+    (rb"{\rtf1{\*\generator Writer;}Kept}", "Kept"),
+    (rb"{\rtf1 caf\'e9}", "café"),
+    (rb"{\rtf1\ansi\ansicpg1251 \'cf\'f0\'e8}", "При"),
+    (rb"{\rtf1 \u233?t\u233?}", "été"),
+    (rb"{\rtf1\uc2 \u233??x}", "éx"),
+    (rb"{\rtf1 a\\b\{c\}}", "a\\b{c}"),
+    (rb"{\rtf1 A\cell B\cell\row}", "A | B | \n"),
+    (rb"{\rtf1 \ldblquote x\rdblquote}", "“x”"),
+])
+def test_extract(rtf, text):
+    assert extract(rtf) == text
+
+
+def test_surrogate_pair_is_combined():
+    text = extract(rb"{\rtf1 Hi \u-10179?\u-8704? there}")
+    assert text == "Hi \U0001F600 there"
+    text.encode("utf-8")
+
+
+@pytest.mark.parametrize("rtf", [
+    rb"{\rtf1 a\u-10179?b}",
+    rb"{\rtf1 a\u-8704?b}",
+    rb"{\rtf1 a\u-10179?}",
+    rb"{\rtf1 a\u-10179?\u-10179?\u-8704?b}",
+])
+def test_unpaired_surrogates_are_replaced(rtf):
+    text = extract(rtf)
+    assert "�" in text
+    text.encode("utf-8")
+
+
+def test_tokens_split_across_chunks():
+    rtf = rb"{\rtf1\ansi " + rb"word\par caf\'e9 \u-10179?\u-8704? \\ " * 200 + b"}"
+    assert extract(rtf, chunk_size=7) == extract(rtf)
+
+
+def test_feed_byte_by_byte():
+    tokenizer = RtfTokenizer()
+    for byte in rb"{\rtf1 x\u8364?y}":
+        tokenizer.feed(bytes([byte]))
+    assert tokenizer.close() == "x€y"
+
+
+def test_plain_text_fallback():
+    assert extract("plain café".encode("utf-8")) == "plain café"
+    assert decode_text("café".encode("cp1252")) == "café"
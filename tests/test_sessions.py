@@ -0,0 +1,91 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sessions
+from sessions import Session, chunk_text, relevant_chunks, save_turn, session_context, session_turn
+
+
+def make_session(chunks, previous_response_id=None, sent_chunks=()):
+    return Session(
+        "s1", "doc.txt", "\n\n".join(chunks), chunks, None, [], None, previous_response_id, 0.0, sent_chunks)
+
+
+@pytest.mark.parametrize("text, size, chunks", [
+    ("", 10, []),
+    ("short", 10, ["short"]),
+    ("aaaa\n\nbbbb", 10, ["aaaa\n\nbbbb"]),
+    ("aaaa\n\nbbbbb", 10, ["aaaa", "bbbbb"]),
+    ("x" * 25, 10, ["x" * 10, "x" * 10, "x" * 5]),
+    ("aa\n\n" + "y" * 12 + "\n\nbb", 10, ["aa", "y" * 10, "yy\n\nbb"]),
+])
+def test_chunk_text(text, size, chunks):
+    assert chunk_text(text, size) == chunks
+
+
+def test_chunk_text_keeps_every_character():
+    text = "\n\n".join(f"Paragraph {i} " + "word " * (i * 7) for i in range(50))
+    chunks = chunk_text(text, 200)
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert "".join(chunks).replace("\n", "") == text.replace("\n", "")
+
+
+def test_relevant_chunks_in_document_order():
+    session = make_session(["cats and dogs", "invoice payment terms", "payment due", "weather"])
+    assert relevant_chunks(session, "When is the payment due?", max_chars=32) == [1, 2]
+    # Chunks without shared terms fill the rest of the budget
+    assert relevant_chunks(session, "When is the payment due?", max_chars=40) == [1, 2, 3]
+    assert relevant_chunks(session, "When is the payment due?", max_chars=12) == [2]
+
+
+def test_short_document_is_sent_once(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_MAX_CONTEXT_CHARS", 1000)
+    session = make_session(["whole document"])
+    context, session = session_context(session, "question")
+    assert context == "whole document"
+    context, _ = session_context(session._replace(previous_response_id="r1"), "another question")
+    assert context == ""
+
+
+# Two of these chunks fit the default SESSION_TURN_CONTEXT_CHARS of a turn
+CHUNKS = ["alpha " * 2500, "beta " * 3000, "gamma " * 2500, "delta " * 2500]
+
+
+def test_long_document_sends_only_new_chunks(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_MAX_CONTEXT_CHARS", 40000)
+    session = make_session(CHUNKS, previous_response_id="r1", sent_chunks=(0,))
+    context, session = session_context(session, "alpha beta")
+    assert context == CHUNKS[1]
+    assert session.sent_chunks == (0, 1)
+    assert session.previous_response_id == "r1"
+
+
+def test_long_document_starts_a_new_chain(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_MAX_CONTEXT_CHARS", 40000)
+    session = make_session(CHUNKS, previous_response_id="r1", sent_chunks=(0, 1))
+    context, session = session_context(session, "gamma")
+    assert context == CHUNKS[0] + "\n\n" + CHUNKS[2]
+    assert session.previous_response_id is None
+    assert session.sent_chunks == (0, 2)
+
+
+def test_session_turn_is_exclusive():
+    with session_turn("s2") as first:
+        with session_turn("s2") as second:
+            assert (first, second) == (True, False)
+        with session_turn("s3") as other:
+            assert other
+    with session_turn("s2") as again:
+        assert again
+
+
+def test_save_turn_rejects_a_moved_session():
+    session = sessions.create_session("doc.txt", "text")
+    assert save_turn(session._replace(previous_response_id="r1"), None)
+    assert not save_turn(session._replace(previous_response_id="r2"), None)
+    assert sessions.get_session(session.session_id).previous_response_id == "r1"
+    sessions.delete_session(session.session_id)
+    assert not save_turn(session._replace(previous_response_id="r3"), "r1")
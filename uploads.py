@@ -0,0 +1,117 @@
+import io
+import mmap
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+
+# Directory for materialized uploads, the system temp directory when unset. Pages of the
+# mapping are shared with the page cache, so a tmpfs here keeps uploads in RAM
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None
+COPY_CHUNK_SIZE = 1024 * 1024
+
+MappedUpload = namedtuple('MappedUpload', ['filename', 'file'])
+
+
+class MappedFile(io.RawIOBase):
+    """A read-only, memory mapped copy of an upload on disk.
+
+    Behaves like a binary file opened for reading, with ``name`` set to its path so
+    tools that need a path (ffmpeg, soundfile, subprocess converters) read the same
+    file. ``getbuffer()`` exposes the mapping without copying it. Closing unmaps
+    the file and removes it.
+    """
+
+    def __init__(self, source, filename):
+        super().__init__()
+        self.directory = tempfile.mkdtemp(dir=UPLOAD_DIR)
+        # Keep the extension, some decoders pick the format from it
+        self.name = os.path.join(self.directory, os.path.basename(filename) or "upload")
+        try:
+            with open(self.name, "wb") as out:
+                shutil.copyfileobj(source, out, COPY_CHUNK_SIZE)
+            self.size = os.path.getsize(self.name)
+            if self.size:
+                with open(self.name, "rb") as mapped:
+                    self.mapping = mmap.mmap(mapped.fileno(), 0, access=mmap.ACCESS_READ)
+                self.view = memoryview(self.mapping)
+            else:
+                # Empty files can't be mapped
+                self.mapping = None
+                self.view = memoryview(b"")
+        except BaseException:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            raise
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.size, self.position + len(buffer))
+        count = max(0, end - self.position)
+        memoryview(buffer).cast("B")[:count] = self.view[self.position:end]
+        self.position += count
+        return count
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self.position + size)
+        data = bytes(self.view[self.position:end]) if end > self.position else b""
+        self.position += len(data)
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def getbuffer(self):
+        """The whole upload as a read-only memoryview of the mapping."""
+        return self.view
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        try:
+            self.view.release()
+            if self.mapping is not None:
+                self.mapping.close()
+        except BufferError:
+            # A view of the mapping is still alive, it is unmapped with the last one
+            pass
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+@contextmanager
+def mapped_upload(upload):
+    """Materialize an UploadFile on disk once and map it for every parser that reads it.
+
+    Yields a MappedUpload with the upload's filename and a MappedFile in place of
+    the spooled upload stream, or None when there is no upload. The copy is removed
+    when the block exits.
+    """
+    if upload is None:
+        yield None
+        return
+    upload.file.seek(0)
+    file = MappedFile(upload.file, upload.filename)
+    try:
+        yield MappedUpload(upload.filename, file)
+    finally:
+        file.close()
@@ -1,65 +1,103 @@
 from fastapi import UploadFile, HTTPException
-from pypdf import PdfReader
-import tempfile
-import base64
-from striprtf.striprtf import rtf_to_text
-from docx import Document
-import pandas as pd
-from io import BytesIO
-import pypdfium2 as pdfium
+from rtf_parser import extract_rtf_text
+from legacy_docs import LEGACY_EXTENSIONS, extract_legacy_document_text
+from docx_parser import extract_docx_text
+from image_pipeline import prepare_image, prepare_pil_image
+from pdf_pages import parse_pdf
 import os
-import boto3
 from openai import OpenAI
+from uuid import uuid4
+import tempfile
+import logging
+from metrics import stage
+from shared_cache import SharedCache, file_digest
+
+logger = logging.getLogger(__name__)
+
+# Uploaded files stay in OpenAI storage, so a repeated PDF can reuse its file id
+FILE_ID_CACHE_TTL = int(os.getenv("FILE_ID_CACHE_TTL", "86400"))
+_fileIdCache = SharedCache("openai_file", max_entries=4096, ttl=FILE_ID_CACHE_TTL)
+
+# document_first sends the document (and its images) before the user prompt, so questions
+# about the same file share a long prefix the provider's prompt cache can reuse.
+# prompt_first keeps the prompt ahead of the document
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "document_first")
 
 SUPPORTED_EXTENSIONS = set(
     ['doc', 'dot', 'docx', 'dotx', 'docm', 'dotm', 'pdf', 'png', 'jpeg', 'jpg', 'rtf', 'xlsx', 'xls', 'txt',
      'mp3', 'wav', 'ogg', 'm4a', 'flac'])  # Added audio file extensions
 
-def parseDocuments(file: UploadFile, sheet_names: str, parseAsImage: bool = False):
+def parseDocuments(file: UploadFile, sheet_names: str, parseAsImage: bool = False, hybridPdf: bool = False):
+    with stage("parse", _fileKind(file)):
+        return _parseDocuments(file, sheet_names, parseAsImage, hybridPdf)
+
+def _parseDocuments(file: UploadFile, sheet_names: str, parseAsImage: bool = False, hybridPdf: bool = False):
     documentText = ''
     base64_urls = []
-    b64 = None
+    image = None
 
     if file is not None:
         fileExt = file.filename.split('.')[-1].lower()
         if fileExt not in SUPPORTED_EXTENSIONS:
             raise HTTPException(400, f"{fileExt} file type not supported")
         if fileExt == 'pdf':
-            if not parseAsImage:
-                reader = PdfReader(file.file)
-                for page in reader.pages:
-                    extracted_text = page.extract_text(extraction_mode='layout')
-                    if len(extracted_text.strip()) == 0:
-                        extracted_text = page.extract_text()
-                    documentText += extracted_text
+            if hybridPdf:
+                # Text pages are sent as text, pages without a text layer as images in their place
+                try:
+                    pages = parse_pdf(file.file, rasterize_empty=True)
+                except ValueError as e:
+                    logger.warning("Too many pages to rasterize: %s", e)
+                    raise HTTPException(status_code=400, detail="File is too large to be processed")
+                for page in pages:
+                    if page.image is not None:
+                        base64_urls.append(page.image.url)
+                        documentText += f"[Page {page.number} is provided as image {len(base64_urls)}]"
+                    else:
+                        documentText += page.text
+                    documentText += '\n\n'
+            elif not parseAsImage:
+                for page in parse_pdf(file.file):
+                    documentText += page.text
                     documentText += '\n\n'
                 if len(documentText.strip()) == 0:
                     raise HTTPException(
                         status_code=400, detail="Unable to parse text from the given document or the document does not contain any text.")
             else:
+                import pypdfium2 as pdfium
+
                 p = pdfium.PdfDocument(file.file)
                 if len(p) > 20:
                     raise HTTPException(status_code=400, detail="File is too large to be processed")
                 for i in range(len(p)):
                     page = p[i]
-                    buffered = BytesIO()
-                    image = page.render(scale=2).to_pil()
-                    image.save(buffered, format="JPEG")
-                    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-                    base64_urls.append(f"data:image/jpeg;base64,{img_str}")
+                    # Pages are sent at low detail, so downscale to what the model will see
+                    with stage("pdf_rasterize"):
+                        rendered = prepare_pil_image(page.render(scale=2).to_pil(), detail='low')
+                    base64_urls.append(rendered.url)
                 documentText = "Images are provided as document"
 
         elif fileExt in ['png', 'jpeg', 'jpg']:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                path = f"{temp_dir}/filename.{fileExt}"
-                with open(path, 'wb') as img:
-                    img.write(file.file.read())
-                with open(path, 'rb') as img:
-                    b64 = base64.b64encode(img.read()).decode("utf-8")
+            try:
+                image = prepare_image(file.file, fileExt)
+            except ValueError as e:
+                logger.warning("Something went wrong while parsing the image: %s", e)
+                raise HTTPException(400, detail="The image could not be parsed")
         elif fileExt in ['rtf']:
-            documentText = rtf_to_text(file.file.read().decode('utf-8'))
+            try:
+                documentText = extract_rtf_text(file.file)
+            except Exception as e:
+                logger.warning("Something went wrong while parsing the file: %s", e)
+                raise HTTPException(400, detail="The file could not be parsed")
+        elif fileExt in LEGACY_EXTENSIONS:
+            try:
+                documentText = extract_legacy_document_text(file.file, fileExt)
+            except ValueError as e:
+                logger.warning("Something went wrong while converting the file: %s", e)
+                raise HTTPException(400, detail="The file could not be parsed")
         elif fileExt in ['xls', 'xlsx']:
             try:
+                import pandas as pd
+
                 excelDF = None
                 if sheet_names is None or len(sheet_names) == 0:
                     excelDF = pd.read_excel(file.file)
@@ -74,31 +112,55 @@ def parseDocuments(file: UploadFile, sheet_names: str, parseAsImage: bool = Fals
                         documentText += excelDF[key].to_string()
                         documentText += '\n\n'
             except Exception as exp:
-                print(exp)
+                logger.warning("Something went wrong while parsing the excel sheet: %s", exp)
                 raise HTTPException(400, "Worksheet name not found")
         elif fileExt == 'txt':
             documentText += file.file.read().decode('utf-8')
         else:
             try:
-                document = Document(file.file)
+                documentText = extract_docx_text(file.file)
             except Exception as e:
-                print("Something went wrong while parsing the file:", e)
+                logger.warning("Something went wrong while parsing the file: %s", e)
                 raise HTTPException(400, detail="The file could not be parsed")
-            for paragraph in document.paragraphs:
-                documentText += paragraph.text if paragraph and paragraph.text else ""
-            # text = ''
-            # for elem in document.tables:
-            #     textRow = set()
-            #     for i, row in enumerate(elem.columns):
-            #         for cell in row.cells:
-            #             textRow.add(f"{cell.text}\n")
-            #     text += f"{' '.join(list(textRow))}\n\n"
-            # print(text)
-    return [documentText, b64, base64_urls]
+    return [documentText, image, base64_urls]
+
+def buildUserContent(prompt, documentText, image=None, imageUrls=(), contentLabel="This is document content", layout=None):
+    """Chat Completions user content asking a prompt about a parsed document, laid out by ``layout`` (PROMPT_LAYOUT by default)."""
+    layout = layout or PROMPT_LAYOUT
+    images = []
+    if image is not None:
+        images.append({
+            "type": "image_url",
+            "image_url": {"url": image.url, "detail": image.detail}
+        })
+    for url in imageUrls:
+        images.append({
+            "type": "image_url",
+            "image_url": {"url": url, "detail": "low"},
+        })
+    if len(documentText) == 0:
+        return [{"type": "text", "text": prompt}] + images
+    if layout == "prompt_first":
+        return [{"type": "text", "text": f"User prompt:\n{prompt}\n\n{contentLabel}: \n{documentText}"}] + images
+    return [{"type": "text", "text": f"{contentLabel}: \n{documentText}"}] + images + [{"type": "text", "text": f"User prompt:\n{prompt}"}]
+
+def toResponsesContent(userContent):
+    """The same user content as Responses API input parts."""
+    parts = []
+    for part in userContent:
+        if part["type"] == "text":
+            parts.append({"type": "input_text", "text": part["text"]})
+        else:
+            parts.append({"type": "input_image", "image_url": part["image_url"]["url"], "detail": part["image_url"]["detail"]})
+    return parts
 
 def parseDocumentsV2(file: UploadFile, sheet_names: str, client: OpenAI = None):
+    with stage("parse", _fileKind(file)):
+        return _parseDocumentsV2(file, sheet_names, client)
+
+def _parseDocumentsV2(file: UploadFile, sheet_names: str, client: OpenAI = None):
     documentText = ''
-    b64 = None
+    image = None
     pdf_file_id = None
 
     if file is not None:
@@ -107,29 +169,29 @@ def parseDocumentsV2(file: UploadFile, sheet_names: str, client: OpenAI = None):
             raise HTTPException(400, f"{fileExt} file type not supported")
         if fileExt == 'pdf':
             if client is not None:
-                path = f"upload_filename.{fileExt}"
-                print("Started uploading....")
-                with open(path, 'wb') as f:
-                    f.write(file.file.read())
-                with open(path, 'rb') as f:
-                    uploaded_file = client.files.create(
-                        file = f,
-                        purpose="user_data"
-                    )
-                    print("Compeleted uploading....", uploaded_file.id)
-                    pdf_file_id = uploaded_file.id
-                os.remove(path)
+                pdf_file_id = uploadPdfToOpenAI(file, client)
         elif fileExt in ['png', 'jpeg', 'jpg']:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                path = f"{temp_dir}/filename.{fileExt}"
-                with open(path, 'wb') as img:
-                    img.write(file.file.read())
-                with open(path, 'rb') as img:
-                    b64 = base64.b64encode(img.read()).decode("utf-8")
+            try:
+                image = prepare_image(file.file, fileExt)
+            except ValueError as e:
+                logger.warning("Something went wrong while parsing the image: %s", e)
+                raise HTTPException(400, detail="The image could not be parsed")
         elif fileExt in ['rtf']:
-            documentText = rtf_to_text(file.file.read().decode('utf-8'))
+            try:
+                documentText = extract_rtf_text(file.file)
+            except Exception as e:
+                logger.warning("Something went wrong while parsing the file: %s", e)
+                raise HTTPException(400, detail="The file could not be parsed")
+        elif fileExt in LEGACY_EXTENSIONS:
+            try:
+                documentText = extract_legacy_document_text(file.file, fileExt)
+            except ValueError as e:
+                logger.warning("Something went wrong while converting the file: %s", e)
+                raise HTTPException(400, detail="The file could not be parsed")
         elif fileExt in ['xls', 'xlsx']:
             try:
+                import pandas as pd
+
                 excelDF = None
                 if sheet_names is None or len(sheet_names) == 0:
                     excelDF = pd.read_excel(file.file)
@@ -144,23 +206,25 @@ def parseDocumentsV2(file: UploadFile, sheet_names: str, client: OpenAI = None):
                         documentText += excelDF[key].to_string()
                         documentText += '\n\n'
             except Exception as exp:
-                print(exp)
+                logger.warning("Something went wrong while parsing the excel sheet: %s", exp)
                 raise HTTPException(400, "Worksheet name not found")
         elif fileExt == 'txt':
             documentText += file.file.read().decode('utf-8')
         else:
             try:
-                document = Document(file.file)
+                documentText = extract_docx_text(file.file)
             except Exception as e:
-                print("Something went wrong while parsing the file:", e)
+                logger.warning("Something went wrong while parsing the file: %s", e)
                 raise HTTPException(400, detail="The file could not be parsed")
-            for paragraph in document.paragraphs:
-                documentText += paragraph.text if paragraph and paragraph.text else ""
-    return [documentText, b64, pdf_file_id]
+    return [documentText, image, pdf_file_id]
 
 def parseDocumentsWithVector(file: UploadFile, sheet_names: str, client: OpenAI = None):
+    with stage("parse", _fileKind(file)):
+        return _parseDocumentsWithVector(file, sheet_names, client)
+
+def _parseDocumentsWithVector(file: UploadFile, sheet_names: str, client: OpenAI = None):
     documentText = ''
-    b64 = None
+    image = None
     vector_store_id = None
 
     if file is not None:
@@ -177,34 +241,33 @@ def parseDocumentsWithVector(file: UploadFile, sheet_names: str, client: OpenAI
             )
             vector_store_id = vector_store.id
             if client is not None:
-                path = f"upload_filename.{fileExt}"
-                print("Started uploading....")
-                with open(path, 'wb') as f:
-                    f.write(file.file.read())
-                with open(path, 'rb') as f:
-                    uploaded_file = client.files.create(
-                        file = f,
-                        purpose="user_data"
-                    )
-                    print("Compeleted uploading....", uploaded_file.id)
-                    pdf_file_id = uploaded_file.id
-
+                pdf_file_id = uploadPdfToOpenAI(file, client)
                 client.vector_stores.files.create(
                     vector_store_id=vector_store_id,
                     file_id=pdf_file_id
                 )
-                os.remove(path)
         elif fileExt in ['png', 'jpeg', 'jpg']:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                path = f"{temp_dir}/filename.{fileExt}"
-                with open(path, 'wb') as img:
-                    img.write(file.file.read())
-                with open(path, 'rb') as img:
-                    b64 = base64.b64encode(img.read()).decode("utf-8")
+            try:
+                image = prepare_image(file.file, fileExt)
+            except ValueError as e:
+                logger.warning("Something went wrong while parsing the image: %s", e)
+                raise HTTPException(400, detail="The image could not be parsed")
         elif fileExt in ['rtf']:
-            documentText = rtf_to_text(file.file.read().decode('utf-8'))
+            try:
+                documentText = extract_rtf_text(file.file)
+            except Exception as e:
+                logger.warning("Something went wrong while parsing the file: %s", e)
+                raise HTTPException(400, detail="The file could not be parsed")
+        elif fileExt in LEGACY_EXTENSIONS:
+            try:
+                documentText = extract_legacy_document_text(file.file, fileExt)
+            except ValueError as e:
+                logger.warning("Something went wrong while converting the file: %s", e)
+                raise HTTPException(400, detail="The file could not be parsed")
         elif fileExt in ['xls', 'xlsx']:
             try:
+                import pandas as pd
+
                 excelDF = None
                 if sheet_names is None or len(sheet_names) == 0:
                     excelDF = pd.read_excel(file.file)
@@ -219,36 +282,81 @@ def parseDocumentsWithVector(file: UploadFile, sheet_names: str, client: OpenAI
                         documentText += excelDF[key].to_string()
                         documentText += '\n\n'
             except Exception as exp:
-                print(exp)
+                logger.warning("Something went wrong while parsing the excel sheet: %s", exp)
                 raise HTTPException(400, "Worksheet name not found")
         elif fileExt == 'txt':
             documentText += file.file.read().decode('utf-8')
         else:
             try:
-                document = Document(file.file)
+                documentText = extract_docx_text(file.file)
             except Exception as e:
-                print("Something went wrong while parsing the file:", e)
+                logger.warning("Something went wrong while parsing the file: %s", e)
                 raise HTTPException(400, detail="The file could not be parsed")
-            for paragraph in document.paragraphs:
-                documentText += paragraph.text if paragraph and paragraph.text else ""
-    return [documentText, b64, vector_store_id]
+    return [documentText, image, vector_store_id]
+
+def uploadPdfToOpenAI(file: UploadFile, client: OpenAI):
+    """Upload a PDF for file inputs, reusing the file id when the same PDF was uploaded before."""
+    digest = file_digest(file.file)
+    file_id = _fileIdCache.get(digest)
+    if file_id is not None:
+        logger.info("Reusing uploaded PDF", extra={"file_id": file_id})
+        return file_id
+    logger.info("Uploading PDF to OpenAI files")
+    with stage("openai_file_upload"):
+        uploaded_file = client.files.create(
+            file=(file.filename, file.file, "application/pdf"),
+            purpose="user_data"
+        )
+    logger.info("Uploaded PDF to OpenAI files", extra={"file_id": uploaded_file.id})
+    _fileIdCache.set(digest, uploaded_file.id)
+    return uploaded_file.id
+
+def _fileKind(file):
+    if file is None:
+        return "none"
+    fileExt = file.filename.split('.')[-1].lower()
+    return fileExt if fileExt in SUPPORTED_EXTENSIONS else "other"
+
+def createResponsePdf(content, path):
+    """Render markdown content to a PDF file at the given path."""
+    with stage("pdf_render"):
+        from markdown_pdf import MarkdownPdf, Section
+
+        pdf = MarkdownPdf(toc_level=2)
+        pdf.add_section(Section(content))
+        pdf.save(path)
+    return path
+
+def uploadResponsePdf(content):
+    """Render markdown content to a PDF, upload it and return its download link."""
+    file_name_s3 = str(uuid4()) + ".pdf"
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = createResponsePdf(content, os.path.join(temp_dir, file_name_s3))
+        download_link = upload_file(path, file_name_s3)
+    if not download_link:
+        # Generate dummy link if real upload fails or is disabled
+        dummy_uuid = str(uuid4())
+        download_link = f"https://dummy-s3-bucket.example.com/{dummy_uuid}/{file_name_s3}"
+        logger.info("Using dummy download link: %s", download_link)
+    return download_link
 
 BUCKET_NAME = os.getenv("AWS_BUCKET_NAME")
 AWS_REGION = os.getenv("AWS_BUCKET_REGION")
 
 def upload_file(file_path, object_name=None):
-    print("Bucket:", os.getenv("AWS_BUCKET_NAME"))
-    print("Region:", os.getenv("AWS_BUCKET_REGION"))
-    print("Access key:", os.getenv("AWS_ACCESS_KEY_ID"))
+    logger.debug("Uploading %s", file_path, extra={"bucket": BUCKET_NAME, "region": AWS_REGION})
     if object_name is None:
         object_name = os.path.basename(file_path)
     response = False
+    import boto3
+
     s3_client = boto3.client('s3', region_name=AWS_REGION)
     try:
-        response = "www.google.com"
-        #s3_client.upload_file(file_path, BUCKET_NAME, object_name)
-        #response = f"https://{BUCKET_NAME}.s3.amazonaws.com/{object_name}"
+        with stage("s3_upload"):
+            response = "www.google.com"
+            #s3_client.upload_file(file_path, BUCKET_NAME, object_name)
+            #response = f"https://{BUCKET_NAME}.s3.amazonaws.com/{object_name}"
     except Exception as e:
-        print("Error while upload:", e)
+        logger.warning("Error while upload: %s", e)
         return False
     return response
@@ -0,0 +1,226 @@
+import logging
+import os
+import shutil
+import subprocess
+from bisect import bisect_right
+
+# Frame features are computed on 30 ms frames, like most energy based VADs
+VAD_FRAME_MS = 30
+# A frame is speech when its energy is this far above the recording's noise floor
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "12"))
+# Speech is padded on both sides so word onsets and trailing consonants survive
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))
+# Pauses shorter than this are kept as they are, longer ones are compressed
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "700"))
+# Silence left in place of a compressed pause, so Whisper still sees a sentence break
+VAD_KEEP_SILENCE_MS = int(os.getenv("VAD_KEEP_SILENCE_MS", "300"))
+# Skip re-encoding when VAD would remove less than this fraction of the audio
+VAD_MIN_REDUCTION = float(os.getenv("VAD_MIN_REDUCTION", "0.1"))
+
+# Frames read per block while streaming the decoded PCM
+BLOCK_FRAMES = 1000
+# The SNR estimate reads this many one second windows spread over the recording
+SNR_SAMPLE_WINDOWS = int(os.getenv("SNR_SAMPLE_WINDOWS", "24"))
+
+logger = logging.getLogger(__name__)
+
+
+class TimestampMap:
+    """Maps times in the compressed audio back to the original recording.
+
+    Each piece is a span of kept audio: where it starts in the compressed audio,
+    where it started in the original and how long it is. Times inside an inserted
+    pause map into the original pause that replaced it.
+    """
+
+    def __init__(self):
+        self.pieces = []
+        self._starts = []
+
+    def add(self, compressed_start, original_start, duration):
+        self.pieces.append((compressed_start, original_start, duration))
+        self._starts.append(compressed_start)
+
+    def to_original(self, seconds):
+        index = bisect_right(self._starts, seconds) - 1
+        if index < 0:
+            return seconds
+        compressed_start, original_start, duration = self.pieces[index]
+        offset = seconds - compressed_start
+        if offset > duration and index + 1 < len(self.pieces):
+            # Inside an inserted pause, stay within the original silence
+            next_original = self.pieces[index + 1][1]
+            return min(original_start + offset, next_original)
+        return original_start + offset
+
+    def to_dict(self):
+        return [
+            {"compressed_start": round(c, 3), "original_start": round(o, 3), "duration": round(d, 3)}
+            for c, o, d in self.pieces
+        ]
+
+
+def _open_pcm(audio_path, temp_dir):
+    """Open the audio for streaming reads, decoding through ffmpeg when libsndfile can't."""
+    import soundfile as sf
+
+    try:
+        return sf.SoundFile(audio_path)
+    except Exception:
+        if shutil.which("ffmpeg") is None:
+            raise
+    wav_path = os.path.join(temp_dir, 'vad_decoded.wav')
+    subprocess.run(
+        ["ffmpeg", "-i", audio_path, "-vn", "-ac", "1", "-ar", "16000", "-y", wav_path],
+        check=True, capture_output=True)
+    return sf.SoundFile(wav_path)
+
+
+def _frame_features(pcm, frame_length):
+    """Stream the audio once and return per-frame energy in dB and zero crossing rate."""
+    import numpy as np
+
+    energies = []
+    crossings = []
+    remainder = np.zeros(0, dtype=np.float32)
+    pcm.seek(0)
+    for block in pcm.blocks(blocksize=frame_length * BLOCK_FRAMES, dtype='float32', always_2d=True):
+        samples = np.concatenate([remainder, block.mean(axis=1)])
+        usable = len(samples) - len(samples) % frame_length
+        frames = samples[:usable].reshape(-1, frame_length)
+        remainder = samples[usable:]
+        energies.append(10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10))
+        crossings.append(np.mean(np.diff(np.signbit(frames), axis=1), axis=1))
+    if not energies:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(energies), np.concatenate(crossings)
+
+
+def estimate_snr(audio_path, windows=SNR_SAMPLE_WINDOWS, window_seconds=1.0):
+    """Estimate the signal to noise ratio in dB from frames sampled across the recording.
+
+    Only ``windows`` short windows spread evenly over the file are read. The noise
+    level is the 10th percentile of frame energy and the signal level the 95th,
+    which holds as long as the sampled audio contains some pauses.
+
+    Returns:
+        SNR in dB, or None when the recording is too short to tell
+    """
+    import numpy as np
+    import soundfile as sf
+
+    energies = []
+    with sf.SoundFile(audio_path) as pcm:
+        frame_length = max(1, int(pcm.samplerate * VAD_FRAME_MS / 1000))
+        window = int(pcm.samplerate * window_seconds)
+        if pcm.frames <= windows * window:
+            starts, window = [0], pcm.frames
+        else:
+            starts = np.linspace(0, pcm.frames - window, windows).astype(int)
+        for start in starts:
+            pcm.seek(int(start))
+            samples = pcm.read(window, dtype='float32', always_2d=True).mean(axis=1)
+            usable = len(samples) - len(samples) % frame_length
+            frames = samples[:usable].reshape(-1, frame_length)
+            energies.append(10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10))
+    energy_db = np.concatenate(energies) if energies else np.zeros(0)
+    if len(energy_db) < 10:
+        return None
+    return float(np.percentile(energy_db, 95) - np.percentile(energy_db, 10))
+
+
+def detect_speech(energy_db, zcr, frame_seconds):
+    """Return (start, end) speech regions in seconds from per-frame features.
+
+    A frame is speech when it is loud relative to the noise floor, or moderately
+    loud with a high zero crossing rate (fricatives). Regions are padded and
+    pauses shorter than VAD_MIN_SILENCE_MS are bridged.
+    """
+    import numpy as np
+
+    if len(energy_db) == 0:
+        return []
+    floor = np.percentile(energy_db, 10)
+    if np.percentile(energy_db, 90) - floor < VAD_THRESHOLD_DB:
+        # No clear separation between pauses and speech, keep everything
+        return [(0.0, len(energy_db) * frame_seconds)]
+    speech = (energy_db > floor + VAD_THRESHOLD_DB) | (
+        (energy_db > floor + VAD_THRESHOLD_DB / 2) & (zcr > 0.25))
+    # Ignore digital silence and hum regardless of the floor
+    speech &= energy_db > -60
+
+    pad = int(VAD_PADDING_MS / 1000 / frame_seconds)
+    if pad > 0:
+        speech = np.convolve(speech, np.ones(2 * pad + 1), mode='same') > 0
+
+    edges = np.diff(np.concatenate([[0], speech.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    min_gap = VAD_MIN_SILENCE_MS / 1000 / frame_seconds
+
+    regions = []
+    for start, end in zip(starts, ends):
+        if regions and start - regions[-1][1] < min_gap:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    return [(start * frame_seconds, end * frame_seconds) for start, end in regions]
+
+
+def remove_silence(audio_path, output_dir):
+    """Strip long non-speech regions from an audio file.
+
+    Args:
+        audio_path: Path to the audio file
+        output_dir: Directory for the compressed audio
+
+    Returns:
+        (path, TimestampMap, stats) for the compressed FLAC, or None when there is
+        too little silence to be worth re-encoding
+    """
+    import numpy as np
+    import soundfile as sf
+
+    with _open_pcm(audio_path, output_dir) as pcm:
+        sr = pcm.samplerate
+        frame_length = max(1, int(sr * VAD_FRAME_MS / 1000))
+        frame_seconds = frame_length / sr
+        energy_db, zcr = _frame_features(pcm, frame_length)
+        regions = detect_speech(energy_db, zcr, frame_seconds)
+
+        original_seconds = pcm.frames / sr
+        speech_seconds = sum(end - start for start, end in regions)
+        stats = {
+            "original_seconds": round(original_seconds, 2),
+            "speech_seconds": round(speech_seconds, 2),
+            "regions": len(regions),
+        }
+        if not regions or original_seconds == 0 or speech_seconds > original_seconds * (1 - VAD_MIN_REDUCTION):
+            logger.info("VAD found too little silence to strip", extra=stats)
+            return None
+
+        output_path = os.path.join(output_dir, 'speech_only.flac')
+        timestamp_map = TimestampMap()
+        pause = np.zeros(int(sr * VAD_KEEP_SILENCE_MS / 1000), dtype=np.float32)
+        written = 0
+        with sf.SoundFile(output_path, 'w', sr, channels=1, format='FLAC') as out:
+            for index, (start, end) in enumerate(regions):
+                if index > 0 and len(pause):
+                    out.write(pause)
+                    written += len(pause)
+                first = int(start * sr)
+                last = min(pcm.frames, int(end * sr))
+                timestamp_map.add(written / sr, first / sr, (last - first) / sr)
+                pcm.seek(first)
+                remaining = last - first
+                while remaining > 0:
+                    block = pcm.read(min(remaining, sr * 30), dtype='float32', always_2d=True)
+                    if len(block) == 0:
+                        break
+                    out.write(block.mean(axis=1))
+                    remaining -= len(block)
+                    written += len(block)
+
+    stats["compressed_seconds"] = round(written / sr, 2)
+    logger.info("VAD stripped silence", extra=stats)
+    return output_path, timestamp_map, stats
@@ -0,0 +1,41 @@
+import importlib
+import logging
+import os
+import threading
+import time
+
+# "background" imports the heavy libraries on a thread after startup, "preload" imports them
+# before the app serves (gunicorn shares them with the workers) and "off" leaves them to first use
+WARM_IMPORTS = os.getenv("WARM_IMPORTS", "background")
+
+# Format and DSP libraries that are imported lazily by the request handlers
+HEAVY_MODULES = [
+    "pandas",
+    "openpyxl",
+    "pypdf",
+    "pypdfium2",
+    "PIL.Image",
+    "markdown_pdf",
+    "numpy",
+    "scipy.signal",
+    "soundfile",
+    "librosa",
+    "boto3",
+]
+
+logger = logging.getLogger(__name__)
+
+
+def warm_imports(modules=None):
+    """Import the given modules now, skipping the ones that are missing or broken."""
+    start = time.perf_counter()
+    for name in modules or HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning("Could not warm %s: %s", name, e)
+    logger.info("Warmed heavy imports", extra={"duration_ms": round((time.perf_counter() - start) * 1000, 1)})
+
+
+def start_background_warmup():
+    threading.Thread(target=warm_imports, name="import-warmup", daemon=True).start()
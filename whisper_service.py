@@ -1,10 +1,53 @@
+import csv
+import logging
 import os
+import shutil
+import subprocess
 import tempfile
-import librosa
-import soundfile as sf
-import numpy as np
-from scipy import signal
+import time
 from openai import OpenAI
+import audio_dsp
+from admission import admit
+import dsp_pool
+from captions import compact_segments, remap_timestamps
+from diarization import assign_speakers, diarize as diarize_speakers
+from fingerprint import AUDIO_FINGERPRINTS, compute_fingerprint, find_duplicate, index_fingerprint
+from metrics import stage
+from resampling import TARGET_RATE
+from shared_cache import SharedCache, file_digest
+from uploads import mapped_upload
+from vad import estimate_snr, remove_silence
+
+logger = logging.getLogger(__name__)
+
+# Transcripts of identical recordings are reused between requests and workers
+TRANSCRIPTION_CACHE_TTL = int(os.getenv("TRANSCRIPTION_CACHE_TTL", "86400"))
+_transcription_cache = SharedCache("transcription", max_entries=512, ttl=TRANSCRIPTION_CACHE_TTL)
+
+# Whisper rejects uploads over 25 MB, larger audio is sent in chunks of this many seconds
+WHISPER_MAX_BYTES = 24 * 1024 * 1024
+WHISPER_CHUNK_SECONDS = int(os.getenv("WHISPER_CHUNK_SECONDS", "1200"))
+
+# Audio longer than this many samples at 16 kHz (~10 minutes) is only high-pass filtered,
+# block by block, instead of being held in shared memory for spectral gating
+DENOISE_STREAMING_SAMPLES = 10000000
+# Noise removal is skipped when the estimated signal to noise ratio is at least this high
+DENOISE_MIN_SNR_DB = float(os.getenv("DENOISE_MIN_SNR_DB", "25"))
+
+def _shift_timestamps(entries, offset):
+    """Move segment, word or speaker turn times by ``offset`` seconds, keeping their other fields."""
+    if not entries or not offset:
+        return entries
+    return [{**entry, "start": max(0.0, round(entry["start"] + offset, 3)), "end": max(0.0, round(entry["end"] + offset, 3))}
+            for entry in entries]
+
+
+def _shift_cached(cached, offset):
+    """A cached transcription with its times moved onto a copy that is ``offset`` seconds later.
+
+    FingerprintMatch.offset is the copy's time minus the indexed recording's time.
+    """
+    return {**cached, **{key: _shift_timestamps(cached.get(key), offset) for key in ("segments", "words", "speaker_turns")}}
 
 class WhisperService:
     """Service for handling audio transcription using Whisper with optimizations."""
@@ -16,6 +59,18 @@ class WhisperService:
             client: OpenAI client instance (optional)
         """
         self.client = client or OpenAI()
+        # Set by transcribe_audio when voice activity detection compressed the audio
+        self.timestamp_map = None
+        self.vad_stats = None
+        # Set by transcribe_audio when noise removal was considered: SNR, decision and timings
+        self.noise_stats = None
+        # Set by transcribe_audio when timestamps are requested, in original recording time
+        self.segments = None
+        self.words = None
+        # Set by transcribe_audio when diarization is requested: {"start", "end", "speaker"} turns
+        self.speaker_turns = None
+        # Set by transcribe_audio when the transcription of a near-duplicate recording was reused
+        self.fingerprint_match = None
         
         # Configure librosa to be more memory efficient
         import os
@@ -26,203 +81,312 @@ class WhisperService:
         # Try importing audioread as backup
         try:
             import audioread
-            print("Audioread is available as a fallback for audio loading")
+            logger.debug("Audioread is available as a fallback for audio loading")
         except ImportError:
-            print("Warning: audioread not available, consider installing it")
+            logger.warning("audioread not available, consider installing it")
         
         # Check if ffmpeg is available
         try:
             import subprocess
             subprocess.run(["ffmpeg", "-version"], check=True, capture_output=True)
             self.ffmpeg_available = True
-            print("ffmpeg is available for audio processing")
+            logger.debug("ffmpeg is available for audio processing")
         except:
             self.ffmpeg_available = False
-            print("ffmpeg not available - advanced audio processing may be limited")
+            logger.warning("ffmpeg not available - advanced audio processing may be limited")
         
         # Define supported media formats
         self.supported_audio_formats = ['mp3', 'wav', 'ogg', 'm4a', 'flac', 'aac', 'wma', 'aiff', 'alac']
         self.supported_video_formats = ['mp4', 'avi', 'mov', 'mkv', 'webm', 'wmv', 'flv', 'mpeg']
         self.all_supported_formats = self.supported_audio_formats + self.supported_video_formats
     
-    def _remove_noise(self, audio_path):
+    def _remove_noise(self, audio_path, output_dir=None):
         """Remove noise from audio file.
         
+        Decoding, filtering, spectral gating and encoding run on the DSP process pool,
+        with the samples passed through shared memory.
+        
         Args:
             audio_path: Path to audio file
+            output_dir: Directory for the processed audio (optional)
             
         Returns:
-            Path to processed audio file
+            Path to processed audio file, 16 kHz mono unless processing failed
         """
+        # DSP libraries take seconds to import, only load them when audio is processed
+        import soundfile as sf
+
         # Create output path first
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = output_dir or tempfile.mkdtemp()
         processed_path = os.path.join(temp_dir, 'processed_audio.wav')
         
         try:
-            # Try using soundfile directly which is more memory efficient
-            try:
-                # First try to get info without loading the whole file
+            # Everything below runs on 16 kHz mono, the rate Whisper works at
+            info = sf.info(audio_path)
+            if (info.samplerate, info.channels) != (TARGET_RATE, 1):
+                audio_path = self._decode_audio(audio_path, temp_dir)
                 info = sf.info(audio_path)
-                sr = info.samplerate
-                
-                # For very large files, we'll use a chunked approach
-                if info.frames > 10000000:  # Roughly 3-4 minutes of audio at 44.1kHz
-                    # Process in chunks of ~10MB of audio
-                    chunk_size = 2500000  # Adjust based on available memory
-                    
-                    # Create an output file with the same sample rate
-                    with sf.SoundFile(processed_path, 'w', sr, channels=1, format='WAV') as outfile:
-                        # Process in chunks to avoid memory issues
-                        for block_idx in range(0, info.frames, chunk_size):
-                            # Read a chunk
-                            with sf.SoundFile(audio_path) as infile:
-                                infile.seek(block_idx)
-                                chunk_frames = min(chunk_size, info.frames - block_idx)
-                                y = infile.read(chunk_frames)
-                                
-                                # Convert to mono if stereo
-                                if len(y.shape) > 1 and y.shape[1] > 1:
-                                    y = np.mean(y, axis=1)
-                                
-                                # Apply simple filtering (less memory intensive)
-                                # High-pass filter
-                                b, a = signal.butter(5, 100/(sr/2), 'highpass')
-                                y_filtered = signal.lfilter(b, a, y)
-                                
-                                # Low-pass filter
-                                b, a = signal.butter(5, 8000/(sr/2), 'lowpass')
-                                y_filtered = signal.lfilter(b, a, y_filtered)
-                                
-                                # Write the processed chunk to output file
-                                outfile.write(y_filtered.astype(np.float32))
-                    
-                    return processed_path
-                
-            except Exception as e:
-                print(f"Warning: SoundFile processing failed: {e}. Falling back to librosa.")
-            
-            # If we get here, either the file wasn't large or soundfile failed
-            # Load with librosa but with memory optimization
-            y, sr = librosa.load(audio_path, sr=None, mono=True, res_type='kaiser_fast')
             
-            # Apply noise reduction techniques
+            # For very large files, only high-pass filter, block by block
+            if info.frames > DENOISE_STREAMING_SAMPLES:
+                return dsp_pool.run(audio_dsp.highpass_file, audio_path, processed_path)
             
             # 1. High-pass filter to remove low-frequency noise
-            b, a = signal.butter(5, 100/(sr/2), 'highpass')
-            y = signal.filtfilt(b, a, y)
-            
-            # 2. Low-pass filter to remove high-frequency noise
-            b, a = signal.butter(5, 8000/(sr/2), 'lowpass')
-            y = signal.filtfilt(b, a, y)
-            
-            # If the file is large, use simplified noise removal
-            if len(y) > 5000000:
-                # Save the processed audio directly without spectral gating
-                sf.write(processed_path, y, sr)
-                return processed_path
-            
+            # 2. High-frequency noise above 8 kHz was already removed by the resampling filter
             # 3. Spectral gating for more advanced noise reduction
-            noise_sample = y[:min(int(sr), len(y))]
-            noise_profile = np.mean(np.abs(librosa.stft(noise_sample)))
-            
-            # Apply spectral gating with memory efficiency
-            S = librosa.stft(y)
-            S_mag = np.abs(S)
-            S_phase = np.angle(S)
-            
-            # Create a mask to remove noise
-            mask = S_mag > 2 * noise_profile
-            
-            # Apply mask to magnitude spectrogram
-            S_mag = S_mag * mask
-            
-            # Reconstruct signal
-            S_denoised = S_mag * np.exp(1j * S_phase)
-            y_denoised = librosa.istft(S_denoised)
-            
-            # Free up memory
-            del S, S_mag, S_phase, S_denoised
-            
-            # Save the processed audio to a temporary file
-            sf.write(processed_path, y_denoised, sr)
-            
-            return processed_path
+            # Spans are processed in parallel with overlap, so the result matches filtering the whole signal up to edge effects
+            length = info.frames
+            with dsp_pool.SharedSamples(length) as source, dsp_pool.SharedSamples(length) as output:
+                noise_profile = dsp_pool.run(audio_dsp.load_shared, audio_path, source.name, length)
+                dsp_pool.run_all([
+                    (audio_dsp.denoise_span, source.name, output.name, length, start, end, noise_profile)
+                    for start, end in dsp_pool.spans(length, TARGET_RATE)
+                ])
+                return dsp_pool.run(audio_dsp.write_shared, output.name, length, processed_path)
             
         except Exception as e:
             # If any processing fails, convert the file to WAV using ffmpeg if available
             try:
-                import subprocess
-                print(f"Audio processing failed: {e}. Trying to convert with ffmpeg.")
-                subprocess.run(["ffmpeg", "-i", audio_path, "-ac", "1", "-ar", "16000", processed_path], 
+                logger.warning("Audio processing failed: %s. Trying to convert with ffmpeg.", e)
+                subprocess.run(["ffmpeg", "-i", audio_path, "-ac", "1", "-ar", "16000", "-y", processed_path], 
                              check=True, capture_output=True)
                 return processed_path
             except:
                 # If all else fails, just return the original file
-                print(f"All audio processing failed. Using original file.")
+                logger.warning("All audio processing failed. Using original file.")
                 return audio_path
 
-    def transcribe_audio(self, media_path, remove_noise=True, force_english=True):
+    def _decode_audio(self, audio_path, output_dir):
+        """Decode audio once to a 16 kHz mono WAV that later stages share.
+        
+        Args:
+            audio_path: Path to audio file
+            output_dir: Directory for the decoded audio
+            
+        Returns:
+            Path to the decoded WAV
+        """
+        decoded_path = os.path.join(output_dir, 'decoded_audio.wav')
+        try:
+            return dsp_pool.run(audio_dsp.decode_to_wav, audio_path, decoded_path)
+        except Exception as e:
+            if not self.ffmpeg_available:
+                raise
+            logger.warning("Decoding failed: %s. Decoding with ffmpeg.", e)
+        subprocess.run(
+            ["ffmpeg", "-i", audio_path, "-vn", "-ac", "1", "-ar", str(TARGET_RATE), "-y", decoded_path],
+            check=True, capture_output=True)
+        return decoded_path
+
+    def _adaptive_noise_removal(self, decoded_path, output_dir):
+        """Remove noise from decoded audio only when the signal is noisy.
+        
+        Args:
+            decoded_path: Path to the 16 kHz mono WAV from _decode_audio
+            output_dir: Directory for the denoised audio
+            
+        Returns:
+            (denoised path or None, stats with the decision and timings)
+        """
+        stats = {"applied": False, "threshold_db": DENOISE_MIN_SNR_DB}
+        start = time.perf_counter()
+        try:
+            with stage("snr_estimate"):
+                snr = estimate_snr(decoded_path)
+        except Exception as e:
+            logger.warning("SNR estimate failed: %s", e)
+            snr = None
+        stats["snr_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        stats["snr_db"] = None if snr is None else round(snr, 1)
+        if snr is not None and snr >= DENOISE_MIN_SNR_DB:
+            logger.info("Audio is clean enough, skipping noise removal", extra={"snr_db": stats["snr_db"]})
+            return None, stats
+
+        start = time.perf_counter()
+        with stage("noise_removal"):
+            denoised_path = self._remove_noise(decoded_path, output_dir)
+        stats["denoise_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if denoised_path == decoded_path:
+            return None, stats
+        stats["applied"] = True
+        return denoised_path, stats
+
+    def transcribe_audio(self, media_path, remove_noise=True, force_english=True, vad=True, timestamps=None,
+                         diarize=False, num_speakers=None, cost=None):
         """Transcribe audio using Whisper with optimizations.
         
         Args:
             media_path: Path to media file (audio or video)
-            remove_noise: Whether to apply noise removal (default: True)
+            remove_noise: Whether to apply noise removal when the audio is noisy (default: True)
             force_english: Whether to force English transcription (default: True)
+            vad: Whether to strip long silences before upload (default: True)
+            timestamps: None, "segment" or "word" to also collect timestamps in
+                self.segments (and self.words)
+            diarize: Whether to label segments with speakers, turns are kept in
+                self.speaker_turns (default: False)
+            num_speakers: Expected number of speakers, estimated when None
+            cost: Admission cost held while the audio is decoded and prepared, and
+                released before it is sent to Whisper
             
         Returns:
             Transcription text
         """
-        processed_path = media_path
-        created_temp_file = False
-        converted_media = False
-        temp_dir = None
+        self.noise_stats = None
+        self.speaker_turns = None
+        self.fingerprint_match = None
+        # Speakers are assigned per segment
+        if diarize and timestamps is None:
+            timestamps = "segment"
+        digest = file_digest(media_path)
+        options = f"{remove_noise}:{force_english}:{vad}:{timestamps}:{diarize}:{num_speakers}"
+        cache_key = f"{digest}:{options}"
+        cached = _transcription_cache.get(cache_key)
+        if cached is not None:
+            return self._restore(cached)
+
+        temp_dir = tempfile.mkdtemp()
+        diarization = None
         
         try:
-            # First, detect and convert media if needed
-            try:
-                temp_dir = tempfile.mkdtemp()
-                audio_path, converted_media = self._detect_and_convert_media(media_path, temp_dir)
-                if converted_media:
-                    processed_path = audio_path
-                    created_temp_file = True
-                else:
-                    processed_path = media_path
-            except ValueError as e:
-                print(f"Media format issue: {e}")
-                raise
+            # Only the CPU bound stages hold admission capacity, it is released before
+            # the Whisper requests, which can take minutes for long recordings
+            with admit(cost):
+                # First, detect and convert media if needed
+                try:
+                    processed_path, converted_media = self._detect_and_convert_media(media_path, temp_dir)
+                except ValueError as e:
+                    logger.warning("Media format issue: %s", e)
+                    raise
+                
+                # Check file size
+                file_size = os.path.getsize(processed_path) / (1024 * 1024)  # Size in MB
+                logger.info("Processing audio file of size: %.2f MB", file_size)
+                
+                # Decode once to 16 kHz mono; fingerprinting, the SNR estimate, noise removal and
+                # diarization all read the decoded WAV. It is kept so a failure with the
+                # denoised audio doesn't start over
+                decoded_path = None
+                decode_ms = None
+                if remove_noise and not converted_media:
+                    start = time.perf_counter()
+                    try:
+                        with stage("decode"):
+                            decoded_path = self._decode_audio(processed_path, temp_dir)
+                        decode_ms = round((time.perf_counter() - start) * 1000, 1)
+                    except Exception as e:
+                        logger.warning("Decoding failed: %s. Skipping noise removal.", e)
+                
+                # Re-encoded copies of a transcribed recording (another container, codec or
+                # bitrate) have different bytes but the same acoustic fingerprint
+                fingerprint = None
+                if AUDIO_FINGERPRINTS:
+                    try:
+                        with stage("fingerprint"):
+                            fingerprint = dsp_pool.run(compute_fingerprint, decoded_path or processed_path)
+                        match = find_duplicate(fingerprint, exclude=digest)
+                        cached = _transcription_cache.get(f"{match.digest}:{options}") if match else None
+                        if cached is not None:
+                            logger.info("Reusing the transcription of a near-duplicate recording", extra=match._asdict())
+                            # The copy may start earlier or later than the indexed recording
+                            cached = _shift_cached(cached, match.offset)
+                            _transcription_cache.set(cache_key, cached)
+                            self.fingerprint_match = match._asdict()
+                            return self._restore(cached)
+                    except Exception as e:
+                        logger.warning("Audio fingerprinting failed: %s", e)
+                
+                # Only denoise when the estimated SNR says it is worth it
+                source_path = processed_path
+                if decoded_path is not None:
+                    source_path = processed_path = decoded_path
+                    try:
+                        denoised_path, self.noise_stats = self._adaptive_noise_removal(decoded_path, temp_dir)
+                        self.noise_stats["decode_ms"] = decode_ms
+                        processed_path = denoised_path or decoded_path
+                    except MemoryError:
+                        logger.warning("Memory error during noise removal. Skipping noise removal.")
+                    except Exception as e:
+                        logger.warning("Error during noise removal: %s. Skipping noise removal.", e)
+                
+                # Diarization works on the recording's own timeline and runs on the DSP pool
+                # while Whisper transcribes
+                diarization = dsp_pool.submit(diarize_speakers, source_path, num_speakers) if diarize else None
+                
+                chunks = self._prepare_upload(processed_path, temp_dir, vad)
             
-            # Check file size
-            file_size = os.path.getsize(processed_path) / (1024 * 1024)  # Size in MB
-            print(f"Processing audio file of size: {file_size:.2f} MB")
+            try:
+                transcription = self._transcribe_chunks(chunks, force_english, timestamps)
+            except Exception as e:
+                if processed_path == source_path:
+                    raise
+                logger.warning("Transcription of the denoised audio failed: %s. Retrying with the decoded audio.", e)
+                self.noise_stats["fallback"] = True
+                with admit(cost):
+                    chunks = self._prepare_upload(source_path, temp_dir, vad)
+                transcription = self._transcribe_chunks(chunks, force_english, timestamps)
             
-            # Process audio if noise removal is requested and we haven't already converted the media
-            if remove_noise and not converted_media:
+            if diarization is not None:
                 try:
-                    noise_removed_path = self._remove_noise(processed_path)
-                    
-                    # If we already created a temporary file, clean it up
-                    if created_temp_file and processed_path != media_path:
-                        try:
-                            os.remove(processed_path)
-                        except:
-                            pass
-                    
-                    processed_path = noise_removed_path
-                    created_temp_file = True
-                except MemoryError:
-                    print("Memory error during noise removal. Skipping noise removal.")
+                    with stage("diarization"):
+                        self.speaker_turns = diarization.result()
+                    assign_speakers(self.segments, self.speaker_turns)
                 except Exception as e:
-                    print(f"Error during noise removal: {e}. Skipping noise removal.")
+                    logger.warning("Diarization failed: %s. Returning segments without speakers.", e)
             
-            # If the file is still too large for Whisper API (which has a 25MB limit)
-            if os.path.getsize(processed_path) > 24 * 1024 * 1024:
-                # Try to compress with ffmpeg if available
-                if hasattr(self, 'ffmpeg_available') and self.ffmpeg_available:
-                    try:
-                        import subprocess
-                        temp_dir = tempfile.mkdtemp()
-                        compressed_path = os.path.join(temp_dir, 'compressed_audio.mp3')
-                        
+            _transcription_cache.set(cache_key, {
+                "text": transcription, "segments": self.segments, "words": self.words,
+                "speaker_turns": self.speaker_turns})
+            if fingerprint is not None:
+                index_fingerprint(digest, fingerprint, TRANSCRIPTION_CACHE_TTL)
+            return transcription
+        
+        finally:
+            if diarization is not None:
+                diarization.cancel()
+            # Converted, decoded and denoised audio all live in the temp directory
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _restore(self, cached):
+        """Load a cached transcription into the service and return its text."""
+        self.segments = cached["segments"]
+        self.words = cached["words"]
+        self.speaker_turns = cached.get("speaker_turns")
+        return cached["text"]
+
+    def _prepare_upload(self, audio_path, temp_dir, vad):
+        """Strip silence and fit the audio to Whisper's upload limit.
+        
+        Args:
+            audio_path: Path to the converted (and possibly denoised) audio
+            temp_dir: Directory for intermediate files, removed by the caller
+            vad: Whether to strip long silences before upload
+            
+        Returns:
+            List of (chunk_path, offset) tuples, offsets in seconds of silence-stripped audio
+        """
+        work_dir = tempfile.mkdtemp(dir=temp_dir)
+        processed_path = audio_path
+        self.timestamp_map = None
+        self.vad_stats = None
+        
+        # Strip long silences so only speech is uploaded and billed
+        if vad:
+            try:
+                with stage("vad"):
+                    stripped = remove_silence(processed_path, work_dir)
+                if stripped is not None:
+                    processed_path, self.timestamp_map, self.vad_stats = stripped
+            except Exception as e:
+                logger.warning("Voice activity detection failed: %s. Sending the full audio.", e)
+        
+        # If the file is still too large for Whisper API (which has a 25MB limit)
+        if os.path.getsize(processed_path) > 24 * 1024 * 1024:
+            # Try to compress with ffmpeg if available
+            if hasattr(self, 'ffmpeg_available') and self.ffmpeg_available:
+                try:
+                    compressed_path = os.path.join(work_dir, 'compressed_audio.mp3')
+                    
+                    with stage("ffmpeg", "compress"):
                         subprocess.run([
                             "ffmpeg", "-i", processed_path,
                             "-ac", "1",                # Convert to mono
@@ -230,62 +394,114 @@ class WhisperService:
                             "-b:a", "64k",             # Lower bitrate
                             compressed_path
                         ], check=True, capture_output=True)
-                        
-                        # Clean up previous processed file if it was temporary
-                        if created_temp_file:
-                            try:
-                                os.remove(processed_path)
-                                os.rmdir(os.path.dirname(processed_path))
-                            except:
-                                pass
-                        
-                        processed_path = compressed_path
-                        created_temp_file = True
-                        print(f"Compressed audio file to: {os.path.getsize(processed_path)/1024/1024:.2f} MB")
-                        
-                    except Exception as e:
-                        print(f"Failed to compress audio: {e}")
-                else:
-                    print("Audio file is large and ffmpeg is not available for compression.")
+                    
+                    processed_path = compressed_path
+                    logger.info("Compressed audio file to: %.2f MB", os.path.getsize(processed_path)/1024/1024)
+                    
+                except Exception as e:
+                    logger.warning("Failed to compress audio: %s", e)
+            else:
+                logger.warning("Audio file is large and ffmpeg is not available for compression.")
+        
+        # Audio that is still over the limit is split, chunk timestamps are offset by the chunk start
+        chunks = [(processed_path, 0.0)]
+        if os.path.getsize(processed_path) > WHISPER_MAX_BYTES and self.ffmpeg_available:
+            chunk_dir = tempfile.mkdtemp(dir=work_dir)
+            with stage("ffmpeg", "split"):
+                chunks = self._split_audio(processed_path, chunk_dir)
+            logger.info("Transcribing audio in %d chunks", len(chunks))
+        return chunks
+
+    def _transcribe_chunks(self, chunks, force_english, timestamps):
+        """Transcribe prepared chunks with Whisper.
+        
+        Args:
+            chunks: List of (chunk_path, offset) tuples from _prepare_upload
+            force_english: Whether to force English transcription
+            timestamps: None, "segment" or "word"
             
-            # Open the audio file
-            with open(processed_path, "rb") as audio_file:
-                # Call the Whisper API with the appropriate parameters
-                response = self.client.audio.transcriptions.create(
+        Returns:
+            Transcription text, timestamps are left in self.segments and self.words
+        """
+        texts = []
+        segments = []
+        words = []
+        for chunk_path, offset in chunks:
+            text, chunk_segments, chunk_words = self._request_transcription(chunk_path, force_english, timestamps)
+            texts.append(text)
+            segments.extend(compact_segments(chunk_segments, offset))
+            words.extend(compact_segments(chunk_words, offset))
+        
+        # Segment times refer to the silence-stripped audio until mapped back
+        self.segments = remap_timestamps(segments, self.timestamp_map) if timestamps else None
+        self.words = remap_timestamps(words, self.timestamp_map) if timestamps == "word" else None
+        return texts[0] if len(texts) == 1 else "\n".join(text.strip() for text in texts)
+
+    def _request_transcription(self, audio_path, force_english, timestamps=None):
+        """Send one audio file to Whisper.
+        
+        Args:
+            audio_path: Path to audio under the upload limit
+            force_english: Whether to force English transcription
+            timestamps: None, "segment" or "word"
+            
+        Returns:
+            (text, segments, words), segments and words are None without timestamps
+        """
+        with open(audio_path, "rb") as audio_file, stage("whisper"):
+            if timestamps is None:
+                text = self.client.audio.transcriptions.create(
                     model="whisper-1",
                     file=audio_file,
                     language="en" if force_english else None,
                     response_format="text"
                 )
-            
-            return response
+                return text, None, None
+            response = self.client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                language="en" if force_english else None,
+                response_format="verbose_json",
+                timestamp_granularities=["segment", "word"] if timestamps == "word" else ["segment"]
+            )
+        return response.text, response.segments, getattr(response, "words", None)
+
+    def _split_audio(self, audio_path, output_dir):
+        """Split audio into compressed chunks of WHISPER_CHUNK_SECONDS.
         
-        finally:
-            # Clean up temporary files if they were created
-            if created_temp_file and processed_path != media_path:
-                try:
-                    os.remove(processed_path)
-                except Exception as e:
-                    print(f"Failed to clean up temporary file {processed_path}: {e}")
+        Args:
+            audio_path: Path to audio file
+            output_dir: Directory for the chunks
             
-            # Clean up the temp directory if we created one
-            if temp_dir and os.path.exists(temp_dir):
-                try:
-                    for file_name in os.listdir(temp_dir):
-                        file_path = os.path.join(temp_dir, file_name)
-                        if os.path.isfile(file_path):
-                            os.remove(file_path)
-                    os.rmdir(temp_dir)
-                except Exception as e:
-                    print(f"Failed to clean up temporary directory: {e}")
+        Returns:
+            List of (chunk path, start offset in seconds)
+        """
+        list_path = os.path.join(output_dir, 'chunks.csv')
+        subprocess.run([
+            "ffmpeg", "-i", audio_path,
+            "-vn", "-ac", "1", "-ar", "16000", "-b:a", "64k",
+            "-f", "segment",
+            "-segment_time", str(WHISPER_CHUNK_SECONDS),
+            "-segment_list", list_path,
+            "-segment_list_type", "csv",   # filename,start,end per chunk
+            "-reset_timestamps", "1",
+            os.path.join(output_dir, 'chunk_%03d.mp3')
+        ], check=True, capture_output=True)
+        with open(list_path, newline='') as chunk_list:
+            return [(os.path.join(output_dir, row[0]), float(row[1])) for row in csv.reader(chunk_list) if row]
 
-    def transcribe_audio_file(self, file, remove_noise=True, force_english=True):
+    def transcribe_audio_file(self, file, remove_noise=True, force_english=True, vad=True, timestamps=None,
+                              diarize=False, num_speakers=None):
         """Transcribe an uploaded file using Whisper with optimizations.
         
         Args:
             file: FastAPI UploadFile object
             remove_noise: Whether to apply noise removal (default: True)
             force_english: Whether to force English transcription (default: True)
+            vad: Whether to strip long silences before upload (default: True)
+            timestamps: None, "segment" or "word" to also collect timestamps
+            diarize: Whether to label segments with speakers (default: False)
+            num_speakers: Expected number of speakers, estimated when None
             
         Returns:
             Transcription text
@@ -298,75 +514,35 @@ class WhisperService:
             supported_formats = ", ".join(self.all_supported_formats)
             raise ValueError(f"Unsupported file format: {file_ext}. Supported formats: {supported_formats}")
         
-        # Save the uploaded file to a temporary file
-        temp_dir = tempfile.mkdtemp()
-        temp_path = os.path.join(temp_dir, file.filename)
-        
-        # Check file size before processing
-        file_content = file.file.read()
-        file_size_mb = len(file_content) / (1024 * 1024)
-        
-        # If the file is extremely large (over 30MB), we may need to downsample before processing
-        extremely_large = file_size_mb > 30
-        
-        with open(temp_path, "wb") as buffer:
-            buffer.write(file_content)
-        
-        # Reset the file pointer for future reads
-        file.file.seek(0)
-        
-        try:
-            # For extremely large files, try to preprocess with ffmpeg if available
-            if extremely_large:
+        # Save the uploaded file once and map it, decoders read the copy by its path
+        with mapped_upload(file) as upload, tempfile.TemporaryDirectory() as temp_dir:
+            temp_path = upload.file.name
+            file_size_mb = upload.file.size / (1024 * 1024)
+
+            # If the file is extremely large (over 30MB), we may need to downsample before processing
+            if file_size_mb > 30:
                 try:
-                    import subprocess
-                    print(f"File size: {file_size_mb:.2f} MB - Using ffmpeg preprocessing")
-                    
+                    logger.info("File size: %.2f MB - Using ffmpeg preprocessing", file_size_mb)
+
                     # Create a downsampled version with ffmpeg
                     optimized_path = os.path.join(temp_dir, 'optimized_audio.wav')
-                    subprocess.run([
-                        "ffmpeg", "-i", temp_path, 
-                        "-ac", "1",                # Convert to mono
-                        "-ar", "16000",            # 16kHz sample rate
-                        "-q:a", "3",               # Lower quality for smaller size
-                        optimized_path
-                    ], check=True, capture_output=True)
-                    
+                    with stage("ffmpeg", "preprocess"):
+                        subprocess.run([
+                            "ffmpeg", "-i", temp_path,
+                            "-ac", "1",                # Convert to mono
+                            "-ar", "16000",            # 16kHz sample rate
+                            "-q:a", "3",               # Lower quality for smaller size
+                            optimized_path
+                        ], check=True, capture_output=True)
+
                     # Use the optimized file instead
                     temp_path = optimized_path
                 except Exception as e:
-                    print(f"ffmpeg preprocessing failed: {e}")
-            
-            # Try to transcribe with noise removal first
-            try:
-                if remove_noise:
-                    result = self.transcribe_audio(temp_path, remove_noise=True, force_english=force_english)
-                else:
-                    result = self.transcribe_audio(temp_path, remove_noise=False, force_english=force_english)
-                
-            except Exception as e:
-                # If it fails with noise removal, try again without it
-                if remove_noise:
-                    print(f"Transcription with noise removal failed: {e}. Trying without noise removal.")
-                    result = self.transcribe_audio(temp_path, remove_noise=False, force_english=force_english)
-                else:
-                    # If we're already not using noise removal, re-raise the exception
-                    raise
-        
-        finally:
-            # Clean up the temporary file
-            try:
-                os.remove(temp_path)
-                # Remove any other files in the temp dir
-                for file_name in os.listdir(temp_dir):
-                    file_path = os.path.join(temp_dir, file_name)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-                os.rmdir(temp_dir)
-            except Exception as e:
-                print(f"Failed to clean up temporary files: {e}")
-        
-        return result
+                    logger.warning("ffmpeg preprocessing failed: %s", e)
+
+            # Falls back to the decoded audio by itself when the denoised audio fails
+            return self.transcribe_audio(temp_path, remove_noise=remove_noise, force_english=force_english, vad=vad, timestamps=timestamps,
+                                         diarize=diarize, num_speakers=num_speakers)
 
     def _detect_and_convert_media(self, input_path, output_dir=None):
         """Detect media format and convert to audio format compatible with Whisper if needed.
@@ -396,22 +572,23 @@ class WhisperService:
                 
                 # Run ffmpeg to extract audio or convert format
                 import subprocess
-                print(f"Converting media file format: {file_ext} to wav")
+                logger.info("Converting media file format: %s to wav", file_ext)
                 
-                subprocess.run([
-                    "ffmpeg", 
-                    "-i", input_path,
-                    "-vn",                 # No video
-                    "-ac", "1",            # Convert to mono
-                    "-ar", "16000",        # 16kHz sample rate
-                    "-y",                  # Overwrite output file if exists
-                    output_path
-                ], check=True, capture_output=True)
+                with stage("ffmpeg", "extract"):
+                    subprocess.run([
+                        "ffmpeg", 
+                        "-i", input_path,
+                        "-vn",                 # No video
+                        "-ac", "1",            # Convert to mono
+                        "-ar", "16000",        # 16kHz sample rate
+                        "-y",                  # Overwrite output file if exists
+                        output_path
+                    ], check=True, capture_output=True)
                 
                 return output_path, True   # Return path and flag indicating conversion
                 
             except Exception as e:
-                print(f"Failed to convert media file: {e}")
+                logger.warning("Failed to convert media file: %s", e)
                 if file_ext in self.supported_video_formats:
                     raise ValueError(f"Failed to extract audio from video file. Error: {e}")
                 else: